@@ -0,0 +1,1356 @@
+#!/usr/bin/env python
+
+# Benchmarks for the Trivial language implementation.
+#
+#   python benchmark.py               runs every benchmark
+#   python benchmark.py lexer ...     runs the named benchmarks
+
+import contextlib
+import copy
+import io
+import os
+import pickle
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from tokenizer import tokenize, tokenize_stream, tokenize_file, retokenize, tokenize_parallel, TokenBuffer
+from tokenizer import available_cores, chunk_offsets, lex_chunk, lex_chunks
+from parser import parse, token_view, run_steps, parse_statement_steps, parse_statements_lazily
+from evaluator import evaluate, evaluate_steps, evaluate_program, evaluate_statements
+from evaluator import type_of, is_truthy, copy_constant, ast_to_string, evaluate_builtin_function, evaluate_depth_limit
+from evaluator import __builtin_functions as builtin_functions
+from cache import parse_file, cache_path
+from incremental import IncrementalParser
+import closures
+import bytecode
+import transpiler
+import tiered
+from tokenizer import LineIndex
+import parser
+from nodes import NodeTable, intern, to_dict
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample_source():
+    source = ""
+    for name in ["basic-test.t", "feature-test.t"]:
+        with open(os.path.join(here, name), "r") as f:
+            source = source + f.read() + ";\n"
+    return source
+
+
+def large_source(size):
+    # repeat the test suites until the source is at least size characters
+    sample = sample_source()
+    return sample * (size // len(sample) + 1)
+
+
+def peak_memory(function, *args):
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def best_time(function, *args, repeat=3, **keywords):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **keywords)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def alternating_best_times(*functions, runs=1, rounds=5):
+    # the best time per run of each function, timing them in turn each round,
+    # since timings drift on a busy machine
+    best = [None] * len(functions)
+    for _ in range(rounds):
+        for i, function in enumerate(functions):
+            elapsed = best_time(lambda: [function() for _ in range(runs)], repeat=1) / runs
+            best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+    return best
+
+
+# BASELINE
+
+# The lexer as it was before the optimizations benchmarked here, for
+# comparison: it tries each pattern in turn, and packages tokens as dicts.
+
+baseline_patterns = [
+    [r"//[^\n]*", "comment"],  # Comment
+    [r"\s+", "whitespace"],  # Whitespace
+    [r"\d*\.\d+|\d+\.\d*|\d+", "number"],  # numeric literals
+    [r'"([^"]|"")*"', "string"],  # string literals
+    [r"true|false", "boolean"],  # boolean literals
+    [r"null", "null"],  # the null literal
+    [r"function", "function"],  # function keyword
+    [r"return", "return"],  # return keyword
+    [r"if", "if"],  # if keyword
+    [r"else", "else"],  # else keyword
+    [r"while", "while"],  # while keyword
+    [r"for", "for"],  # for keyword
+    [r"break", "break"],  # for keyword
+    [r"continue", "continue"],  # for keyword
+    [r"print", "print"],  # print keyword
+    [r"import", "import"],  # import keyword
+    [r"external", "external"],  # external keyword
+    [r"input", "input"],  # function keyword
+    [r"exit", "exit"],  # exit keyword
+    [r"and", "&&"],  # alternate for &&
+    [r"or", "||"],  # alternate for ||
+    [r"not", "!"],  # alternate for !
+    [r"assert","assert"],
+    [r"[a-zA-Z_][a-zA-Z0-9_]*", "identifier"],  # identifiers
+    [r"\+", "+"],
+    [r"\-", "-"],
+    [r"\*", "*"],
+    [r"\/", "/"],
+    [r"\^", "^"],       # carrot is exponent
+    [r"\%", "%"],
+    [r"\(", "("],
+    [r"\)", ")"],
+    [r"\{", "{"],
+    [r"\}", "}"],
+    [r"==", "=="],
+    [r"!=", "!="],
+    [r"<=", "<="],
+    [r">=", ">="],
+    [r"<", "<"],
+    [r">", ">"],
+    [r"\&\&", "&&"],
+    [r"\|\|", "||"],
+    [r"\!", "!"],
+    [r"\=", "="],
+    [r"\.", "."],
+    [r"\[", "["],
+    [r"\]", "]"],
+    [r"\,", ","],
+    [r"\:", ":"],
+    [r"\;", ";"],
+    [r".", "error"],  # unexpected content
+]
+
+for pattern in baseline_patterns:
+    pattern[0] = re.compile(pattern[0])
+
+
+def baseline_tokenize(characters):
+    tokens = []
+    position = 0
+    while position < len(characters):
+        # find the first token pattern that matches
+        for pattern, tag in baseline_patterns:
+            match = pattern.match(characters, position)
+            if match:
+                break
+
+        # this should never fail, since the last pattern matches everything.
+        assert match
+
+        # complain about errors and throw exception
+        if tag == "error":
+            raise Exception(f"Syntax error: illegal character : {[match.group(0)]}")
+
+        # package the token
+        token = {"tag": tag, "value": match.group(0), "position": position}
+        if token["tag"] == "string":
+            token["value"] = token["value"][1:-1].replace('""', '"')
+        if token["tag"] == "number":
+            if "." in token["value"]:
+                token["value"] = float(token["value"])
+            else:
+                token["value"] = int(token["value"])
+        if token["tag"] == "boolean":
+            token["value"] = True if token["value"] == "true" else False
+
+        # append token to stream, skipping whitespace and comments
+        if tag not in ["comment", "whitespace"]:
+            tokens.append(token)
+
+        # update position for next match
+        position = match.end()
+
+    tokens.append({"tag": None, "value": None, "position": position})
+    return tokens
+
+
+# evaluate() as it was before its handlers were split out by tag, for
+# comparison: it tests the tag against each tag in turn.
+def baseline_evaluate(ast, environment, depth=0):
+    if depth > evaluate_depth_limit:
+        return run_steps(evaluate_steps(ast, environment))
+    if ast.tag == "number":
+        assert type(ast.value) in [
+            float,
+            int,
+        ], f"unexpected type {type(ast.value)}"
+        return ast.value, None
+    if ast.tag == "boolean":
+        assert ast.value in [
+            True,
+            False,
+        ], f"unexpected type {type(ast.value)}"
+        return ast.value, None
+    if ast.tag == "string":
+        assert type(ast.value) == str, f"unexpected type {type(ast.value)}"
+        return ast.value, None
+    if ast.tag == "null":
+        return None, None
+    if ast.tag == "list":
+        items = []
+        for item in ast.items:
+            result, _ = baseline_evaluate(item, environment, depth + 1)
+            items.append(result)
+        return items, None        
+    if ast.tag == "object":
+        object = {}
+        for item in ast.items:
+            key, _ = baseline_evaluate(item["key"], environment, depth + 1)
+            assert type(key) is str, "Object key must be a string"
+            value, _ = baseline_evaluate(item["value"], environment, depth + 1)
+            object[key] = value
+        return object, None        
+    if ast.tag == "constant":
+        return copy_constant(ast), None
+
+    if ast.tag == "identifier":
+        identifier = ast.value
+        if identifier in environment:
+            return environment[identifier], None
+        if "$parent" in environment:
+            return baseline_evaluate(ast, environment["$parent"], depth + 1)
+        if identifier in builtin_functions:
+            return {"tag": "builtin", "name": identifier}, None
+        raise Exception(f"Unknown identifier: '{identifier}'")
+    if ast.tag == "+":
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value + right_value, None
+        if types == "string-string":
+            return left_value + right_value, None
+        if types == "object-object":
+            return {**left_value, **right_value}, None
+        if types == "array-array":
+            return left_value + right_value, None
+        raise Exception(f"Illegal types for {ast.tag}: {types}")
+    if ast.tag == "-":
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value - right_value, None
+        raise Exception(f"Illegal types for {ast.tag}:{types}")
+
+    if ast.tag == "^":
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value ** right_value, None
+        if types == "string-number":
+            return left_value ** int(right_value), None
+        if types == "number-string":
+            return right_value ** int(left_value), None
+        raise Exception(f"Illegal types for {ast.tag}:{types}")
+    
+    if ast.tag == "*":
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value * right_value, None
+        if types == "string-number":
+            return left_value * int(right_value), None
+        if types == "number-string":
+            return right_value * int(left_value), None
+        raise Exception(f"Illegal types for {ast.tag}:{types}")
+
+    if ast.tag == "/":
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            assert right_value != 0, "Division by zero"
+            return left_value / right_value, None
+        raise Exception(f"Illegal types for {ast.tag}:{types}")
+    
+    if ast.tag == "negate":
+        value, _ = baseline_evaluate(ast.value, environment, depth + 1)
+        types = type_of(value)
+        if types == "number":
+            return -value, None
+        raise Exception(f"Illegal type for {ast.tag}:{types}")
+
+    if ast.tag in ["&&", "and"]:
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        return is_truthy(left_value) and is_truthy(right_value), None
+
+    if ast.tag in ["||", "or"]:
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        return is_truthy(left_value) or is_truthy(right_value), None
+
+    if ast.tag in ["!", "not"]:
+        value, _ = baseline_evaluate(ast.value, environment, depth + 1)
+        return not is_truthy(value), None
+
+    if ast.tag in ["<", ">", "<=", ">="]:
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        types = type_of(left_value, right_value)
+        if types not in ["number-number", "string-string"]:
+            raise Exception(f"Illegal types for {ast.tag}: {types}")
+        if ast.tag == "<":
+            return left_value < right_value, None
+        if ast.tag == ">":
+            return left_value > right_value, None
+        if ast.tag == "<=":
+            return left_value <= right_value, None
+        if ast.tag == ">=":
+            return left_value >= right_value, None
+
+    if ast.tag == "==":
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        return left_value == right_value, None
+    
+    if ast.tag == "!=":
+        left_value, _ = baseline_evaluate(ast.left, environment, depth + 1)
+        right_value, _ = baseline_evaluate(ast.right, environment, depth + 1)
+        return left_value != right_value, None
+
+    if ast.tag == "print":
+        if ast.value:
+            value, _ = baseline_evaluate(ast.value, environment, depth + 1)
+            if type(value) is bool:
+                if value == True:
+                    value = "true"
+                if value == False:
+                    value = "false"
+            print(str(value))
+            return str(value) + "\n", None
+        else:
+            print()
+        return "\n", None
+
+    if ast.tag == "assert":
+        if ast.condition:
+            value, _ = baseline_evaluate(ast.condition, environment, depth + 1)
+            if not(value):
+                raise(Exception("Assertion failed:",ast_to_string(ast.condition)))
+        return "\n", None
+
+    if ast.tag == "if":
+        condition, _ = baseline_evaluate(ast.condition, environment, depth + 1)
+        if condition:
+            value, exit_status = baseline_evaluate(ast.then, environment, depth + 1)
+            if exit_status:
+                return value, exit_status
+        else:
+            if hasattr(ast, "else"):
+                value, exit_status = baseline_evaluate(getattr(ast, "else"), environment, depth + 1)
+                if exit_status:
+                    return value, exit_status
+        return None, False
+
+    if ast.tag == "while":
+        condition_value, exit_status = baseline_evaluate(ast.condition, environment, depth + 1)
+        if exit_status:
+            return condition_value, exit_status
+        while condition_value:
+            value, exit_status = baseline_evaluate(ast.do, environment, depth + 1)
+            if exit_status:
+                return value, exit_status
+            condition_value, exit_status = baseline_evaluate(ast.condition, environment, depth + 1)
+            if exit_status:
+                return condition_value, exit_status
+        return None, False
+
+    if ast.tag == "statement_list":
+        value, exit_status = None, None
+        for statement in ast.statements:
+            value, exit_status = baseline_evaluate(statement, environment, depth + 1)
+            if exit_status:
+                return value, exit_status
+        return value, exit_status
+
+    if ast.tag == "program":
+        value, exit_status = None, None
+        for statement in ast.statements:
+            value, exit_status = baseline_evaluate(statement, environment, depth + 1)
+            if exit_status:
+                return value, exit_status
+        return value, exit_status
+
+    if ast.tag == "function":
+        # function values are dicts, which the language treats as objects
+        return ast.as_dict(), False
+
+    if ast.tag == "call":
+        function, _ = baseline_evaluate(ast.function, environment, depth + 1)
+        argument_values = [baseline_evaluate(arg, environment, depth + 1)[0] for arg in ast.arguments]
+
+        if function.get("tag") == "builtin":
+            return evaluate_builtin_function(function["name"], argument_values)
+        
+        # regular function call:
+        local_environment = {
+            name["value"]: val
+            for name, val in zip(function["parameters"], argument_values)
+        }
+        local_environment["$parent"] = environment
+        value, exit_status = baseline_evaluate(function["body"], local_environment, depth + 1)
+        if exit_status:
+            return value, False
+        else:
+            return None, False
+
+
+    if ast.tag == "complex":
+        base, _ = baseline_evaluate(ast.base, environment, depth + 1)
+        index, _ = baseline_evaluate(ast.index, environment, depth + 1)
+        if index == None:
+            return base, False
+        if type(index) in [int, float]:
+            assert int(index) == index
+            assert type(base) == list
+            assert len(base) > index
+            return base[index], False
+        if type(index) == str:
+            assert type(base) == dict
+            return base[index], False
+        assert False, f"Unknown index type [{index}]"
+
+    if ast.tag == "assign":
+        target = ast.target
+        if target.tag == "identifier":
+            target_base = environment
+            target_index = target.value 
+        elif target.tag == "complex":
+            base, _ = baseline_evaluate(target.base, environment, depth + 1)
+            index_ast = target.index
+            
+            if index_ast.tag == "string":
+                # direct property (like x.bar)
+                index = index_ast.value
+            else:
+                # evaluated property (like x["bar"])
+                index, _ = baseline_evaluate(index_ast, environment, depth + 1)
+            
+            assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+        
+            if isinstance(base, list):
+                assert isinstance(index, int), "List index must be integer"
+                assert 0 <= index < len(base), "List index out of range"
+                target_base = base
+                target_index = index
+            elif isinstance(base, dict):
+                target_base = base
+                target_index = index
+            else:
+                assert False, f"Cannot assign to base of type {type(base)}"
+        value, _ = baseline_evaluate(ast.value, environment, depth + 1)
+        target_base[target_index] = value
+        return value, None
+
+    if ast.tag == "return":
+        if hasattr(ast, "value"):
+            value, exit_status = baseline_evaluate(ast.value, environment, depth + 1)
+            return value, "return"
+        return None, "return"
+
+    assert False, f"Unknown tag [{ast.tag}] in AST"
+
+
+# The same evaluator on the dict ASTs the parser built before slotted
+# nodes (nodes.to_dict converts to them), to compare the two.
+
+def baseline_dict_evaluate(ast, environment):
+    if ast["tag"] == "number":
+        assert type(ast["value"]) in [
+            float,
+            int,
+        ], f"unexpected type {type(ast['value'])}"
+        return ast["value"], None
+    if ast["tag"] == "boolean":
+        assert ast["value"] in [
+            True,
+            False,
+        ], f"unexpected type {type(ast['value'])}"
+        return ast["value"], None
+    if ast["tag"] == "string":
+        assert type(ast["value"]) == str, f"unexpected type {type(ast['value'])}"
+        return ast["value"], None
+    if ast["tag"] == "null":
+        return None, None
+    if ast["tag"] == "list":
+        items = []
+        for item in ast["items"]:
+            result, _ = baseline_dict_evaluate(item, environment)
+            items.append(result)
+        return items, None        
+    if ast["tag"] == "object":
+        object = {}
+        for item in ast["items"]:
+            key, _ = baseline_dict_evaluate(item["key"], environment)
+            assert type(key) is str, "Object key must be a string"
+            value, _ = baseline_dict_evaluate(item["value"], environment)
+            object[key] = value
+        return object, None        
+    if ast["tag"] == "constant":
+        return copy.deepcopy(ast["value"]), None
+
+    if ast["tag"] == "identifier":
+        identifier = ast["value"]
+        if identifier in environment:
+            return environment[identifier], None
+        if "$parent" in environment:
+            return baseline_dict_evaluate(ast, environment["$parent"])
+        if identifier in builtin_functions:
+            return {"tag": "builtin", "name": identifier}, None
+        raise Exception(f"Unknown identifier: '{identifier}'")
+    if ast["tag"] == "+":
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value + right_value, None
+        if types == "string-string":
+            return left_value + right_value, None
+        if types == "object-object":
+            return {**left_value, **right_value}, None
+        if types == "array-array":
+            return left_value + right_value, None
+        raise Exception(f"Illegal types for {ast['tag']}: {types}")
+    if ast["tag"] == "-":
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value - right_value, None
+        raise Exception(f"Illegal types for {ast['tag']}:{types}")
+
+    if ast["tag"] == "^":
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value ** right_value, None
+        if types == "string-number":
+            return left_value ** int(right_value), None
+        if types == "number-string":
+            return right_value ** int(left_value), None
+        raise Exception(f"Illegal types for {ast['tag']}:{types}")
+    
+    if ast["tag"] == "*":
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            return left_value * right_value, None
+        if types == "string-number":
+            return left_value * int(right_value), None
+        if types == "number-string":
+            return right_value * int(left_value), None
+        raise Exception(f"Illegal types for {ast['tag']}:{types}")
+
+    if ast["tag"] == "/":
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        types = type_of(left_value, right_value)
+        if types == "number-number":
+            assert right_value != 0, "Division by zero"
+            return left_value / right_value, None
+        raise Exception(f"Illegal types for {ast['tag']}:{types}")
+    
+    if ast["tag"] == "negate":
+        value, _ = baseline_dict_evaluate(ast["value"], environment)
+        types = type_of(value)
+        if types == "number":
+            return -value, None
+        raise Exception(f"Illegal type for {ast['tag']}:{types}")
+
+    if ast["tag"] in ["&&", "and"]:
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        return is_truthy(left_value) and is_truthy(right_value), None
+
+    if ast["tag"] in ["||", "or"]:
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        return is_truthy(left_value) or is_truthy(right_value), None
+
+    if ast["tag"] in ["!", "not"]:
+        value, _ = baseline_dict_evaluate(ast["value"], environment)
+        return not is_truthy(value), None
+
+    if ast["tag"] in ["<", ">", "<=", ">="]:
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        types = type_of(left_value, right_value)
+        if types not in ["number-number", "string-string"]:
+            raise Exception(f"Illegal types for {ast['tag']}: {types}")
+        if ast["tag"] == "<":
+            return left_value < right_value, None
+        if ast["tag"] == ">":
+            return left_value > right_value, None
+        if ast["tag"] == "<=":
+            return left_value <= right_value, None
+        if ast["tag"] == ">=":
+            return left_value >= right_value, None
+
+    if ast["tag"] == "==":
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        return left_value == right_value, None
+    
+    if ast["tag"] == "!=":
+        left_value, _ = baseline_dict_evaluate(ast["left"], environment)
+        right_value, _ = baseline_dict_evaluate(ast["right"], environment)
+        return left_value != right_value, None
+
+    if ast["tag"] == "print":
+        if ast["value"]:
+            value, _ = baseline_dict_evaluate(ast["value"], environment)
+            if type(value) is bool:
+                if value == True:
+                    value = "true"
+                if value == False:
+                    value = "false"
+            print(str(value))
+            return str(value) + "\n", None
+        else:
+            print()
+        return "\n", None
+
+    if ast["tag"] == "assert":
+        if ast["condition"]:
+            value, _ = baseline_dict_evaluate(ast["condition"], environment)
+            if not(value):
+                raise(Exception("Assertion failed:",ast_to_string(ast["condition"])))
+        return "\n", None
+
+    if ast["tag"] == "if":
+        condition, _ = baseline_dict_evaluate(ast["condition"], environment)
+        if condition:
+            value, exit_status = baseline_dict_evaluate(ast["then"], environment)
+            if exit_status:
+                return value, exit_status
+        else:
+            if "else" in ast:
+                value, exit_status = baseline_dict_evaluate(ast["else"], environment)
+                if exit_status:
+                    return value, exit_status
+        return None, False
+
+    if ast["tag"] == "while":
+        condition_value, exit_status = baseline_dict_evaluate(ast["condition"], environment)
+        if exit_status:
+            return condition_value, exit_status
+        while condition_value:
+            value, exit_status = baseline_dict_evaluate(ast["do"], environment)
+            if exit_status:
+                return value, exit_status
+            condition_value, exit_status = baseline_dict_evaluate(ast["condition"], environment)
+            if exit_status:
+                return condition_value, exit_status
+        return None, False
+
+    if ast["tag"] == "statement_list":
+        value, exit_status = None, None
+        for statement in ast["statements"]:
+            value, exit_status = baseline_dict_evaluate(statement, environment)
+            if exit_status:
+                return value, exit_status
+        return value, exit_status
+
+    if ast["tag"] == "program":
+        value, exit_status = None, None
+        for statement in ast["statements"]:
+            value, exit_status = baseline_dict_evaluate(statement, environment)
+            if exit_status:
+                return value, exit_status
+        return value, exit_status
+
+    if ast["tag"] == "function":
+        # function values are dicts, which the language treats as objects
+        return ast, False
+
+    if ast["tag"] == "call":
+        function, _ = baseline_dict_evaluate(ast["function"], environment)
+        argument_values = [baseline_dict_evaluate(arg, environment)[0] for arg in ast["arguments"]]
+
+        if function.get("tag") == "builtin":
+            return evaluate_builtin_function(function["name"], argument_values)
+        
+        # regular function call:
+        local_environment = {
+            name["value"]: val
+            for name, val in zip(function["parameters"], argument_values)
+        }
+        local_environment["$parent"] = environment
+        value, exit_status = baseline_dict_evaluate(function["body"], local_environment)
+        if exit_status:
+            return value, False
+        else:
+            return None, False
+
+
+    if ast["tag"] == "complex":
+        base, _ = baseline_dict_evaluate(ast["base"], environment)
+        index, _ = baseline_dict_evaluate(ast["index"], environment)
+        if index == None:
+            return base, False
+        if type(index) in [int, float]:
+            assert int(index) == index
+            assert type(base) == list
+            assert len(base) > index
+            return base[index], False
+        if type(index) == str:
+            assert type(base) == dict
+            return base[index], False
+        assert False, f"Unknown index type [{index}]"
+
+    if ast["tag"] == "assign":
+        target = ast["target"]
+        if target["tag"] == "identifier":
+            target_base = environment
+            target_index = target["value"] 
+        elif target["tag"] == "complex":
+            base, _ = baseline_dict_evaluate(target["base"], environment)
+            index_ast = target["index"]
+            
+            if index_ast["tag"] == "string":
+                # direct property (like x.bar)
+                index = index_ast["value"]
+            else:
+                # evaluated property (like x["bar"])
+                index, _ = baseline_dict_evaluate(index_ast, environment)
+            
+            assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+        
+            if isinstance(base, list):
+                assert isinstance(index, int), "List index must be integer"
+                assert 0 <= index < len(base), "List index out of range"
+                target_base = base
+                target_index = index
+            elif isinstance(base, dict):
+                target_base = base
+                target_index = index
+            else:
+                assert False, f"Cannot assign to base of type {type(base)}"
+        value, _ = baseline_dict_evaluate(ast["value"], environment)
+        target_base[target_index] = value
+        return value, None
+
+    if ast["tag"] == "return":
+        if "value" in ast:
+            value, exit_status = baseline_dict_evaluate(ast["value"], environment)
+            return value, "return"
+        return None, "return"
+
+    assert False, f"Unknown tag [{ast['tag']}] in AST"
+
+
+def benchmark_lexer():
+    print("lexer throughput (single-pass tokenize vs pattern-by-pattern loop)")
+    for size in [100_000, 1_000_000, 4_000_000]:
+        source = large_source(size)
+        megabytes = len(source) / 1_000_000
+        fast = best_time(tokenize, source)
+        slow = best_time(baseline_tokenize, source, repeat=1)
+        print(
+            f"  {megabytes:6.2f} MB: tokenize {megabytes / fast:6.2f} MB/s, "
+            f"baseline {megabytes / slow:6.2f} MB/s, speedup {slow / fast:4.1f}x"
+        )
+
+
+def benchmark_stream():
+    print("peak memory of lexing and parsing a file (whole source vs streamed vs mmap)")
+
+    def whole(path):
+        with open(path, "r") as f:
+            parse(token_view(tokenize(f.read())))
+
+    def streamed(path):
+        with open(path, "r") as f:
+            parse(token_view(tokenize_stream(f)))
+
+    def lex_whole(path):
+        with open(path, "r") as f:
+            tokenize(f.read())
+
+    def lex_streamed(path):
+        with open(path, "r") as f:
+            for token in tokenize_stream(f):
+                pass
+
+    def lex_mapped(path):
+        for token in tokenize_file(path):
+            pass
+
+    def mapped(path):
+        parse(token_view(tokenize_file(path)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [200_000, 1_000_000]:
+            path = os.path.join(directory, "large.t")
+            with open(path, "w") as f:
+                f.write(large_source(size))
+            megabytes = os.path.getsize(path) / 1_000_000
+            for name, function in [
+                ("lex, whole", lex_whole),
+                ("lex, streamed", lex_streamed),
+                ("lex, mapped", lex_mapped),
+                ("lex+parse, whole", whole),
+                ("lex+parse, streamed", streamed),
+                ("lex+parse, mapped", mapped),
+            ]:
+                peak = peak_memory(function, path) / 1_000_000
+                print(f"  {megabytes:5.2f} MB source, {name:20}: peak {peak:7.2f} MB")
+
+
+def benchmark_tokens():
+    print("token representation: memory per token and lexing/parsing speed")
+    source = large_source(2_000_000)
+    tokens = tokenize(source)
+    n = len(tokens)
+    for name, function in [("tokenize", tokenize), ("baseline_tokenize", baseline_tokenize)]:
+        tracemalloc.start()
+        kept = function(source)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"  {name:20}: {size / n:6.1f} bytes per token ({type(kept[0]).__name__})")
+        del kept
+    elapsed = best_time(tokenize, source)
+    print(f"  tokenize: {n / elapsed:10.0f} tokens/s")
+    elapsed = best_time(lambda: parse(token_view(tokens)))
+    print(f"  parse:    {n / elapsed:10.0f} tokens/s")
+
+
+def benchmark_parse():
+    print("parse time by program size (linear time is a constant time per token)")
+    for size in [25_000, 50_000, 100_000, 200_000, 400_000]:
+        tokens = tokenize(large_source(size))
+        elapsed = best_time(parse, tokens)
+        print(f"  {len(tokens):8} tokens: parse {elapsed * 1000:8.2f} ms, {elapsed / len(tokens) * 1e6:5.2f} us per token")
+    print(f"  {parse_calls(tokens) / len(tokens):.2f} parse_* calls per token")
+
+
+def parse_calls(tokens):
+    # counts the calls of the parser's parse_* functions while parsing tokens
+    calls = 0
+
+    def count(frame, event, argument):
+        nonlocal calls
+        if event == "call" and frame.f_code.co_name.startswith("parse"):
+            calls = calls + 1
+
+    sys.setprofile(count)
+    try:
+        parse(tokens)
+    finally:
+        sys.setprofile(None)
+    return calls
+
+
+# a program that spends its time in the evaluator rather than in print
+workload = """
+function fib(n) { if (n < 2) { return n }; return fib(n - 1) + fib(n - 2) };
+i = 0;
+total = 0;
+while (i < 20000) {
+    xs = [i, i + 1];
+    o = {"a": xs, "b": i * 2};
+    total = total + o.a[1] - o.b / 2;
+    i = i + 1
+};
+fib(16)
+"""
+
+
+def run_quietly(ast, evaluate=evaluate):
+    with contextlib.redirect_stdout(io.StringIO()):
+        evaluate(ast, {})
+
+
+def benchmark_ast():
+    print("AST memory and evaluation speed: slotted nodes vs dicts (the baseline)")
+    source = large_source(1_000_000)
+    tokens = tokenize(source)
+    tracemalloc.start()
+    ast = parse(tokens)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    dict_ast = to_dict(ast)
+    dict_size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    print(
+        f"  {len(source) / 1_000_000:5.2f} MB sample source: nodes {size / 1_000_000:7.2f} MB "
+        f"({size / len(tokens):6.1f} bytes per token), dicts {dict_size / 1_000_000:7.2f} MB "
+        f"({dict_size / len(tokens):6.1f} bytes per token), {dict_size / size:4.2f}x"
+    )
+    del ast, dict_ast
+    for name, source in [("test suites", sample_source()), ("workload", workload)]:
+        ast = parse(tokenize(source))
+        dict_ast = to_dict(ast)
+        nodes, dicts = alternating_best_times(lambda: run_quietly(ast), lambda: run_quietly(dict_ast, baseline_dict_evaluate))
+        print(f"  evaluate {name:12}: nodes {nodes * 1000:8.2f} ms, dicts {dicts * 1000:8.2f} ms, speedup {dicts / nodes:4.2f}x")
+
+
+def benchmark_cache():
+    print("parsing a script with and without the AST cache")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "script.t")
+        for size in [10_000, 100_000, 1_000_000]:
+            with open(path, "w") as f:
+                f.write(large_source(size))
+            uncached = best_time(lambda: parse_file(path, LineIndex(), [], use_cache=False))
+            parse_file(path, LineIndex(), [])
+            cached = best_time(lambda: parse_file(path, LineIndex(), []))
+            print(
+                f"  {os.path.getsize(path) / 1_000_000:5.2f} MB script: parse {uncached * 1000:8.2f} ms, "
+                f"cached {cached * 1000:8.2f} ms ({os.path.getsize(cache_path(path)) / 1_000_000:5.2f} MB cache file)"
+            )
+
+
+def benchmark_retokenize():
+    print("cost per edit of retokenize and TokenBuffer.edit vs tokenize, by file size")
+    for size in [100_000, 1_000_000, 4_000_000]:
+        source = large_source(size)
+        tokens = tokenize(source)
+        full = best_time(tokenize, source, repeat=1)
+        # type a digit in the middle of the file, then delete it again
+        offset = source.index("\n", len(source) // 2)
+        edits = 100
+        start = time.perf_counter()
+        for _ in range(edits):
+            source, *_ = retokenize(source, tokens, offset, 0, "1")
+            source, *_ = retokenize(source, tokens, offset, 1, "")
+        per_edit = (time.perf_counter() - start) / (2 * edits)
+        # the same edits in blocks, which don't move the tokens after them
+        buffer = TokenBuffer(source)
+        start = time.perf_counter()
+        for _ in range(edits):
+            buffer.edit(offset, 0, "1")
+            buffer.edit(offset, 1, "")
+        buffered = (time.perf_counter() - start) / (2 * edits)
+        print(
+            f"  {len(source) / 1_000_000:5.2f} MB, {len(tokens):8} tokens: tokenize {full * 1000:8.2f} ms, "
+            f"retokenize {per_edit * 1000:6.3f} ms per edit, TokenBuffer {buffered * 1000:6.3f} ms per edit"
+        )
+
+
+def benchmark_incremental():
+    print("cost per edit of IncrementalParser.edit vs a full parse, by program size")
+    for lines in [500, 5000]:
+        # a module of small functions, one of which is edited
+        source = "".join(f"function f{i}(a, b) {{\n    x = a * {i} + b;\n    return x\n}};\n" for i in range(lines // 4))
+        incremental = IncrementalParser(source)
+        full = best_time(lambda: parse(tokenize(incremental.source)), repeat=1)
+        offset = source.index("b;", len(source) // 2)
+        edits = 100
+        start = time.perf_counter()
+        for _ in range(edits):
+            incremental.edit(offset, 0, "1 + ")
+            incremental.edit(offset, 4, "")
+        per_edit = (time.perf_counter() - start) / (2 * edits)
+        print(
+            f"  {lines:5} lines, {len(incremental.tokens):6} tokens: full parse {full * 1000:8.2f} ms, "
+            f"edit {per_edit * 1000:6.3f} ms"
+        )
+
+
+def parse_with_steps(tokens):
+    # the whole program with the explicit-stack parser
+    tokens = token_view(tokens)
+    statements = []
+    while tokens[0].tag is not None:
+        if tokens[0].tag == ";":
+            tokens = tokens[1:]
+            continue
+        statement, tokens = run_steps(parse_statement_steps(tokens))
+        statements.append(statement)
+    return statements
+
+
+def benchmark_deep():
+    print("recursive vs explicit-stack parsing and evaluation")
+    tokens = tokenize(large_source(200_000))
+    recursive = best_time(parse, tokens)
+    explicit = best_time(parse_with_steps, tokens)
+    print(f"  parse sample source: parse() {recursive * 1000:8.2f} ms, explicit stack {explicit * 1000:8.2f} ms")
+    ast = parse(tokenize(workload))
+    recursive = best_time(run_quietly, ast)
+    explicit = best_time(lambda: run_quietly(ast, lambda ast, environment: run_steps(evaluate_steps(ast, environment))))
+    print(f"  evaluate workload:   evaluate() {recursive * 1000:8.2f} ms, explicit stack {explicit * 1000:8.2f} ms")
+    print("  (1 + (1 + ...)) nested, by parse() and evaluate(), which fall back to the explicit stack:")
+    for depth in [100, 1000, 10_000, 100_000]:
+        tokens = tokenize("x = " + "(1 + " * depth + "1" + ")" * depth)
+        parse_time = best_time(parse, tokens, repeat=1)
+        ast = parse(tokens)
+        evaluate_time = best_time(evaluate, ast, {}, repeat=1)
+        print(f"    depth {depth:7}: parse {parse_time * 1000:8.2f} ms, evaluate {evaluate_time * 1000:8.2f} ms")
+
+
+def benchmark_tail_calls():
+    print("tail calls run in a loop in one frame vs recursion (baseline_evaluate)")
+    source = "function loop(n, acc) { if (n == 0) { return acc }; return loop(n - 1, acc + n) }; x = loop(%d, 0)"
+    for count in [1000, 10_000, 1_000_000]:
+        ast = parse(tokenize(source % count))
+        loop = best_time(evaluate, ast, {}, repeat=1)
+        line = f"  loop({count:9,}): evaluate {loop * 1000:9.1f} ms"
+        # the recursion looks up loop through a chain of frames as long as
+        # the recursion is deep, so it takes quadratic time
+        if count <= 10_000:
+            recursive = best_time(baseline_evaluate, ast, {}, repeat=1)
+            line += f", recursion {recursive * 1000:9.1f} ms, speedup {recursive / loop:6.1f}x"
+        print(line)
+
+
+class FirstOutput(io.TextIOBase):
+    # discards output, recording when the first of it is written
+    def __init__(self):
+        self.time = None
+
+    def write(self, text):
+        if self.time is None:
+            self.time = time.perf_counter()
+        return len(text)
+
+
+def benchmark_dispatch():
+    print("evaluate() with a dict of handlers vs the original chain of tag tests (baseline_evaluate)")
+    loop = "i = 0; x = 0; while (i < 100000) { if (i < 50000) { x = x + 1 } else { x = x - 1 }; i = i + 1 }"
+    for name, source, runs in [("test suites", sample_source(), 100), ("workload", workload, 1), ("counting loop", loop, 1)]:
+        ast = parse(tokenize(source))
+        handlers, chain = alternating_best_times(lambda: run_quietly(ast), lambda: run_quietly(ast, baseline_evaluate), runs=runs)
+        print(f"  {name:13}: handlers {handlers * 1000:8.3f} ms, chain {chain * 1000:8.3f} ms, speedup {chain / handlers:4.2f}x")
+
+
+def newton_source():
+    with open(os.path.join(here, "..", "tmp.tc")) as f:
+        return f.read()
+
+
+def benchmark_closures():
+    print("closure-compiled engine (closures.compile) vs evaluate()")
+    loop = "i = 0; x = 0; while (i < 100000) { if (i < 50000) { x = x + 1 } else { x = x - 1 }; i = i + 1 }"
+    programs = [
+        ("test suites", sample_source(), 100),
+        ("tmp.tc (Newton)", newton_source(), 2000),
+        ("workload", workload, 1),
+        ("counting loop", loop, 1),
+    ]
+    for name, source, runs in programs:
+        ast = parse(tokenize(source))
+        compile_time = best_time(closures.compile, ast)
+        run = closures.compile(ast)
+
+        def compiled(ast, environment):
+            return run(environment)
+
+        interpreted, closure = alternating_best_times(lambda: run_quietly(ast), lambda: run_quietly(ast, compiled), runs=runs)
+        print(
+            f"  {name:16}: evaluate {interpreted * 1000:8.3f} ms, closures {closure * 1000:8.3f} ms "
+            f"(+ {compile_time * 1000:6.3f} ms to compile), speedup {interpreted / closure:4.2f}x"
+        )
+
+
+def benchmark_bytecode():
+    print("bytecode VM (bytecode.run) vs evaluate() and the closure-compiled engine")
+    loop = "i = 0; x = 0; while (i < 100000) { if (i < 50000) { x = x + 1 } else { x = x - 1 }; i = i + 1 }"
+    recursion = "function f(n) { if (n < 2) { return n }; return f(n - 1) + f(n - 2) }; x = f(20)"
+    programs = [
+        ("test suites", sample_source(), 100),
+        ("tmp.tc (Newton)", newton_source(), 2000),
+        ("workload", workload, 1),
+        ("counting loop", loop, 1),
+        ("fib(20)", recursion, 1),
+    ]
+    for name, source, runs in programs:
+        ast = parse(tokenize(source))
+        compile_time = best_time(bytecode.compile, ast)
+        code = bytecode.compile(ast)
+        run = closures.compile(ast)
+
+        def compiled(ast, environment):
+            return run(environment)
+
+        def vm(ast, environment):
+            return bytecode.run(code, environment)
+
+        interpreted, closure, machine = alternating_best_times(
+            lambda: run_quietly(ast), lambda: run_quietly(ast, compiled), lambda: run_quietly(ast, vm), runs=runs
+        )
+        print(
+            f"  {name:16}: evaluate {interpreted * 1000:8.3f} ms, closures {closure * 1000:8.3f} ms, "
+            f"bytecode {machine * 1000:8.3f} ms (+ {compile_time * 1000:6.3f} ms to compile), "
+            f"speedup {interpreted / machine:4.2f}x"
+        )
+
+
+def benchmark_transpiler():
+    print("Python transpiler (transpiler.evaluate) vs evaluate(), closures and the bytecode VM")
+    loop = "i = 0; x = 0; while (i < 100000) { if (i < 50000) { x = x + 1 } else { x = x - 1 }; i = i + 1 }"
+    recursion = "function f(n) { if (n < 2) { return n }; return f(n - 1) + f(n - 2) }; x = f(20)"
+    programs = [
+        ("test suites", sample_source(), 100),
+        ("tmp.tc (Newton)", newton_source(), 2000),
+        ("workload", workload, 1),
+        ("counting loop", loop, 1),
+        ("fib(20)", recursion, 1),
+    ]
+    for name, source, runs in programs:
+        ast = parse(tokenize(source))
+        translate_time = best_time(lambda: compile(transpiler.transpile(ast), "<transpiled>", "exec"))
+        run = closures.compile(ast)
+        code = bytecode.compile(ast)
+
+        def compiled(ast, environment):
+            return run(environment)
+
+        def vm(ast, environment):
+            return bytecode.run(code, environment)
+
+        # translated on the first run, and cached by the AST after
+        run_quietly(ast, transpiler.evaluate)
+        interpreted, closure, machine, python = alternating_best_times(
+            lambda: run_quietly(ast),
+            lambda: run_quietly(ast, compiled),
+            lambda: run_quietly(ast, vm),
+            lambda: run_quietly(ast, transpiler.evaluate),
+            runs=runs,
+        )
+        print(
+            f"  {name:16}: evaluate {interpreted * 1000:8.3f} ms, closures {closure * 1000:8.3f} ms, "
+            f"bytecode {machine * 1000:8.3f} ms, python {python * 1000:8.3f} ms "
+            f"(+ {translate_time * 1000:6.3f} ms to translate and compile), "
+            f"speedup {interpreted / python:5.2f}x"
+        )
+
+    def native():
+        i = 0
+        x = 0
+        while i < 100000:
+            if i < 50000:
+                x = x + 1
+            else:
+                x = x - 1
+            i = i + 1
+
+    print(f"  counting loop written in Python: {best_time(native, repeat=5) * 1000:8.3f} ms")
+
+    # running a script file, from source and from the cached translation
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "workload.t")
+        with open(path, "w") as f:
+            f.write(sample_source())
+        uncached = best_time(lambda: run_quietly(path, lambda path, environment: transpiler.run_file(path, environment, use_cache=False)))
+
+        def cached(path, environment):
+            transpiler.loaded_scripts.clear()
+            return transpiler.run_file(path, environment)
+
+        run_quietly(path, cached)
+        cached_time = best_time(lambda: run_quietly(path, cached))
+        print(f"  run_file on the test suites: {uncached * 1000:8.3f} ms from source, {cached_time * 1000:8.3f} ms cached")
+
+
+def benchmark_tiered():
+    print("tiered execution (bytecode VM, hot code translated to Python) vs the single engines")
+    loop = "i = 0; x = 0; while (i < 100000) { if (i < 50000) { x = x + 1 } else { x = x - 1 }; i = i + 1 }"
+    recursion = "function f(n) { if (n < 2) { return n }; return f(n - 1) + f(n - 2) }; x = f(20)"
+    calls = "function f(x) { return x * x + 1 }; i = 0; s = 0; while (i < 50000) { s = s + f(i); i = i + 1 }"
+    programs = [
+        ("test suites", sample_source(), 100),
+        ("workload", workload, 1),
+        ("counting loop", loop, 1),
+        ("fib(20)", recursion, 1),
+        ("hot function", calls, 1),
+    ]
+    engines = {"evaluate": evaluate, "bytecode": bytecode.evaluate, "python": transpiler.evaluate, "tiered": tiered.evaluate}
+    for name, source, runs in programs:
+        ast = parse(tokenize(source))
+        times = dict.fromkeys(engines)
+        # a fresh profile for each run, so code starts cold; and since the
+        # engines keep their translations on the nodes, a new parse of the source
+        for _ in range(5):
+            for engine, function in engines.items():
+                asts = [parse(tokenize(source)) for _ in range(runs)]
+                tiered.profile = tiered.Profile()
+                elapsed = best_time(lambda: [run_quietly(ast, function) for ast in asts], repeat=1) / runs
+                times[engine] = elapsed if times[engine] is None else min(times[engine], elapsed)
+        print(f"  {name:14}: " + ", ".join(f"{engine} {times[engine] * 1000:8.3f} ms" for engine in engines))
+    tiered.profile = tiered.Profile()
+    run_quietly(parse(tokenize(calls + "; " + recursion)), tiered.evaluate)
+    print("\n".join("  " + line for line in tiered.profile.report().splitlines()))
+    tiered.profile = tiered.Profile()
+
+
+def benchmark_pipeline():
+    print("running a generated script whole vs one statement at a time (runner.py --stream)")
+
+    def whole(path):
+        lines = LineIndex()
+        positions = []
+        ast = parse_file(path, lines, positions, use_cache=False)
+        evaluate_program(ast, {}, positions, lines)
+
+    def streamed(path):
+        lines = LineIndex()
+        with open(path, "r") as f:
+            tokens = token_view(tokenize_stream(f, lines=lines), lines)
+            evaluate_statements(parse_statements_lazily(tokens), {}, lines)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "generated.t")
+        for statements in [10_000, 100_000]:
+            with open(path, "w") as f:
+                f.write("function f(x) { return x * 2 };\n")
+                for i in range(statements // 2):
+                    f.write(f'print "record {i}";\nr = {{"id": {i}, "value": f({i}), "tags": ["a", "b"]}};\n')
+            for name, function in [("whole", whole), ("streamed", streamed)]:
+                output = FirstOutput()
+                with contextlib.redirect_stdout(output):
+                    start = time.perf_counter()
+                    function(path)
+                    elapsed = time.perf_counter() - start
+                    peak = peak_memory(function, path) / 1_000_000
+                print(
+                    f"  {statements:7} statements, {name:8}: first output {(output.time - start) * 1000:8.2f} ms, "
+                    f"total {elapsed * 1000:8.2f} ms, peak {peak:7.2f} MB"
+                )
+
+
+def generated_config(records):
+    # a generated configuration script, which repeats the same subtrees
+    source = 'defaults = {"owner": {"name": "ops", "email": "ops@example.com"}};\n'
+    for i in range(records):
+        source += (
+            f'service_{i} = {{"name": "service", "port": {8000 + i % 8}, "limits": {{"cpu": 2, "memory": 512}}, '
+            f'"tags": ["web", "prod", "eu"], "owner": defaults.owner.name, "enabled": true}};\n'
+        )
+    return source
+
+
+def benchmark_intern():
+    print("AST memory of a generated config, without and with shared subtrees (nodes.intern)")
+    for records in [1000, 10_000]:
+        source = generated_config(records)
+        tokens = tokenize(source)
+        tracemalloc.start()
+        ast = parse(tokens)
+        size = tracemalloc.get_traced_memory()[0]
+        ast = intern(ast)
+        shared_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del ast
+        parse_time = best_time(parse, tokens)
+        intern_time = best_time(lambda: intern(parse(tokens))) - parse_time
+        print(
+            f"  {records:6} records: AST {size / 1_000_000:7.2f} MB, shared {shared_size / 1_000_000:7.2f} MB; "
+            f"parse {parse_time * 1000:7.2f} ms, intern {intern_time * 1000:7.2f} ms"
+        )
+    ast = parse(tokenize(generated_config(10_000)))
+    table = NodeTable()
+    table.intern(ast)
+    elapsed = best_time(lambda: [table.structural_hash(statement) for statement in ast.statements])
+    print(f"  structural_hash of {len(ast.statements)} interned statements: {elapsed * 1000:7.2f} ms")
+    for name, ast in [("unshared", parse(tokens)), ("shared", intern(parse(tokens)))]:
+        elapsed = best_time(run_quietly, ast)
+        print(f"  evaluate {records} records, {name:8}: {elapsed * 1000:8.2f} ms")
+
+
+def benchmark_bulk():
+    print("embedded data: bulk literals scanned into constants vs parsed and evaluated node by node")
+    numbers = "data = [" + ", ".join(str(i * 7 % 1000) for i in range(1_000_000)) + "]"
+    records = "data = [" + ", ".join(f'{{"id": {i}, "name": "r{i}", "tags": ["a", "b"], "ok": true}}' for i in range(100_000)) + "]"
+    size = parser.bulk_literal_size
+    for name, source in [("1M numbers", numbers), ("100k records", records)]:
+        tokens = tokenize(source)
+        for mode, bulk_literal_size in [("nodes", len(tokens) + 1), ("constant", size)]:
+            parser.bulk_literal_size = bulk_literal_size
+            try:
+                parse_time = best_time(parse, tokens, repeat=1)
+                tracemalloc.start()
+                ast = parse(tokens)
+                memory = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+            finally:
+                parser.bulk_literal_size = size
+            evaluate_time = best_time(evaluate, ast, {})
+            print(
+                f"  {name:12}, {mode:8}: parse {parse_time * 1000:8.2f} ms, AST {memory / 1_000_000:7.2f} MB, "
+                f"evaluate {evaluate_time * 1000:8.2f} ms"
+            )
+            del ast
+
+
+def benchmark_parallel():
+    cores = available_cores()
+    print(f"parallel chunked lexing vs tokenize ({cores} cores available)")
+    source = large_source(20_000_000)
+    megabytes = len(source) / 1_000_000
+    sequential = best_time(tokenize, source, repeat=1)
+    print(f"  {megabytes:6.2f} MB: tokenize {megabytes / sequential:6.2f} MB/s")
+    for processes in [2, 4, 8]:
+        if processes > cores:
+            print(f"  {megabytes:6.2f} MB: {processes} processes, more than the cores, so it lexes sequentially")
+            continue
+        elapsed = best_time(tokenize_parallel, source, repeat=1, processes=processes)
+        print(
+            f"  {megabytes:6.2f} MB: {processes} processes {megabytes / elapsed:6.2f} MB/s, "
+            f"speedup {sequential / elapsed:4.1f}x"
+        )
+    # this process unpickles and stitches together what the workers send
+    # back, which bounds the speedup however many cores there are
+    offsets = chunk_offsets(source, len(source) // 32)
+    chunks = [source[start:stop] for start, stop in zip(offsets, offsets[1:] + [len(source)])]
+    results = [pickle.dumps(lex_chunk(chunk, offset)) for chunk, offset in zip(chunks, offsets)]
+    stitch = best_time(lex_chunks, source, offsets, lambda function, chunks, offsets: map(pickle.loads, results), repeat=1)
+    print(
+        f"  {megabytes:6.2f} MB: stitching the chunks takes {stitch / sequential:4.0%} of tokenize's time, "
+        f"so the speedup is at most {sequential / stitch:4.1f}x"
+    )
+
+
+benchmarks = {
+    "lexer": benchmark_lexer,
+    "stream": benchmark_stream,
+    "tokens": benchmark_tokens,
+    "parse": benchmark_parse,
+    "ast": benchmark_ast,
+    "cache": benchmark_cache,
+    "retokenize": benchmark_retokenize,
+    "incremental": benchmark_incremental,
+    "deep": benchmark_deep,
+    "dispatch": benchmark_dispatch,
+    "tail": benchmark_tail_calls,
+    "closures": benchmark_closures,
+    "bytecode": benchmark_bytecode,
+    "transpiler": benchmark_transpiler,
+    "tiered": benchmark_tiered,
+    "pipeline": benchmark_pipeline,
+    "intern": benchmark_intern,
+    "bulk": benchmark_bulk,
+    "parallel": benchmark_parallel,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        benchmarks[name]()
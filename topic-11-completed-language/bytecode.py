@@ -0,0 +1,685 @@
+from tokenizer import tokenize
+from parser import parse, run_steps
+from nodes import compiled
+from evaluator import (
+    __builtin_functions as builtin_functions,
+    ast_to_string,
+    binary_operations,
+    copy_constant,
+    evaluate as tree_evaluate,
+    evaluate_builtin_function,
+    evaluate_steps,
+    index_operation,
+    is_truthy,
+    type_of,
+)
+import contextlib
+import io
+
+# BYTECODE
+
+# compile() turns an AST into a Code object: a flat list of (opcode, argument)
+# pairs, with the constants and names they refer to in pools. run() executes
+# it with a loop over the instructions and a stack of values. if and while
+# become jumps, and a call pushes a frame onto a list instead of calling
+# run() recursively, so Trivial recursion doesn't use Python's stack. The
+# instructions do what evaluator.evaluate() does, with the same errors, and
+# give the same (value, exit_status).
+
+(
+    LOAD_NAME,
+    LOAD_CONST,
+    STORE_NAME,
+    POP,
+    JUMP_IF_FALSE,
+    JUMP,
+    ADD,
+    SUBTRACT,
+    MULTIPLY,
+    DIVIDE,
+    POWER,
+    LESS,
+    GREATER,
+    LESS_EQUAL,
+    GREATER_EQUAL,
+    EQUAL,
+    NOT_EQUAL,
+    AND,
+    OR,
+    NOT,
+    NEGATE,
+    CALL,
+    RETURN,
+    INDEX,
+    CHECK_INDEX,
+    STORE_INDEX,
+    BUILD_LIST,
+    CHECK_KEY,
+    BUILD_OBJECT,
+    COPY_CONSTANT,
+    MAKE_FUNCTION,
+    PRINT,
+    ASSERT,
+    SET_RESULT,
+    EVALUATE_EXPRESSION,
+    EVALUATE_STATEMENT,
+    FAIL,
+    END,
+) = range(38)
+
+opnames = """
+    LOAD_NAME LOAD_CONST STORE_NAME POP JUMP_IF_FALSE JUMP ADD SUBTRACT MULTIPLY DIVIDE POWER LESS GREATER
+    LESS_EQUAL GREATER_EQUAL EQUAL NOT_EQUAL AND OR NOT NEGATE CALL RETURN INDEX CHECK_INDEX STORE_INDEX
+    BUILD_LIST CHECK_KEY BUILD_OBJECT COPY_CONSTANT MAKE_FUNCTION PRINT ASSERT SET_RESULT
+    EVALUATE_EXPRESSION EVALUATE_STATEMENT FAIL END
+""".split()
+
+binary_opcodes = {
+    "+": ADD,
+    "-": SUBTRACT,
+    "*": MULTIPLY,
+    "/": DIVIDE,
+    "^": POWER,
+    "<": LESS,
+    ">": GREATER,
+    "<=": LESS_EQUAL,
+    ">=": GREATER_EQUAL,
+    "==": EQUAL,
+    "!=": NOT_EQUAL,
+    "&&": AND,
+    "and": AND,
+    "||": OR,
+    "or": OR,
+}
+opcode_tags = {opcode: tag for tag, opcode in binary_opcodes.items() if tag in binary_operations}
+
+# the SET_RESULT argument for each exit status of an expression statement:
+# None, False, or the status of the call it ends with
+result_statuses = {"function": 1, "complex": 1, "call": 2}
+
+number_types = (int, float)
+
+# nodes nested more deeply than this within a function body, or a script,
+# are run by the explicit-stack evaluator, so compiling them doesn't use too
+# much of Python's stack
+compile_depth_limit = 100
+
+
+class Code:
+    """
+    The bytecode of a script or a function body. instructions is a flat list
+    of opcode, argument, opcode, argument, ...; constants and names are the
+    pools that LOAD_CONST, LOAD_NAME and others index into.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.instructions = []
+        self.constants = []
+        self.names = []
+        self.constant_indexes = {}
+        self.loops = {}  # the offset of each while loop's condition -> (the while node, the offset after it)
+
+    def emit(self, opcode, argument=0):
+        # the offset of the instruction, to patch jumps
+        self.instructions += [opcode, argument]
+        return len(self.instructions) - 2
+
+    def patch(self, offset, target=None):
+        # makes the jump at offset go to target, by default the next instruction
+        self.instructions[offset + 1] = len(self.instructions) if target is None else target
+
+    def constant(self, value):
+        # numbers, strings, booleans and None are pooled by type and value,
+        # since 1 and 1.0 print differently; nodes and exceptions aren't
+        key = (type(value), value) if value is None or type(value) in [int, float, str, bool] else id(value)
+        if key not in self.constant_indexes:
+            self.constant_indexes[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_indexes[key]
+
+    def name_index(self, name):
+        if name not in self.names:
+            self.names.append(name)
+        return self.names.index(name)
+
+
+def compile(ast):
+    """
+    Compiles a program, or a single statement, into a Code object that run()
+    executes as evaluate(ast, environment) would.
+    """
+    code = Code("<program>")
+    statements = ast.statements if ast.tag in ["program", "statement_list"] else [ast]
+    for statement in statements:
+        compile_statement(statement, code, 1, top_level=True)
+    code.emit(END)
+    return code
+
+
+def compile_body(body):
+    # a function body returns None unless it runs a return statement
+    code = Code("<function>")
+    compile_statement(body, code, 1)
+    code.emit(LOAD_CONST, code.constant(None))
+    code.emit(RETURN)
+    return code
+
+
+def compile_statement(ast, code, depth, top_level=False):
+    # top-level statements set the result of the program, as the last
+    # statement evaluated does for evaluate()
+    tag = ast.tag
+    if depth > compile_depth_limit:
+        code.emit(EVALUATE_STATEMENT, code.constant(ast))
+    elif tag == "if":
+        compile_expression(ast.condition, code, depth + 1)
+        jump_to_else = code.emit(JUMP_IF_FALSE)
+        compile_statement(ast.then, code, depth + 1)
+        if hasattr(ast, "else"):
+            jump_to_end = code.emit(JUMP)
+            code.patch(jump_to_else)
+            compile_statement(getattr(ast, "else"), code, depth + 1)
+            code.patch(jump_to_end)
+        else:
+            code.patch(jump_to_else)
+    elif tag == "while":
+        start = len(code.instructions)
+        compile_expression(ast.condition, code, depth + 1)
+        jump_to_end = code.emit(JUMP_IF_FALSE)
+        compile_statement(ast.do, code, depth + 1)
+        code.emit(JUMP, start)
+        code.patch(jump_to_end)
+        code.loops[start] = (ast, len(code.instructions))
+    elif tag in ["statement_list", "program"]:
+        for statement in ast.statements:
+            compile_statement(statement, code, depth + 1)
+    elif tag == "return":
+        if hasattr(ast, "value"):
+            compile_expression(ast.value, code, depth + 1)
+        else:
+            code.emit(LOAD_CONST, code.constant(None))
+        code.emit(RETURN)
+    else:
+        compile_expression(ast, code, depth)
+        if top_level:
+            code.emit(SET_RESULT, result_statuses.get(tag, 0))
+        else:
+            code.emit(POP)
+        return
+    if top_level and tag in ["if", "while"]:
+        code.emit(LOAD_CONST, code.constant(None))
+        code.emit(SET_RESULT, 1)
+
+
+def compile_expression(ast, code, depth):
+    # the instructions push the value of the expression
+    tag = ast.tag
+    depth = depth + 1
+    if depth > compile_depth_limit:
+        code.emit(EVALUATE_EXPRESSION, code.constant(ast))
+    elif tag in ["number", "boolean", "string"]:
+        value = ast.value
+        types = {"number": [float, int], "string": [str]}.get(tag)
+        if types is not None and type(value) not in types or tag == "boolean" and value not in [True, False]:
+            # raise the error when the node runs, as evaluate() does
+            code.emit(FAIL, code.constant(AssertionError(f"unexpected type {type(value)}")))
+        else:
+            code.emit(LOAD_CONST, code.constant(value))
+    elif tag == "null":
+        code.emit(LOAD_CONST, code.constant(None))
+    elif tag == "list":
+        for item in ast.items:
+            compile_expression(item, code, depth)
+        code.emit(BUILD_LIST, len(ast.items))
+    elif tag == "object":
+        for item in ast.items:
+            compile_expression(item["key"], code, depth)
+            code.emit(CHECK_KEY)
+            compile_expression(item["value"], code, depth)
+        code.emit(BUILD_OBJECT, len(ast.items))
+    elif tag == "constant":
+        code.emit(COPY_CONSTANT, code.constant(ast))
+    elif tag == "identifier":
+        code.emit(LOAD_NAME, code.name_index(ast.value))
+    elif tag in binary_opcodes:
+        compile_expression(ast.left, code, depth)
+        compile_expression(ast.right, code, depth)
+        code.emit(binary_opcodes[tag])
+    elif tag == "negate":
+        compile_expression(ast.value, code, depth)
+        code.emit(NEGATE)
+    elif tag in ["not", "!"]:
+        compile_expression(ast.value, code, depth)
+        code.emit(NOT)
+    elif tag == "print":
+        if ast.value:
+            compile_expression(ast.value, code, depth)
+        code.emit(PRINT, 1 if ast.value else 0)
+    elif tag == "assert":
+        if ast.condition:
+            compile_expression(ast.condition, code, depth)
+            code.emit(ASSERT, code.constant(ast.condition))
+        else:
+            code.emit(LOAD_CONST, code.constant("\n"))
+    elif tag == "function":
+        code.emit(MAKE_FUNCTION, code.constant(ast))
+    elif tag == "call":
+        compile_expression(ast.function, code, depth)
+        for argument in ast.arguments:
+            compile_expression(argument, code, depth)
+        code.emit(CALL, len(ast.arguments))
+    elif tag == "complex":
+        compile_expression(ast.base, code, depth)
+        compile_expression(ast.index, code, depth)
+        code.emit(INDEX)
+    elif tag == "assign" and ast.target.tag == "identifier":
+        compile_expression(ast.value, code, depth)
+        code.emit(STORE_NAME, code.name_index(ast.target.value))
+    elif tag == "assign" and ast.target.tag == "complex":
+        compile_expression(ast.target.base, code, depth)
+        if ast.target.index.tag == "string":
+            # direct property (like x.bar)
+            code.emit(LOAD_CONST, code.constant(ast.target.index.value))
+        else:
+            # evaluated property (like x["bar"])
+            compile_expression(ast.target.index, code, depth)
+        code.emit(CHECK_INDEX)
+        compile_expression(ast.value, code, depth)
+        code.emit(STORE_INDEX)
+    elif tag == "assign":
+        # an invalid target, which the evaluator reports
+        code.emit(EVALUATE_EXPRESSION, code.constant(ast))
+    elif tag in ["if", "while", "statement_list", "program", "return"]:
+        # a statement where an expression was expected, whose return
+        # doesn't return from the function
+        code.emit(EVALUATE_EXPRESSION, code.constant(ast))
+    else:
+        code.emit(FAIL, code.constant(AssertionError(f"Unknown tag [{tag}] in AST")))
+
+
+def body_code(body):
+    # the Code of a function body, compiled the first time it is called
+    return compiled(body, "bytecode", compile_body)
+
+
+def run(code, environment, profile=None):
+    """
+    Runs a Code object from compile() in environment, and returns (value,
+    exit_status) as evaluate() does. profile can be a tiered.Profile, which
+    counts calls and loop iterations, and runs the hot ones compiled.
+    """
+    instructions, constants, names = code.instructions, code.constants, code.names
+    stack = []
+    frames = []  # the (code, pc, environment) to return to from each call
+    result = (None, None)
+    call_status = None  # the exit status of the last call, for SET_RESULT
+    pc = 0
+    while True:
+        opcode = instructions[pc]
+        argument = instructions[pc + 1]
+        pc += 2
+        if opcode == LOAD_NAME:
+            name = names[argument]
+            scope = environment
+            while name not in scope:
+                if "$parent" not in scope:
+                    if name in builtin_functions:
+                        stack.append({"tag": "builtin", "name": name})
+                        break
+                    raise Exception(f"Unknown identifier: '{name}'")
+                scope = scope["$parent"]
+            else:
+                stack.append(scope[name])
+        elif opcode == LOAD_CONST:
+            stack.append(constants[argument])
+        elif opcode == STORE_NAME:
+            environment[names[argument]] = stack[-1]
+        elif opcode == POP:
+            stack.pop()
+        elif opcode == JUMP_IF_FALSE:
+            if not stack.pop():
+                pc = argument
+        elif opcode == JUMP:
+            if profile is not None and argument < pc:
+                # the end of an iteration of the loop at argument
+                loop = profile.loop(code, argument, environment)
+                if loop is not None:
+                    # run the rest of it compiled
+                    value, exit_status = loop(environment)
+                    if exit_status:
+                        if not frames:
+                            return value, exit_status
+                        profile.leave()
+                        code, pc, environment = frames.pop()
+                        instructions, constants, names = code.instructions, code.constants, code.names
+                        stack.append(value)
+                        call_status = False
+                    else:
+                        pc = code.loops[argument][1]
+                    continue
+            pc = argument
+        elif opcode <= NOT_EQUAL:
+            right = stack.pop()
+            left = stack[-1]
+            if opcode == EQUAL:
+                stack[-1] = left == right
+            elif opcode == NOT_EQUAL:
+                stack[-1] = left != right
+            elif type(left) in number_types and type(right) in number_types:
+                if opcode == ADD:
+                    stack[-1] = left + right
+                elif opcode == SUBTRACT:
+                    stack[-1] = left - right
+                elif opcode == MULTIPLY:
+                    stack[-1] = left * right
+                elif opcode == DIVIDE:
+                    assert right != 0, "Division by zero"
+                    stack[-1] = left / right
+                elif opcode == POWER:
+                    stack[-1] = left ** right
+                elif opcode == LESS:
+                    stack[-1] = left < right
+                elif opcode == GREATER:
+                    stack[-1] = left > right
+                elif opcode == LESS_EQUAL:
+                    stack[-1] = left <= right
+                else:
+                    stack[-1] = left >= right
+            else:
+                # other types, and errors, are left to evaluate()
+                operation = binary_operations[opcode_tags[opcode]]
+                stack[-1] = tree_evaluate(operation, {"$left": left, "$right": right})[0]
+        elif opcode == CALL:
+            arguments = stack[len(stack) - argument :]
+            del stack[len(stack) - argument :]
+            function = stack.pop()
+            if function.get("tag") == "builtin":
+                value, call_status = evaluate_builtin_function(function["name"], arguments)
+                stack.append(value)
+            else:
+                local_environment = {name["value"]: value for name, value in zip(function["parameters"], arguments)}
+                local_environment["$parent"] = environment
+                if profile is not None and profile.call(function, local_environment):
+                    stack.append(profile.run_function(function, local_environment))
+                    call_status = False
+                    continue
+                frames.append((code, pc, environment))
+                code = body_code(function["body"])
+                instructions, constants, names = code.instructions, code.constants, code.names
+                environment = local_environment
+                pc = 0
+        elif opcode == RETURN:
+            if not frames:
+                return stack.pop(), "return"
+            if profile is not None:
+                profile.leave()
+            code, pc, environment = frames.pop()
+            instructions, constants, names = code.instructions, code.constants, code.names
+            call_status = False
+        elif opcode == SET_RESULT:
+            result = (stack.pop(), (None, False, call_status)[argument])
+        elif opcode == ASSERT:
+            if not stack.pop():
+                raise Exception("Assertion failed:", ast_to_string(constants[argument]))
+            stack.append("\n")
+        elif opcode == INDEX:
+            index = stack.pop()
+            base = stack[-1]
+            if type(index) is int and type(base) is list and len(base) > index:
+                stack[-1] = base[index]
+            elif type(index) is str and type(base) is dict:
+                stack[-1] = base[index]
+            else:
+                # None indexes, other types, and errors, are left to evaluate()
+                stack[-1] = tree_evaluate(index_operation, {"$base": base, "$index": index})[0]
+        elif opcode == AND:
+            right = stack.pop()
+            stack[-1] = is_truthy(stack[-1]) and is_truthy(right)
+        elif opcode == OR:
+            right = stack.pop()
+            stack[-1] = is_truthy(stack[-1]) or is_truthy(right)
+        elif opcode == NOT:
+            stack[-1] = not is_truthy(stack[-1])
+        elif opcode == NEGATE:
+            value = stack[-1]
+            if type(value) not in number_types:
+                raise Exception(f"Illegal type for negate:{type_of(value)}")
+            stack[-1] = -value
+        elif opcode == CHECK_INDEX:
+            # the checks evaluate() makes before it evaluates the value
+            base, index = stack[-2], stack[-1]
+            assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+            if isinstance(base, list):
+                assert isinstance(index, int), "List index must be integer"
+                assert 0 <= index < len(base), "List index out of range"
+            elif not isinstance(base, dict):
+                assert False, f"Cannot assign to base of type {type(base)}"
+        elif opcode == STORE_INDEX:
+            value = stack.pop()
+            index = stack.pop()
+            stack[-1][index] = value
+            stack[-1] = value
+        elif opcode == BUILD_LIST:
+            items = stack[len(stack) - argument :]
+            del stack[len(stack) - argument :]
+            stack.append(items)
+        elif opcode == CHECK_KEY:
+            assert type(stack[-1]) is str, "Object key must be a string"
+        elif opcode == BUILD_OBJECT:
+            items = stack[len(stack) - 2 * argument :]
+            del stack[len(stack) - 2 * argument :]
+            stack.append(dict(zip(items[::2], items[1::2])))
+        elif opcode == COPY_CONSTANT:
+            stack.append(copy_constant(constants[argument]))
+        elif opcode == MAKE_FUNCTION:
+            # function values are dicts, which the language treats as objects
+            stack.append(constants[argument].as_dict())
+        elif opcode == PRINT:
+            if argument:
+                value = stack.pop()
+                if value is True:
+                    value = "true"
+                elif value is False:
+                    value = "false"
+                print(str(value))
+                stack.append(str(value) + "\n")
+            else:
+                print()
+                stack.append("\n")
+        elif opcode == EVALUATE_EXPRESSION:
+            stack.append(run_steps(evaluate_steps(constants[argument], environment))[0])
+        elif opcode == EVALUATE_STATEMENT:
+            value, exit_status = run_steps(evaluate_steps(constants[argument], environment))
+            if exit_status:
+                # a return statement ran, so return as RETURN does
+                if not frames:
+                    return value, exit_status
+                if profile is not None:
+                    profile.leave()
+                code, pc, environment = frames.pop()
+                instructions, constants, names = code.instructions, code.constants, code.names
+                stack.append(value)
+                call_status = False
+        elif opcode == FAIL:
+            error = constants[argument]
+            raise type(error)(*error.args)
+        elif opcode == END:
+            return result
+        else:
+            assert False, f"Unknown opcode {opcode}"
+
+
+def evaluate(ast, environment, depth=0):
+    """
+    Compiles ast and runs it, as a drop-in replacement for evaluator.evaluate().
+    """
+    return run(compile(ast), environment)
+
+
+def disassemble(code):
+    """
+    Lists the instructions of a Code object, one per line, with the constant,
+    name or jump target each refers to, followed by the code of the
+    functions it makes.
+    """
+    lines = [f"{code.name}:"]
+    functions = []
+    instructions = code.instructions
+    for offset in range(0, len(instructions), 2):
+        opcode, argument = instructions[offset], instructions[offset + 1]
+        detail = ""
+        if opcode in [LOAD_NAME, STORE_NAME]:
+            detail = code.names[argument]
+        elif opcode in [LOAD_CONST, COPY_CONSTANT, FAIL, ASSERT, EVALUATE_EXPRESSION, EVALUATE_STATEMENT]:
+            constant = code.constants[argument]
+            if opcode == LOAD_CONST:
+                detail = repr(constant)
+            elif opcode == FAIL:
+                detail = f"{type(constant).__name__}: {constant}"
+            elif opcode == EVALUATE_EXPRESSION or opcode == EVALUATE_STATEMENT:
+                detail = f"{constant.tag} node"
+            else:
+                detail = ast_to_string(constant)
+        elif opcode in [JUMP, JUMP_IF_FALSE]:
+            detail = f"to {argument}"
+        elif opcode == MAKE_FUNCTION:
+            function = code.constants[argument]
+            detail = f"function({', '.join(name['value'] for name in function.parameters)})"
+            functions.append(function)
+        elif opcode == SET_RESULT:
+            detail = ["exit status None", "exit status False", "exit status of the call"][argument]
+        line = f"{offset:6} {opnames[opcode]:20}"
+        if opcode in [LOAD_NAME, STORE_NAME, LOAD_CONST, COPY_CONSTANT, FAIL, ASSERT, JUMP, JUMP_IF_FALSE,
+                      CALL, BUILD_LIST, BUILD_OBJECT, MAKE_FUNCTION, PRINT, SET_RESULT,
+                      EVALUATE_EXPRESSION, EVALUATE_STATEMENT]:
+            line += f" {argument:4}"
+        if detail:
+            line += f" ({detail})"
+        lines.append(line.rstrip())
+    for function in functions:
+        lines.append("")
+        lines.append(disassemble(body_code(function.body)))
+    return "\n".join(lines)
+
+
+def run_program(evaluate_with, source):
+    # the result, environment and output of running source, or the error
+    environment = {}
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        try:
+            value = evaluate_with(parse(tokenize(source)), environment)
+        except Exception as e:
+            # the first line, since pytest adds an explanation to a failed assert's message
+            value = ("error", type(e), str(e).split("\n")[0])
+    return value, environment, output.getvalue()
+
+
+def test_run():
+    print("testing run...")
+    # the bytecode does what evaluate() does, including exit statuses and errors
+    import evaluator
+
+    sources = []
+    for name in ["basic-test.t", "feature-test.t", "../tmp.tc"]:
+        with open(name) as f:
+            sources.append(f.read())
+    sources += [
+        "function f(x) { if (x > 2) { return x } else { return f(x + 1) } }; y = f(0)",
+        "function f() { while (1) { return 3 } }; x = f(); if (0) { y = 1 }; while (0) { }; f",
+        "x = [1, {\"a\": 2}]; x[1].b = !x[0] || 0 && 1; y = -x[0] ^ 2 * 3 / 4 - 5; z = \"a\" * 2 <= \"b\"",
+        "x = {\"a\": [1, 2]}; x.a[1] = 3; x[\"b\"] = x.a; y = x.b[1] + length(x) - 1.5; z = x[null]",
+        "print; print 1 != 2; print true; print [false]; assert 1 == 1; x = length([1]) + head(tail([1, 2]))",
+        "return 1; x = 2",
+        "x = {\"a\": 1} + {\"b\": 2}; y = [1] + [2]; z = \"a\" + \"b\"; w = 2 ^ 0.5 > 1.4 == true",
+        "x = 1; function f() { x = 2; return x }; y = f(); length([1])",
+        "function f() { x = 1 }; y = f(); z = [f(), f][0]; f()",
+        "x = {\"a\": 1, \"a\": 2, \"b\": 3}; y = [[], {}, [1, [2]]]; z = 1 == 1.0; w = \"1\" != 1; [1][-1]",
+        "x = 1 + \"a\"", "x = 1 - \"a\"", "x = 1 / 0", "x = -\"a\"", "x = \"a\" < 1", "x = {1: 2}",
+        "assert 1 == 2", "x = [1][2]", "x = [1][0.5]", "y = z", "x = 1; x.y = 2", "x = [1]; x[1] = 2",
+        "x = [1]; x[\"a\"] = 2", "x = [1]; x[true] = 2", "x = 1; x()", "break", "x = \"a\" ^ 2",
+        "x = {}; x[1] = y", "x = [1]; x[0] = 2 / 0",
+    ]
+    sources += ["x = [" + ", ".join(map(str, range(40))) + "]; x[0] = 1; y = [" + ", ".join(map(str, range(40))) + "]"]
+    for source in sources:
+        assert run_program(evaluate, source) == run_program(evaluator.evaluate, source), source
+
+    # compiled code can be run again, in other environments
+    code = compile(parse(tokenize("function f(x) { return x + y }; z = f(1)")))
+    for y in [1, 2]:
+        environment = {"y": y}
+        assert run(code, environment) == (y + 1, None) and environment["z"] == y + 1
+
+    # deep nesting runs with the explicit-stack evaluator, and deep recursion
+    # only adds frames to the VM's list
+    source = "if (x == 0) { y = 0 }" + "".join(f" else if (x == {i}) {{ y = {i} }}" for i in range(1, 2000))
+    environment = {"x": 1999}
+    evaluate(parse(tokenize(source)), environment)
+    assert environment["y"] == 1999
+    source = "function f(n) { if (n == 0) { return 0 }; return 1 + f(n - 1) }; x = f(5000); y = f(10)"
+    environment = {}
+    evaluate(parse(tokenize(source)), environment)
+    assert environment["x"] == 5000 and environment["y"] == 10
+    source = "function f(n) { " + "if (1) { " * 150 + "return n" + " }" * 150 + " }; x = f(2) + f(3)"
+    assert run_program(evaluate, source)[1]["x"] == 5
+
+
+def test_disassemble():
+    print("testing disassemble...")
+    code = compile(parse(tokenize("function f(n) { while (n > 0) { n = n - 1 }; return n }; x = f(2); print x")))
+    assert disassemble(code) == "\n".join(
+        [
+            "<program>:",
+            "     0 MAKE_FUNCTION           0 (function(n))",
+            "     2 STORE_NAME              0 (f)",
+            "     4 SET_RESULT              0 (exit status None)",
+            "     6 LOAD_NAME               0 (f)",
+            "     8 LOAD_CONST              1 (2)",
+            "    10 CALL                    1",
+            "    12 STORE_NAME              1 (x)",
+            "    14 SET_RESULT              0 (exit status None)",
+            "    16 LOAD_NAME               1 (x)",
+            "    18 PRINT                   1",
+            "    20 SET_RESULT              0 (exit status None)",
+            "    22 END",
+            "",
+            "<function>:",
+            "     0 LOAD_NAME               0 (n)",
+            "     2 LOAD_CONST              0 (0)",
+            "     4 GREATER",
+            "     6 JUMP_IF_FALSE          20 (to 20)",
+            "     8 LOAD_NAME               0 (n)",
+            "    10 LOAD_CONST              1 (1)",
+            "    12 SUBTRACT",
+            "    14 STORE_NAME              0 (n)",
+            "    16 POP",
+            "    18 JUMP                    0 (to 0)",
+            "    20 LOAD_NAME               0 (n)",
+            "    22 RETURN",
+            "    24 LOAD_CONST              2 (None)",
+            "    26 RETURN",
+        ]
+    )
+
+
+def test_evaluator_tests():
+    print("testing bytecode with the evaluator's tests...")
+    import evaluator
+
+    tests = [value for name, value in vars(evaluator).items() if name.startswith("test_")]
+    saved = evaluator.evaluate
+    evaluator.evaluate = evaluate
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for test in tests:
+                test()
+    finally:
+        evaluator.evaluate = saved
+
+
+if __name__ == "__main__":
+    print("testing bytecode.")
+    test_run()
+    test_disassemble()
+    test_evaluator_tests()
+    print("done.")
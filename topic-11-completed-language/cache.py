@@ -0,0 +1,198 @@
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+from tokenizer import LineIndex, Token, map_file, tokenize, tokenize_bytes, tokenize_file
+from parser import parse, token_view
+from nodes import Node, node, node_classes
+
+# AST CACHE
+
+# Parsed scripts are cached in a __pycache__ directory next to the script, as
+# marshal data. The cache is keyed by a hash of the script and of the
+# interpreter's own source, so editing either one invalidates it.
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+interpreter_key = None
+
+
+def interpreter_version():
+    global interpreter_key
+    if interpreter_key is None:
+        digest = hashlib.sha256(sys.version.encode() + bytes([marshal.version]))
+        for name in ["tokenizer.py", "parser.py", "nodes.py", "cache.py"]:
+            with open(os.path.join(here, name), "rb") as f:
+                digest.update(f.read())
+        interpreter_key = digest.digest()
+    return interpreter_key
+
+
+def cache_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, "__pycache__", name + ".ast")
+
+
+def parse_file(path, lines, positions, use_cache=True):
+    """
+    Parses a script file, using its cached AST when neither the script nor
+    the interpreter has changed. lines and positions are filled in as by
+    tokenize() and parse().
+    """
+    if not use_cache:
+        return parse(token_view(tokenize_file(path, lines=lines), lines), positions)
+    # the script is hashed and lexed through a memory map, not read into memory
+    with map_file(path) as source:
+        digest = hashlib.sha256(interpreter_version())
+        digest.update(source)
+        key = digest.hexdigest()
+        cached = read_cache(cache_path(path), key)
+        if cached is not None:
+            ast, statement_positions, line_starts = cached
+            positions.extend(statement_positions)
+            lines.starts[:] = line_starts
+            return ast
+        ast = parse(token_view(tokenize_bytes(source, lines=lines), lines), positions)
+    write_cache(cache_path(path), key, ast, positions, lines)
+    return ast
+
+
+def read_cache(path, key):
+    # the cached (ast, positions, line starts), or None if missing or stale
+    try:
+        with open(path, "rb") as f:
+            cached_key, data, positions, line_starts = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if cached_key != key:
+        return None
+    return decode(data), positions, line_starts
+
+
+def write_cache(path, key, ast, positions, lines):
+    try:
+        data = marshal.dumps((key, encode(ast), positions, lines.starts))
+    except (ValueError, RecursionError):
+        # too deeply nested for marshal, so the script isn't cached
+        return
+    # write a temporary file and rename it, so a cache file is never partly written
+    directory = os.path.dirname(path)
+    temporary = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as f:
+            temporary = f.name
+            f.write(data)
+        os.replace(temporary, path)
+    except OSError:
+        # the cache is only an optimization, e.g. the directory may be read-only
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def encode(ast):
+    # nodes become (tag, field, ...) tuples, with unset trailing fields
+    # left off, and tokens (function parameters) become (None, tag, value, position)
+    if isinstance(ast, Node):
+        values = []
+        for field in ast.__slots__:
+            if not hasattr(ast, field):
+                break
+            values.append(encode(getattr(ast, field)))
+        return (ast.tag, *values)
+    if isinstance(ast, Token):
+        return (None, ast.tag, ast.value, ast.position)
+    if isinstance(ast, list):
+        return [encode(item) for item in ast]
+    if isinstance(ast, dict):
+        return {key: encode(value) for key, value in ast.items()}
+    return ast
+
+
+def decode(data):
+    kind = type(data)
+    if kind is tuple:
+        tag = data[0]
+        if tag is None:
+            return Token(data[1], data[2], data[3])
+        cls = node_classes[tag]
+        ast = cls.__new__(cls)
+        for field, value in zip(cls.__slots__, data[1:]):
+            setattr(ast, field, decode(value))
+        return ast
+    if kind is list:
+        return [decode(item) for item in data]
+    if kind is dict:
+        return {key: decode(value) for key, value in data.items()}
+    return data
+
+
+def test_encode():
+    print("testing encode...")
+    code = """
+        function f(a, b) { if (a) { return } else { return b } };
+        x = {"k": [1, 2.5, "s", true, null], "f": f};
+        assert x.k[0] == 1, "first";
+        assert -x.k[1] < 3;
+        print f(1, 2) + 3 ^ 2
+    """
+    ast = parse(tokenize(code))
+    decoded = decode(marshal.loads(marshal.dumps(encode(ast))))
+    assert decoded == ast and isinstance(decoded, Node)
+    function = decoded.statements[0].value
+    assert isinstance(function.parameters[0], Token)
+    # missing fields stay missing
+    statement = function.body.statements[0]
+    assert "else" in statement and "value" not in statement.then.statements[0]
+    assert "explanation" in decoded.statements[2] and "explanation" not in decoded.statements[3]
+
+
+def test_parse_file():
+    print("testing parse_file...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "script.t")
+        with open(path, "w") as f:
+            f.write("x = 1;\ny = x + 2")
+
+        # the first parse writes the cache, and the second one reads it
+        for _ in range(2):
+            lines, positions = LineIndex(), []
+            ast = parse_file(path, lines, positions)
+            assert ast == parse(tokenize_bytes(b"x = 1;\ny = x + 2"))
+            assert positions == [0, 7] and lines.starts == [0, 7]
+            assert os.path.exists(cache_path(path))
+        assert os.listdir(os.path.join(directory, "__pycache__")) == ["script.t.ast"]
+
+        # a cached AST is used as it is
+        key = hashlib.sha256(interpreter_version() + b"x = 1;\ny = x + 2").hexdigest()
+        write_cache(cache_path(path), key, node("null"), [0], LineIndex())
+        assert parse_file(path, LineIndex(), []) == {"tag": "null"}
+        assert parse_file(path, LineIndex(), [], use_cache=False)["tag"] == "program"
+
+        # editing the script invalidates the cache
+        with open(path, "w") as f:
+            f.write("z = 3")
+        positions = []
+        assert parse_file(path, LineIndex(), positions) == parse(tokenize_bytes(b"z = 3"))
+        assert positions == [0]
+
+        # a damaged cache file is ignored and replaced
+        with open(cache_path(path), "wb") as f:
+            f.write(b"\x00garbage")
+        assert parse_file(path, LineIndex(), []) == parse(tokenize_bytes(b"z = 3"))
+        key = hashlib.sha256(interpreter_version() + b"z = 3").hexdigest()
+        assert read_cache(cache_path(path), key) is not None
+
+        # without the cache, nothing is written
+        os.remove(cache_path(path))
+        parse_file(path, LineIndex(), [], use_cache=False)
+        assert not os.path.exists(cache_path(path))
+
+
+if __name__ == "__main__":
+    print("testing cache.")
+    test_encode()
+    test_parse_file()
+    print("done.")
@@ -0,0 +1,603 @@
+from tokenizer import tokenize
+from parser import parse, run_steps
+from nodes import compiled
+from evaluator import (
+    __builtin_functions as builtin_functions,
+    ast_to_string,
+    copy_constant,
+    evaluate_builtin_function,
+    evaluate_steps,
+    invalid_assignment_target,
+    is_truthy,
+    type_of,
+)
+import contextlib
+import io
+import operator
+
+# CLOSURE COMPILATION
+
+# compile() turns an AST into nested Python closures once, so running it calls
+# the closures directly instead of dispatching on each node's tag and reading
+# its fields every time it runs. Expressions compile to closures that return
+# their value, and statements to closures that return (value, exit_status)
+# like evaluate(). The closures do what evaluator.evaluate() does, with the
+# same errors, and give the same results.
+
+# nodes nested more deeply than this within a function body, or a script,
+# are run by the explicit-stack evaluator, so compiling and running them
+# doesn't use too much of Python's stack
+compile_depth_limit = 100
+
+# a call made with more than this many frames' worth of compiled calls
+# already running runs its function with the explicit-stack evaluator, so
+# deep recursion doesn't overflow Python's stack
+frame_budget = 400
+frames = 0
+
+# the exit status evaluate() returns for each kind of expression
+expression_statuses = {"function": False, "complex": False}
+
+number_types = (int, float)
+
+
+def compile(ast):
+    """
+    Compiles ast into a closure that takes an environment and returns
+    (value, exit_status), as evaluate(ast, environment) would.
+    """
+    return compile_statement(ast, 0)
+
+
+def evaluate(ast, environment, depth=0):
+    """
+    Compiles ast and runs it, as a drop-in replacement for evaluator.evaluate().
+    """
+    return compile(ast)(environment)
+
+
+def compile_statement(ast, depth):
+    tag = ast.tag
+    if depth > compile_depth_limit:
+        return lambda environment: run_steps(evaluate_steps(ast, environment))
+    if tag in statement_compilers:
+        return statement_compilers[tag](ast, depth)
+    if tag == "call":
+        return compile_call(ast, depth, statement=True)
+    expression = compile_expression(ast, depth)
+    exit_status = expression_statuses.get(tag)
+    return lambda environment: (expression(environment), exit_status)
+
+
+def compile_expression(ast, depth):
+    if depth > compile_depth_limit:
+        return lambda environment: run_steps(evaluate_steps(ast, environment))[0]
+    compiler = expression_compilers.get(ast.tag)
+    if compiler is None:
+        if ast.tag in statement_compilers:
+            statement = statement_compilers[ast.tag](ast, depth)
+            return lambda environment: statement(environment)[0]
+        return compile_unknown(ast, depth)
+    return compiler(ast, depth + 1)
+
+
+def compile_unknown(ast, depth):
+    def run(environment):
+        assert False, f"Unknown tag [{ast.tag}] in AST"
+
+    return run
+
+
+def compile_literal(ast, depth):
+    value = ast.value
+    types = {"number": [float, int], "string": [str]}.get(ast.tag)
+    if types is not None and type(value) not in types or ast.tag == "boolean" and value not in [True, False]:
+        # raise the error when the node runs, as evaluate() does
+        def run(environment):
+            assert False, f"unexpected type {type(value)}"
+
+        return run
+    return lambda environment: value
+
+
+def compile_null(ast, depth):
+    return lambda environment: None
+
+
+def compile_list(ast, depth):
+    items = [compile_expression(item, depth) for item in ast.items]
+    return lambda environment: [item(environment) for item in items]
+
+
+def compile_object(ast, depth):
+    items = [(compile_expression(item["key"], depth), compile_expression(item["value"], depth)) for item in ast.items]
+
+    def run(environment):
+        object = {}
+        for key, value in items:
+            key = key(environment)
+            assert type(key) is str, "Object key must be a string"
+            object[key] = value(environment)
+        return object
+
+    return run
+
+
+def compile_constant(ast, depth):
+    return lambda environment: copy_constant(ast)
+
+
+def compile_identifier(ast, depth):
+    identifier = ast.value
+
+    def run(environment):
+        while identifier not in environment:
+            if "$parent" not in environment:
+                if identifier in builtin_functions:
+                    return {"tag": "builtin", "name": identifier}
+                raise Exception(f"Unknown identifier: '{identifier}'")
+            environment = environment["$parent"]
+        return environment[identifier]
+
+    return run
+
+
+def compile_add(ast, depth):
+    left = compile_expression(ast.left, depth)
+    right = compile_expression(ast.right, depth)
+
+    def run(environment):
+        left_value = left(environment)
+        right_value = right(environment)
+        if type(left_value) in number_types and type(right_value) in number_types:
+            return left_value + right_value
+        types = type_of(left_value, right_value)
+        if types == "string-string":
+            return left_value + right_value
+        if types == "object-object":
+            return {**left_value, **right_value}
+        if types == "array-array":
+            return left_value + right_value
+        raise Exception(f"Illegal types for {ast.tag}: {types}")
+
+    return run
+
+
+def compile_subtract(ast, depth):
+    left = compile_expression(ast.left, depth)
+    right = compile_expression(ast.right, depth)
+
+    def run(environment):
+        left_value = left(environment)
+        right_value = right(environment)
+        if type(left_value) in number_types and type(right_value) in number_types:
+            return left_value - right_value
+        raise Exception(f"Illegal types for {ast.tag}:{type_of(left_value, right_value)}")
+
+    return run
+
+
+def compile_repeat(ast, depth):
+    # ^ and *, which also repeat a string a number of times
+    left = compile_expression(ast.left, depth)
+    right = compile_expression(ast.right, depth)
+    apply = operator.pow if ast.tag == "^" else operator.mul
+
+    def run(environment):
+        left_value = left(environment)
+        right_value = right(environment)
+        if type(left_value) in number_types and type(right_value) in number_types:
+            return apply(left_value, right_value)
+        types = type_of(left_value, right_value)
+        if types == "string-number":
+            return apply(left_value, int(right_value))
+        if types == "number-string":
+            return apply(right_value, int(left_value))
+        raise Exception(f"Illegal types for {ast.tag}:{types}")
+
+    return run
+
+
+def compile_divide(ast, depth):
+    left = compile_expression(ast.left, depth)
+    right = compile_expression(ast.right, depth)
+
+    def run(environment):
+        left_value = left(environment)
+        right_value = right(environment)
+        if type(left_value) in number_types and type(right_value) in number_types:
+            assert right_value != 0, "Division by zero"
+            return left_value / right_value
+        raise Exception(f"Illegal types for {ast.tag}:{type_of(left_value, right_value)}")
+
+    return run
+
+
+def compile_negate(ast, depth):
+    value = compile_expression(ast.value, depth)
+
+    def run(environment):
+        result = value(environment)
+        if type(result) in number_types:
+            return -result
+        raise Exception(f"Illegal type for {ast.tag}:{type_of(result)}")
+
+    return run
+
+
+def compile_and(ast, depth):
+    left = compile_expression(ast.left, depth)
+    right = compile_expression(ast.right, depth)
+
+    def run(environment):
+        left_value = left(environment)
+        right_value = right(environment)
+        return is_truthy(left_value) and is_truthy(right_value)
+
+    return run
+
+
+def compile_or(ast, depth):
+    left = compile_expression(ast.left, depth)
+    right = compile_expression(ast.right, depth)
+
+    def run(environment):
+        left_value = left(environment)
+        right_value = right(environment)
+        return is_truthy(left_value) or is_truthy(right_value)
+
+    return run
+
+
+def compile_not(ast, depth):
+    value = compile_expression(ast.value, depth)
+    return lambda environment: not is_truthy(value(environment))
+
+
+comparisons = {
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+def compile_comparison(ast, depth):
+    left = compile_expression(ast.left, depth)
+    right = compile_expression(ast.right, depth)
+    compare = comparisons[ast.tag]
+    if ast.tag in ["==", "!="]:
+        return lambda environment: compare(left(environment), right(environment))
+
+    def run(environment):
+        left_value = left(environment)
+        right_value = right(environment)
+        if type(left_value) in number_types and type(right_value) in number_types:
+            return compare(left_value, right_value)
+        types = type_of(left_value, right_value)
+        if types not in ["number-number", "string-string"]:
+            raise Exception(f"Illegal types for {ast.tag}: {types}")
+        return compare(left_value, right_value)
+
+    return run
+
+
+def compile_print(ast, depth):
+    if not ast.value:
+
+        def run(environment):
+            print()
+            return "\n"
+
+        return run
+    value = compile_expression(ast.value, depth)
+
+    def run(environment):
+        result = value(environment)
+        if result is True:
+            result = "true"
+        elif result is False:
+            result = "false"
+        print(str(result))
+        return str(result) + "\n"
+
+    return run
+
+
+def compile_assert(ast, depth):
+    if not ast.condition:
+        return lambda environment: "\n"
+    condition = compile_expression(ast.condition, depth)
+
+    def run(environment):
+        if not condition(environment):
+            raise Exception("Assertion failed:", ast_to_string(ast.condition))
+        return "\n"
+
+    return run
+
+
+def compile_function(ast, depth):
+    # function values are dicts, which the language treats as objects
+    return lambda environment: ast.as_dict()
+
+
+def compile_call(ast, depth, statement=False):
+    function = compile_expression(ast.function, depth + 1)
+    arguments = [compile_expression(argument, depth + 1) for argument in ast.arguments]
+    # the frames this call adds while it runs: the closures from the body to
+    # this call, a comprehension each, and the call itself
+    cost = 2 * depth + 4
+
+    def run(environment):
+        global frames
+        function_value = function(environment)
+        argument_values = [argument(environment) for argument in arguments]
+
+        if function_value.get("tag") == "builtin":
+            value, exit_status = evaluate_builtin_function(function_value["name"], argument_values)
+            return (value, exit_status) if statement else value
+
+        # regular function call:
+        local_environment = {name["value"]: value for name, value in zip(function_value["parameters"], argument_values)}
+        local_environment["$parent"] = environment
+        body = function_value["body"]
+        if frames > frame_budget:
+            value, exit_status = run_steps(evaluate_steps(body, local_environment))
+        else:
+            compiled_body = compiled(body, "closures", compile)
+            frames += cost
+            try:
+                value, exit_status = compiled_body(local_environment)
+            finally:
+                frames -= cost
+        if not exit_status:
+            value = None
+        return (value, False) if statement else value
+
+    return run
+
+
+def compile_complex(ast, depth):
+    base = compile_expression(ast.base, depth)
+    index = compile_expression(ast.index, depth)
+
+    def run(environment):
+        base_value = base(environment)
+        index_value = index(environment)
+        if index_value == None:
+            return base_value
+        if type(index_value) in [int, float]:
+            assert int(index_value) == index_value, "List index must be integer"
+            assert type(base_value) == list, f"Cannot index base of type {type(base_value)}"
+            assert len(base_value) > index_value, "List index out of range"
+            return base_value[index_value]
+        if type(index_value) == str:
+            assert type(base_value) == dict, f"Cannot index base of type {type(base_value)}"
+            return base_value[index_value]
+        assert False, f"Unknown index type [{index_value}]"
+
+    return run
+
+
+def compile_assign(ast, depth):
+    target = ast.target
+    if target.tag not in ["identifier", "complex"]:
+
+        def run(environment):
+            invalid_assignment_target(target)
+
+        return run
+
+    value = compile_expression(ast.value, depth)
+    if target.tag == "identifier":
+        name = target.value
+
+        def run(environment):
+            result = value(environment)
+            environment[name] = result
+            return result
+
+        return run
+
+    base = compile_expression(target.base, depth)
+    if target.index.tag == "string":
+        # direct property (like x.bar)
+        property = target.index.value
+        index = lambda environment: property
+    else:
+        # evaluated property (like x["bar"])
+        index = compile_expression(target.index, depth)
+
+    def run(environment):
+        base_value = base(environment)
+        index_value = index(environment)
+        assert type(index_value) in [int, float, str], f"Unknown index type [{index_value}]"
+        if isinstance(base_value, list):
+            assert isinstance(index_value, int), "List index must be integer"
+            assert 0 <= index_value < len(base_value), "List index out of range"
+        elif not isinstance(base_value, dict):
+            assert False, f"Cannot assign to base of type {type(base_value)}"
+        result = value(environment)
+        base_value[index_value] = result
+        return result
+
+    return run
+
+
+def compile_if(ast, depth):
+    condition = compile_expression(ast.condition, depth + 1)
+    then = compile_statement(ast.then, depth + 1)
+    otherwise = compile_statement(getattr(ast, "else"), depth + 1) if hasattr(ast, "else") else None
+
+    def run(environment):
+        if condition(environment):
+            value, exit_status = then(environment)
+            if exit_status:
+                return value, exit_status
+        elif otherwise is not None:
+            value, exit_status = otherwise(environment)
+            if exit_status:
+                return value, exit_status
+        return None, False
+
+    return run
+
+
+def compile_while(ast, depth):
+    condition = compile_expression(ast.condition, depth + 1)
+    body = compile_statement(ast.do, depth + 1)
+
+    def run(environment):
+        while condition(environment):
+            value, exit_status = body(environment)
+            if exit_status:
+                return value, exit_status
+        return None, False
+
+    return run
+
+
+def compile_statement_list(ast, depth):
+    # also the program node, which runs the same way
+    statements = [compile_statement(statement, depth + 1) for statement in ast.statements]
+
+    def run(environment):
+        value, exit_status = None, None
+        for statement in statements:
+            value, exit_status = statement(environment)
+            if exit_status:
+                return value, exit_status
+        return value, exit_status
+
+    return run
+
+
+def compile_return(ast, depth):
+    if not hasattr(ast, "value"):
+        return lambda environment: (None, "return")
+    value = compile_expression(ast.value, depth + 1)
+    return lambda environment: (value(environment), "return")
+
+
+expression_compilers = {
+    "number": compile_literal,
+    "boolean": compile_literal,
+    "string": compile_literal,
+    "null": compile_null,
+    "list": compile_list,
+    "object": compile_object,
+    "constant": compile_constant,
+    "identifier": compile_identifier,
+    "+": compile_add,
+    "-": compile_subtract,
+    "^": compile_repeat,
+    "*": compile_repeat,
+    "/": compile_divide,
+    "negate": compile_negate,
+    "&&": compile_and,
+    "and": compile_and,
+    "||": compile_or,
+    "or": compile_or,
+    "!": compile_not,
+    "not": compile_not,
+    "<": compile_comparison,
+    ">": compile_comparison,
+    "<=": compile_comparison,
+    ">=": compile_comparison,
+    "==": compile_comparison,
+    "!=": compile_comparison,
+    "print": compile_print,
+    "assert": compile_assert,
+    "function": compile_function,
+    "call": compile_call,
+    "complex": compile_complex,
+    "assign": compile_assign,
+}
+
+statement_compilers = {
+    "if": compile_if,
+    "while": compile_while,
+    "statement_list": compile_statement_list,
+    "program": compile_statement_list,
+    "return": compile_return,
+}
+
+
+def run_program(evaluate_with, source):
+    # the result, environment and output of running source, or the error
+    environment = {}
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        try:
+            value = evaluate_with(parse(tokenize(source)), environment)
+        except Exception as e:
+            # the first line, since pytest adds an explanation to a failed assert's message
+            value = ("error", type(e), str(e).split("\n")[0])
+    return value, environment, output.getvalue()
+
+
+def test_compile():
+    print("testing compile...")
+    # the closures do what evaluate() does, including exit statuses and errors
+    import evaluator
+
+    sources = []
+    for name in ["basic-test.t", "feature-test.t", "../tmp.tc"]:
+        with open(name) as f:
+            sources.append(f.read())
+    sources += [
+        "function f(x) { if (x > 2) { return x } else { return f(x + 1) } }; y = f(0)",
+        "function f() { while (1) { return 3 } }; x = f(); if (0) { y = 1 }; while (0) { }; f",
+        "x = [1, {\"a\": 2}]; x[1].b = !x[0] || 0 && 1; y = -x[0] ^ 2 * 3 / 4 - 5; z = \"a\" * 2 <= \"b\"",
+        "x = {\"a\": [1, 2]}; x.a[1] = 3; x[\"b\"] = x.a; y = x.b[1] + length(x) - 1.5; z = x[null]",
+        "print; print 1 != 2; print true; print [false]; assert 1 == 1; x = length([1]) + head(tail([1, 2]))",
+        "return 1; x = 2",
+        "x = {\"a\": 1} + {\"b\": 2}; y = [1] + [2]; z = \"a\" + \"b\"; w = 2 ^ 0.5 > 1.4 == true",
+        "x = 1; function f() { x = 2; return x }; y = f(); length([1])",
+        "x = 1 + \"a\"", "x = 1 - \"a\"", "x = 1 / 0", "x = -\"a\"", "x = \"a\" < 1", "x = {1: 2}",
+        "assert 1 == 2", "x = [1][2]", "x = [1][0.5]", "y = z", "x = 1; x.y = 2", "x = [1]; x[1] = 2",
+        "x = [1]; x[\"a\"] = 2", "x = [1]; x[true] = 2", "x = 1; x()", "break", "x = \"a\" ^ 2",
+    ]
+    sources += ["x = [" + ", ".join(map(str, range(40))) + "]; x[0] = 1; y = [" + ", ".join(map(str, range(40))) + "]"]
+    for source in sources:
+        assert run_program(evaluate, source) == run_program(evaluator.evaluate, source), source
+
+    # a compiled program can be run again, in other environments
+    run = compile(parse(tokenize("function f(x) { return x + y }; z = f(1)")))
+    for y in [1, 2]:
+        environment = {"y": y}
+        assert run(environment) == (y + 1, None) and environment["z"] == y + 1
+
+    # deep nesting and recursion run with the explicit-stack evaluator
+    code = "if (x == 0) { y = 0 }" + "".join(f" else if (x == {i}) {{ y = {i} }}" for i in range(1, 2000))
+    environment = {"x": 1999}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["y"] == 1999
+    code = "function f(n) { if (n == 0) { return 0 }; return 1 + f(n - 1) }; x = f(5000); y = f(10)"
+    environment = {}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["x"] == 5000 and environment["y"] == 10 and frames == 0
+
+
+def test_evaluator_tests():
+    print("testing compile with the evaluator's tests...")
+    import evaluator
+
+    tests = [value for name, value in vars(evaluator).items() if name.startswith("test_")]
+    saved = evaluator.evaluate
+    evaluator.evaluate = evaluate
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for test in tests:
+                test()
+    finally:
+        evaluator.evaluate = saved
+
+
+if __name__ == "__main__":
+    print("testing closures.")
+    test_compile()
+    test_evaluator_tests()
+    print("done.")
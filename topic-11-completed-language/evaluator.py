@@ -1,7 +1,12 @@
-from tokenizer import tokenize
-from parser import parse
+from tokenizer import tokenize, LineIndex
+from parser import parse, parse_statements_lazily, run_steps, token_view
+from nodes import node, intern
 from pprint import pprint
 import copy
+import contextlib
+import io
+import json
+import operator
 
 def type_of(*args):
     def single_type(x):
@@ -27,6 +32,24 @@ def is_truthy(x):
         return False
     return True
 
+def copy_constant(ast):
+    # a new copy of the prebuilt value of a constant node, since the program
+    # can change and share it like any list or object. lists and objects
+    # can't share their contents copy-on-write, but copying them is a C loop
+    # per container instead of evaluating a node per element.
+    value = ast.value.copy()
+    if not ast.nested:
+        return value
+    stack = [value]
+    while stack:
+        container = stack.pop()
+        for key, item in enumerate(container) if type(container) is list else container.items():
+            if type(item) is list or type(item) is dict:
+                item = item.copy()
+                container[key] = item
+                stack.append(item)
+    return value
+
 def ast_to_string(ast):
     s = ""
     if ast["tag"] == "number":
@@ -48,6 +71,8 @@ def ast_to_string(ast):
             value = ast_to_string(item["value"])
             items.append(f"{key}:{value}")
         return "{" + ",".join(items) + "}"
+    if ast["tag"] == "constant":
+        return json.dumps(ast["value"], separators=(",", ":"))
     if ast["tag"] == "identifier":
         return str(ast["value"])
     if ast["tag"] in ["+","-","/","*","^","&&","||","and","or","<",">","<=",">=","==","!="]:
@@ -138,287 +163,678 @@ def evaluate_builtin_function(function_name, args):
 
     assert False, f"Unknown builtin function '{function_name}'"
 
-def evaluate(ast, environment):
-    if ast["tag"] == "number":
-        assert type(ast["value"]) in [
-            float,
-            int,
-        ], f"unexpected type {type(ast['value'])}"
-        return ast["value"], None
-    if ast["tag"] == "boolean":
-        assert ast["value"] in [
-            True,
-            False,
-        ], f"unexpected type {type(ast['value'])}"
-        return ast["value"], None
-    if ast["tag"] == "string":
-        assert type(ast["value"]) == str, f"unexpected type {type(ast['value'])}"
-        return ast["value"], None
-    if ast["tag"] == "null":
-        return None, None
-    if ast["tag"] == "list":
+# how deeply execute() calls itself before it hands the rest of a subtree to
+# the explicit-stack evaluator, well within Python's default recursion limit
+# at two frames (execute() and the handler) per level
+evaluate_depth_limit = 200
+
+
+# CONTROL FLOW
+
+# The handlers return the value of their node, except that a statement that
+# leaves the statements around it, which for now is return, gives a Signal.
+# Only the handlers of statements that contain statements check for one, so
+# expressions, which are most of the nodes evaluated, return bare values and
+# don't allocate or unpack an exit status. evaluate() keeps the original
+# (value, exit_status) interface, for the runner, the tests and the other
+# engines, on top of execute().
+
+
+class Signal:
+    # kind is "return", or "tail" for a tail call (see TAIL CALLS)
+    __slots__ = ("kind", "value")
+
+    def __init__(self, kind, value):
+        self.kind = kind
+        self.value = value
+
+
+# the exit status evaluate() gives with the value of a node that didn't
+# return, if it isn't None
+exit_statuses = {"if": False, "while": False, "function": False, "complex": False}
+
+
+def evaluate(ast, environment, depth=0):
+    if depth > evaluate_depth_limit:
+        return run_steps(evaluate_steps(ast, environment))
+    tag = ast.tag
+    if tag == "program" or tag == "statement_list":
+        # the exit status is the last statement's
+        statements = ast.statements
+        for statement in statements[:-1]:
+            value = execute(statement, environment, depth + 1)
+            if type(value) is Signal:
+                return value.value, value.kind
+        if not statements:
+            return None, None
+        return evaluate(statements[-1], environment, depth + 1)
+    if tag == "call":
+        # None for a builtin function, and False for a function
+        function = execute(ast.function, environment, depth + 1)
+        argument_values = [execute(arg, environment, depth + 1) for arg in ast.arguments]
+        if function.get("tag") == "builtin":
+            return evaluate_builtin_function(function["name"], argument_values)
+        return call_function(function, argument_values, environment, depth), False
+    value = execute(ast, environment, depth)
+    if type(value) is Signal:
+        return value.value, value.kind
+    return value, exit_statuses.get(tag)
+
+
+# TAG DISPATCH
+
+# execute() looks up the handler for a node's tag in evaluators, so a return
+# or an assignment costs one dict lookup instead of comparing its tag with
+# every tag before it. Each handler takes (ast, environment, depth) and
+# returns the node's value, or a Signal, like execute().
+
+
+def execute(ast, environment, depth=0):
+    if depth > evaluate_depth_limit:
+        value, exit_status = run_steps(evaluate_steps(ast, environment))
+        if exit_status == "return":
+            return Signal("return", value)
+        return value
+    return evaluators.get(ast.tag, evaluate_unknown)(ast, environment, depth)
+
+
+def evaluate_unknown(ast, environment, depth):
+    assert False, f"Unknown tag [{ast.tag}] in AST"
+
+
+def evaluate_number(ast, environment, depth):
+    assert type(ast.value) in [
+        float,
+        int,
+    ], f"unexpected type {type(ast.value)}"
+    return ast.value
+
+
+def evaluate_boolean(ast, environment, depth):
+    assert ast.value in [
+        True,
+        False,
+    ], f"unexpected type {type(ast.value)}"
+    return ast.value
+
+
+def evaluate_string(ast, environment, depth):
+    assert type(ast.value) == str, f"unexpected type {type(ast.value)}"
+    return ast.value
+
+
+def evaluate_null(ast, environment, depth):
+    return None
+
+
+def evaluate_list(ast, environment, depth):
+    items = []
+    for item in ast.items:
+        items.append(execute(item, environment, depth + 1))
+    return items
+
+
+def evaluate_object(ast, environment, depth):
+    object = {}
+    for item in ast.items:
+        key = execute(item["key"], environment, depth + 1)
+        assert type(key) is str, "Object key must be a string"
+        object[key] = execute(item["value"], environment, depth + 1)
+    return object
+
+
+def evaluate_constant(ast, environment, depth):
+    return copy_constant(ast)
+
+
+def evaluate_identifier(ast, environment, depth):
+    identifier = ast.value
+    if identifier in environment:
+        return environment[identifier]
+    if "$parent" in environment:
+        return execute(ast, environment["$parent"], depth + 1)
+    if identifier in __builtin_functions:
+        return {"tag": "builtin", "name": identifier}
+    raise Exception(f"Unknown identifier: '{identifier}'")
+
+
+def evaluate_add(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    types = type_of(left_value, right_value)
+    if types == "number-number":
+        return left_value + right_value
+    if types == "string-string":
+        return left_value + right_value
+    if types == "object-object":
+        return {**left_value, **right_value}
+    if types == "array-array":
+        return left_value + right_value
+    raise Exception(f"Illegal types for {ast.tag}: {types}")
+
+
+def evaluate_subtract(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    types = type_of(left_value, right_value)
+    if types == "number-number":
+        return left_value - right_value
+    raise Exception(f"Illegal types for {ast.tag}:{types}")
+
+
+def evaluate_power(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    types = type_of(left_value, right_value)
+    if types == "number-number":
+        return left_value ** right_value
+    if types == "string-number":
+        return left_value ** int(right_value)
+    if types == "number-string":
+        return right_value ** int(left_value)
+    raise Exception(f"Illegal types for {ast.tag}:{types}")
+
+
+def evaluate_multiply(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    types = type_of(left_value, right_value)
+    if types == "number-number":
+        return left_value * right_value
+    if types == "string-number":
+        return left_value * int(right_value)
+    if types == "number-string":
+        return right_value * int(left_value)
+    raise Exception(f"Illegal types for {ast.tag}:{types}")
+
+
+def evaluate_divide(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    types = type_of(left_value, right_value)
+    if types == "number-number":
+        assert right_value != 0, "Division by zero"
+        return left_value / right_value
+    raise Exception(f"Illegal types for {ast.tag}:{types}")
+
+
+def evaluate_negate(ast, environment, depth):
+    value = execute(ast.value, environment, depth + 1)
+    types = type_of(value)
+    if types == "number":
+        return -value
+    raise Exception(f"Illegal type for {ast.tag}:{types}")
+
+
+def evaluate_and(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    return is_truthy(left_value) and is_truthy(right_value)
+
+
+def evaluate_or(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    return is_truthy(left_value) or is_truthy(right_value)
+
+
+def evaluate_not(ast, environment, depth):
+    return not is_truthy(execute(ast.value, environment, depth + 1))
+
+
+comparisons = {"<": operator.lt, ">": operator.gt, "<=": operator.le, ">=": operator.ge}
+
+
+def evaluate_comparison(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    types = type_of(left_value, right_value)
+    if types not in ["number-number", "string-string"]:
+        raise Exception(f"Illegal types for {ast.tag}: {types}")
+    return comparisons[ast.tag](left_value, right_value)
+
+
+def evaluate_equal(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    return left_value == right_value
+
+
+def evaluate_not_equal(ast, environment, depth):
+    left_value = execute(ast.left, environment, depth + 1)
+    right_value = execute(ast.right, environment, depth + 1)
+    return left_value != right_value
+
+
+def evaluate_print(ast, environment, depth):
+    if ast.value:
+        value = execute(ast.value, environment, depth + 1)
+        if type(value) is bool:
+            if value == True:
+                value = "true"
+            if value == False:
+                value = "false"
+        print(str(value))
+        return str(value) + "\n"
+    else:
+        print()
+    return "\n"
+
+
+def evaluate_assert(ast, environment, depth):
+    if ast.condition:
+        value = execute(ast.condition, environment, depth + 1)
+        if not(value):
+            raise(Exception("Assertion failed:",ast_to_string(ast.condition)))
+    return "\n"
+
+
+def evaluate_if(ast, environment, depth):
+    if execute(ast.condition, environment, depth + 1):
+        value = execute(ast.then, environment, depth + 1)
+        if type(value) is Signal:
+            return value
+    else:
+        if hasattr(ast, "else"):
+            value = execute(getattr(ast, "else"), environment, depth + 1)
+            if type(value) is Signal:
+                return value
+    return None
+
+
+def evaluate_while(ast, environment, depth):
+    while execute(ast.condition, environment, depth + 1):
+        value = execute(ast.do, environment, depth + 1)
+        if type(value) is Signal:
+            return value
+    return None
+
+
+def evaluate_statement_list(ast, environment, depth):
+    # also the program node, which evaluates the same way
+    value = None
+    for statement in ast.statements:
+        value = execute(statement, environment, depth + 1)
+        if type(value) is Signal:
+            return value
+    return value
+
+
+def evaluate_function(ast, environment, depth):
+    # function values are dicts, which the language treats as objects
+    return ast.as_dict()
+
+
+def evaluate_call(ast, environment, depth):
+    function = execute(ast.function, environment, depth + 1)
+    argument_values = [execute(arg, environment, depth + 1) for arg in ast.arguments]
+
+    if function.get("tag") == "builtin":
+        return evaluate_builtin_function(function["name"], argument_values)[0]
+
+    return call_function(function, argument_values, environment, depth)
+
+
+def call_function(function, argument_values, environment, depth):
+    # the value a regular function returns, called in environment
+    local_environment = {
+        name["value"]: val
+        for name, val in zip(function["parameters"], argument_values)
+    }
+    local_environment["$parent"] = environment
+    value = evaluate_body(function["body"], local_environment, depth + 1)
+    while type(value) is Signal:
+        if value.kind == "return":
+            return value.value
+        # return g(...): run g in this frame, at this depth
+        function, argument_values = value.value
+        for name, val in zip(function["parameters"], argument_values):
+            local_environment[name["value"]] = val
+        value = evaluate_body(function["body"], local_environment, depth + 1)
+    return None
+
+
+def evaluate_complex(ast, environment, depth):
+    base = execute(ast.base, environment, depth + 1)
+    index = execute(ast.index, environment, depth + 1)
+    if index == None:
+        return base
+    if type(index) in [int, float]:
+        assert int(index) == index, "List index must be integer"
+        assert type(base) == list, f"Cannot index base of type {type(base)}"
+        assert len(base) > index, "List index out of range"
+        return base[index]
+    if type(index) == str:
+        assert type(base) == dict, f"Cannot index base of type {type(base)}"
+        return base[index]
+    assert False, f"Unknown index type [{index}]"
+
+
+def evaluate_assign(ast, environment, depth):
+    target = ast.target
+    if target.tag == "identifier":
+        target_base = environment
+        target_index = target.value
+    elif target.tag == "complex":
+        base = execute(target.base, environment, depth + 1)
+        index_ast = target.index
+
+        if index_ast.tag == "string":
+            # direct property (like x.bar)
+            index = index_ast.value
+        else:
+            # evaluated property (like x["bar"])
+            index = execute(index_ast, environment, depth + 1)
+
+        assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+
+        if isinstance(base, list):
+            assert isinstance(index, int), "List index must be integer"
+            assert 0 <= index < len(base), "List index out of range"
+            target_base = base
+            target_index = index
+        elif isinstance(base, dict):
+            target_base = base
+            target_index = index
+        else:
+            assert False, f"Cannot assign to base of type {type(base)}"
+    else:
+        invalid_assignment_target(target)
+    value = execute(ast.value, environment, depth + 1)
+    target_base[target_index] = value
+    return value
+
+
+def invalid_assignment_target(target):
+    # the parser takes any expression before "=", like 1 = 2 or f() = 2, so
+    # the evaluator and the other engines check the target when it is assigned
+    raise Exception(f"Invalid assignment target [{target.tag}]")
+
+
+def evaluate_return(ast, environment, depth):
+    if hasattr(ast, "value"):
+        return Signal("return", execute(ast.value, environment, depth + 1))
+    return Signal("return", None)
+
+
+evaluators = {
+    "number": evaluate_number,
+    "boolean": evaluate_boolean,
+    "string": evaluate_string,
+    "null": evaluate_null,
+    "list": evaluate_list,
+    "object": evaluate_object,
+    "constant": evaluate_constant,
+    "identifier": evaluate_identifier,
+    "+": evaluate_add,
+    "-": evaluate_subtract,
+    "^": evaluate_power,
+    "*": evaluate_multiply,
+    "/": evaluate_divide,
+    "negate": evaluate_negate,
+    "&&": evaluate_and,
+    "and": evaluate_and,
+    "||": evaluate_or,
+    "or": evaluate_or,
+    "!": evaluate_not,
+    "not": evaluate_not,
+    "<": evaluate_comparison,
+    ">": evaluate_comparison,
+    "<=": evaluate_comparison,
+    ">=": evaluate_comparison,
+    "==": evaluate_equal,
+    "!=": evaluate_not_equal,
+    "print": evaluate_print,
+    "assert": evaluate_assert,
+    "if": evaluate_if,
+    "while": evaluate_while,
+    "statement_list": evaluate_statement_list,
+    "program": evaluate_statement_list,
+    "function": evaluate_function,
+    "call": evaluate_call,
+    "complex": evaluate_complex,
+    "assign": evaluate_assign,
+    "return": evaluate_return,
+}
+
+
+# TAIL CALLS
+
+# A call in a return statement is the last thing its function does, so
+# call_function() runs function bodies with evaluate_body(), which is
+# execute() except that return f(...) evaluates f and its arguments and gives
+# a "tail" Signal of (f, argument values), instead of calling f.
+# call_function() then runs f's body in a loop, so tail recursion doesn't nest
+# Python calls. Since assignments only write to the current frame and
+# function values don't keep an environment, the caller's frame is only read
+# by lookups from f's body after that, and binding f's parameters in the
+# caller's frame, over its variables, gives the same lookups as a new frame
+# whose parent is the caller's. So the frame is reused, and the chain of
+# frames that lookups walk doesn't grow either.
+
+
+def evaluate_body(ast, environment, depth):
+    if depth > evaluate_depth_limit:
+        return execute(ast, environment, depth)
+    return body_evaluators.get(ast.tag, execute)(ast, environment, depth)
+
+
+def evaluate_body_if(ast, environment, depth):
+    if execute(ast.condition, environment, depth + 1):
+        value = evaluate_body(ast.then, environment, depth + 1)
+        if type(value) is Signal:
+            return value
+    else:
+        if hasattr(ast, "else"):
+            value = evaluate_body(getattr(ast, "else"), environment, depth + 1)
+            if type(value) is Signal:
+                return value
+    return None
+
+
+def evaluate_body_while(ast, environment, depth):
+    while execute(ast.condition, environment, depth + 1):
+        value = evaluate_body(ast.do, environment, depth + 1)
+        if type(value) is Signal:
+            return value
+    return None
+
+
+def evaluate_body_statement_list(ast, environment, depth):
+    value = None
+    for statement in ast.statements:
+        value = evaluate_body(statement, environment, depth + 1)
+        if type(value) is Signal:
+            return value
+    return value
+
+
+def evaluate_body_return(ast, environment, depth):
+    if not hasattr(ast, "value") or ast.value.tag != "call":
+        return evaluate_return(ast, environment, depth)
+    call = ast.value
+    function = execute(call.function, environment, depth + 1)
+    argument_values = [execute(arg, environment, depth + 1) for arg in call.arguments]
+    if function.get("tag") == "builtin":
+        return Signal("return", evaluate_builtin_function(function["name"], argument_values)[0])
+    return Signal("tail", (function, argument_values))
+
+
+body_evaluators = {
+    "if": evaluate_body_if,
+    "while": evaluate_body_while,
+    "statement_list": evaluate_body_statement_list,
+    "return": evaluate_body_return,
+}
+
+
+# EXPLICIT-STACK EVALUATION
+
+# evaluate_steps() is evaluate() as a generator for run_steps(): it yields the
+# generator for each child it evaluates and is sent the child's (value,
+# exit_status), so nesting and calls don't use Python's stack. It only
+# handles the nodes that evaluate children. The operators are applied by
+# evaluate() itself, to nodes whose operands are identifiers bound to the
+# operand values, so both evaluators share their semantics.
+
+def operand(name):
+    return node("identifier", value="$" + name)
+
+
+binary_operations = {
+    tag: node(tag, left=operand("left"), right=operand("right"))
+    for tag in ["+", "-", "*", "/", "^", "<", ">", "<=", ">=", "==", "!=", "&&", "||"]
+}
+unary_operations = {tag: node(tag, value=operand("value")) for tag in ["negate", "not", "print"]}
+index_operation = node("complex", base=operand("base"), index=operand("index"))
+index_assignment = node("assign", target=index_operation, value=operand("value"))
+
+
+def evaluate_steps(ast, environment):
+    tag = ast.tag
+    if tag in binary_operations:
+        left_value, _ = yield evaluate_steps(ast.left, environment)
+        right_value, _ = yield evaluate_steps(ast.right, environment)
+        return evaluate(binary_operations[tag], {"$left": left_value, "$right": right_value})
+
+    if tag in unary_operations and ast.value:
+        value, _ = yield evaluate_steps(ast.value, environment)
+        return evaluate(unary_operations[tag], {"$value": value})
+
+    if tag == "identifier":
+        # follow "$parent" links in a loop, rather than a call per link
+        while ast.value not in environment and "$parent" in environment:
+            environment = environment["$parent"]
+        return evaluate(ast, environment)
+
+    if tag == "list":
         items = []
-        for item in ast["items"]:
-            result, _ = evaluate(item, environment)
+        for item in ast.items:
+            result, _ = yield evaluate_steps(item, environment)
             items.append(result)
-        return items, None        
-    if ast["tag"] == "object":
+        return items, None
+
+    if tag == "object":
         object = {}
-        for item in ast["items"]:
-            key, _ = evaluate(item["key"], environment)
+        for item in ast.items:
+            key, _ = yield evaluate_steps(item["key"], environment)
             assert type(key) is str, "Object key must be a string"
-            value, _ = evaluate(item["value"], environment)
+            value, _ = yield evaluate_steps(item["value"], environment)
             object[key] = value
-        return object, None        
+        return object, None
 
-    if ast["tag"] == "identifier":
-        identifier = ast["value"]
-        if identifier in environment:
-            return environment[identifier], None
-        if "$parent" in environment:
-            return evaluate(ast, environment["$parent"])
-        if identifier in __builtin_functions:
-            return {"tag": "builtin", "name": identifier}, None
-        raise Exception(f"Unknown identifier: '{identifier}'")
-    if ast["tag"] == "+":
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            return left_value + right_value, None
-        if types == "string-string":
-            return left_value + right_value, None
-        if types == "object-object":
-            return {**left_value, **right_value}, None
-        if types == "array-array":
-            return left_value + right_value, None
-        raise Exception(f"Illegal types for {ast['tag']}: {types}")
-    if ast["tag"] == "-":
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            return left_value - right_value, None
-        raise Exception(f"Illegal types for {ast['tag']}:{types}")
-
-    if ast["tag"] == "^":
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            return left_value ** right_value, None
-        if types == "string-number":
-            return left_value ** int(right_value), None
-        if types == "number-string":
-            return right_value ** int(left_value), None
-        raise Exception(f"Illegal types for {ast['tag']}:{types}")
-    
-    if ast["tag"] == "*":
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            return left_value * right_value, None
-        if types == "string-number":
-            return left_value * int(right_value), None
-        if types == "number-string":
-            return right_value * int(left_value), None
-        raise Exception(f"Illegal types for {ast['tag']}:{types}")
-
-    if ast["tag"] == "/":
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            assert right_value != 0, "Division by zero"
-            return left_value / right_value, None
-        raise Exception(f"Illegal types for {ast['tag']}:{types}")
-    
-    if ast["tag"] == "negate":
-        value, _ = evaluate(ast["value"], environment)
-        types = type_of(value)
-        if types == "number":
-            return -value, None
-        raise Exception(f"Illegal type for {ast['tag']}:{types}")
-
-    if ast["tag"] in ["&&", "and"]:
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        return is_truthy(left_value) and is_truthy(right_value), None
-
-    if ast["tag"] in ["||", "or"]:
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        return is_truthy(left_value) or is_truthy(right_value), None
-
-    if ast["tag"] in ["!", "not"]:
-        value, _ = evaluate(ast["value"], environment)
-        return not is_truthy(value), None
-
-    if ast["tag"] in ["<", ">", "<=", ">="]:
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        types = type_of(left_value, right_value)
-        if types not in ["number-number", "string-string"]:
-            raise Exception(f"Illegal types for {ast['tag']}: {types}")
-        if ast["tag"] == "<":
-            return left_value < right_value, None
-        if ast["tag"] == ">":
-            return left_value > right_value, None
-        if ast["tag"] == "<=":
-            return left_value <= right_value, None
-        if ast["tag"] == ">=":
-            return left_value >= right_value, None
-
-    if ast["tag"] == "==":
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        return left_value == right_value, None
-    
-    if ast["tag"] == "!=":
-        left_value, _ = evaluate(ast["left"], environment)
-        right_value, _ = evaluate(ast["right"], environment)
-        return left_value != right_value, None
-
-    if ast["tag"] == "print":
-        if ast["value"]:
-            value, _ = evaluate(ast["value"], environment)
-            if type(value) is bool:
-                if value == True:
-                    value = "true"
-                if value == False:
-                    value = "false"
-            print(str(value))
-            return str(value) + "\n", None
-        else:
-            print()
-        return "\n", None
-
-    if ast["tag"] == "assert":
-        if ast["condition"]:
-            value, _ = evaluate(ast["condition"], environment)
+    if tag == "assert":
+        if ast.condition:
+            value, _ = yield evaluate_steps(ast.condition, environment)
             if not(value):
-                raise(Exception("Assertion failed:",ast_to_string(ast["condition"])))
+                raise(Exception("Assertion failed:",ast_to_string(ast.condition)))
         return "\n", None
 
-    if ast["tag"] == "if":
-        condition, _ = evaluate(ast["condition"], environment)
+    if tag == "if":
+        condition, _ = yield evaluate_steps(ast.condition, environment)
         if condition:
-            value, exit_status = evaluate(ast["then"], environment)
+            value, exit_status = yield evaluate_steps(ast.then, environment)
+            if exit_status:
+                return value, exit_status
+        elif hasattr(ast, "else"):
+            value, exit_status = yield evaluate_steps(getattr(ast, "else"), environment)
             if exit_status:
                 return value, exit_status
-        else:
-            if "else" in ast:
-                value, exit_status = evaluate(ast["else"], environment)
-                if exit_status:
-                    return value, exit_status
         return None, False
 
-    if ast["tag"] == "while":
-        condition_value, exit_status = evaluate(ast["condition"], environment)
+    if tag == "while":
+        condition_value, exit_status = yield evaluate_steps(ast.condition, environment)
         if exit_status:
             return condition_value, exit_status
         while condition_value:
-            value, exit_status = evaluate(ast["do"], environment)
+            value, exit_status = yield evaluate_steps(ast.do, environment)
             if exit_status:
                 return value, exit_status
-            condition_value, exit_status = evaluate(ast["condition"], environment)
+            condition_value, exit_status = yield evaluate_steps(ast.condition, environment)
             if exit_status:
                 return condition_value, exit_status
         return None, False
 
-    if ast["tag"] == "statement_list":
-        for statement in ast["statements"]:
-            value, exit_status = evaluate(statement, environment)
-            if exit_status:
-                return value, exit_status
-        return value, exit_status
-
-    if ast["tag"] == "program":
-        for statement in ast["statements"]:
-            value, exit_status = evaluate(statement, environment)
+    if tag in ["statement_list", "program"]:
+        value, exit_status = None, None
+        for statement in ast.statements:
+            value, exit_status = yield evaluate_steps(statement, environment)
             if exit_status:
                 return value, exit_status
         return value, exit_status
 
-    if ast["tag"] == "function":
-        return ast, False
-
-    if ast["tag"] == "call":
-        function, _ = evaluate(ast["function"], environment)
-        argument_values = [evaluate(arg, environment)[0] for arg in ast["arguments"]]
-
+    if tag == "call":
+        function, _ = yield evaluate_steps(ast.function, environment)
+        argument_values = []
+        for argument in ast.arguments:
+            value, _ = yield evaluate_steps(argument, environment)
+            argument_values.append(value)
         if function.get("tag") == "builtin":
             return evaluate_builtin_function(function["name"], argument_values)
-        
-        # regular function call:
         local_environment = {
             name["value"]: val
             for name, val in zip(function["parameters"], argument_values)
         }
         local_environment["$parent"] = environment
-        value, exit_status = evaluate(function["body"], local_environment)
+        value, exit_status = yield evaluate_steps(function["body"], local_environment)
         if exit_status:
             return value, False
-        else:
-            return None, False
-
-
-    if ast["tag"] == "complex":
-        base, _ = evaluate(ast["base"], environment)
-        index, _ = evaluate(ast["index"], environment)
-        if index == None:
-            return base, False
-        if type(index) in [int, float]:
-            assert int(index) == index
-            assert type(base) == list
-            assert len(base) > index
-            return base[index], False
-        if type(index) == str:
-            assert type(base) == dict
-            return base[index], False
-        assert False, f"Unknown index type [{index}]"
+        return None, False
 
-    if ast["tag"] == "assign":
-        assert "target" in ast
-        target = ast["target"]
-        if target["tag"] == "identifier":
-            target_base = environment
-            target_index = target["value"] 
-        elif target["tag"] == "complex":
-            base, _ = evaluate(target["base"], environment)
-            index_ast = target["index"]
-            
-            if index_ast["tag"] == "string":
-                # direct property (like x.bar)
-                index = index_ast["value"]
-            else:
-                # evaluated property (like x["bar"])
-                index, _ = evaluate(index_ast, environment)
-            
-            assert type(index) in [int, float, str], f"Unknown index type [{index}]"
-        
-            if isinstance(base, list):
-                assert isinstance(index, int), "List index must be integer"
-                assert 0 <= index < len(base), "List index out of range"
-                target_base = base
-                target_index = index
-            elif isinstance(base, dict):
-                target_base = base
-                target_index = index
-            else:
-                assert False, f"Cannot assign to base of type {type(base)}"
-        value, _ = evaluate(ast["value"], environment)
-        target_base[target_index] = value
+    if tag == "complex":
+        base, _ = yield evaluate_steps(ast.base, environment)
+        index, _ = yield evaluate_steps(ast.index, environment)
+        return evaluate(index_operation, {"$base": base, "$index": index})
+
+    if tag == "assign":
+        target = ast.target
+        if target.tag == "complex":
+            base, _ = yield evaluate_steps(target.base, environment)
+            index, _ = yield evaluate_steps(target.index, environment)
+            value, _ = yield evaluate_steps(ast.value, environment)
+            return evaluate(index_assignment, {"$base": base, "$index": index, "$value": value})
+        if target.tag != "identifier":
+            invalid_assignment_target(target)
+        value, _ = yield evaluate_steps(ast.value, environment)
+        environment[target.value] = value
         return value, None
 
-    if ast["tag"] == "return":
-        if "value" in ast:
-            value, exit_status = evaluate(ast["value"], environment)
+    if tag == "return":
+        if hasattr(ast, "value"):
+            value, exit_status = yield evaluate_steps(ast.value, environment)
             return value, "return"
         return None, "return"
 
-    assert False, f"Unknown tag [{ast['tag']}] in AST"
+    # literals, and nodes without children
+    return evaluate(ast, environment)
+
+
+def evaluate_program(ast, environment, positions, lines, evaluate=evaluate):
+    """
+    Evaluates a program like evaluate(), but reports errors with the line and
+    column of the top-level statement that raised them. positions are the
+    statement start positions recorded by parse(), and lines is the LineIndex
+    of the source. evaluate can be another engine's evaluate(), such as
+    closures.evaluate().
+    """
+    return evaluate_statements(zip(ast.statements, positions), environment, lines, evaluate)
+
+
+def evaluate_statements(statements, environment, lines, evaluate=evaluate):
+    """
+    Evaluates (statement, start position) pairs in order, as evaluate_program()
+    does. statements can be parse_statements_lazily(), to run each statement
+    as soon as it is parsed.
+    """
+    value, exit_status = None, None
+    for statement, position in statements:
+        try:
+            value, exit_status = evaluate(statement, environment)
+        except Exception as e:
+            raise Exception(f"{e} (in statement at {lines.describe(position)})") from e
+        if exit_status:
+            break
+    return value, exit_status
 
 
 def equals(code, environment, expected_result, expected_environment=None):
@@ -751,6 +1167,211 @@ def test_evaluator_with_new_tags():
     equals("if(1){x=1; y=2;}", {}, None, {"x":1,"y":2})
     equals("if(1){x=1; if(false) {z=4} y=2;}", {}, None, {"x":1,"y":2})
 
+def test_evaluate_program():
+    print("test evaluate_program")
+    code = "x = 1;\nif (x) {\n  y = x + 1\n};\nz = x + \"a\";\nprint z"
+    lines = LineIndex()
+    positions = []
+    ast = parse(tokenize(code, lines=lines), positions)
+    environment = {}
+    try:
+        evaluate_program(ast, environment, positions, lines)
+        assert False, "Should have an exception."
+    except Exception as e:
+        assert str(e) == "Illegal types for +: number-string (in statement at line 5, column 1)", str(e)
+    assert environment == {"x": 1, "y": 2}
+    positions = []
+    ast = parse(tokenize("x = 3; x + 1", lines=lines), positions)
+    assert evaluate_program(ast, {}, positions, lines) == evaluate(ast, {})
+
+def test_evaluate_statements():
+    print("test evaluate_statements")
+    # each statement runs before the next one is parsed
+    code = "x = 1;\nprint x + 1;\nfunction f() { return x };\ny = f() +"
+    lines = LineIndex()
+    statements = parse_statements_lazily(token_view(tokenize(code, lines=lines), lines))
+    environment = {}
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        try:
+            evaluate_statements(statements, environment, lines)
+            assert False, "Should have a syntax error."
+        except Exception as e:
+            # the first line, since pytest adds an explanation to a failed assert's message
+            assert str(e).split("\n")[0] == "Unexpected token 'None' at line 4, column 10", str(e)
+    assert output.getvalue() == "2\n" and environment["x"] == 1 and "f" in environment
+    # a return at the top level stops the program
+    statements = parse_statements_lazily(tokenize("x = 1; return 2; x = 3"))
+    environment = {}
+    assert evaluate_statements(statements, environment, LineIndex()) == (2, "return")
+    assert environment == {"x": 1}
+
+
+def test_evaluate_interned():
+    print("test evaluate of interned programs")
+    # sharing equal subtrees doesn't change what a program does
+    for name in ["basic-test.t", "feature-test.t"]:
+        with open(name) as f:
+            source = f.read()
+        results = []
+        for ast in [parse(tokenize(source)), intern(parse(tokenize(source)))]:
+            environment = {}
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                value = evaluate(ast, environment)
+            results.append((value, environment, output.getvalue()))
+        assert results[0] == results[1], name
+    # a shared function body is called with each caller's own environment
+    code = "function f(x) { y = x; return x * 2 }; a = {}; a.b = f(1); c = {}; c.b = f(2); d = [f(3), f(3)]"
+    environment = {}
+    evaluate(intern(parse(tokenize(code))), environment)
+    assert environment["a"] == {"b": 2} and environment["c"] == {"b": 4} and environment["d"] == [6, 6]
+
+
+def test_evaluate_constant():
+    print("test evaluate of bulk literals")
+    # a bulk literal is prebuilt, and each evaluation gets its own copy
+    records = "".join(f'{{"id": {i}, "tags": ["a", "b"], "ok": true, "up": null, "score": -{i}.5}}, ' for i in range(10))
+    code = f"function f() {{ return [{records}] }}; a = f(); a[0].tags[0] = \"c\"; a[1] = 0; b = f()"
+    ast = parse(tokenize(code))
+    assert ast.statements[0].value.body.statements[0].value.tag == "constant"
+    environment = {}
+    evaluate(ast, environment)
+    expected = [{"id": i, "tags": ["a", "b"], "ok": True, "up": None, "score": -i - 0.5} for i in range(10)]
+    assert environment["b"] == expected
+    assert environment["a"][0]["tags"] == ["c", "b"] and environment["a"][1] == 0
+    assert environment["b"][0]["tags"] == ["a", "b"] and environment["b"][0] is not environment["a"][0]
+    # flat constants, and constants in the explicit-stack evaluator
+    code = "x = [" + ", ".join(map(str, range(50))) + "]; x[0] = 1; y = [" + ", ".join(map(str, range(50))) + "]"
+    environment = {}
+    run_steps(evaluate_steps(parse(tokenize(code)), environment))
+    assert environment["x"][0] == 1 and environment["y"] == list(range(50))
+    try:
+        evaluate(parse(tokenize("assert [" + ", ".join(map(str, range(50))) + "] == 1")), {})
+        assert False, "Should have an exception."
+    except Exception as e:
+        assert "[0,1,2,3" in str(e), str(e)
+
+
+def test_evaluate_results():
+    print("test evaluate values, exit statuses and errors")
+    # programs ending with each kind of node: their (value, exit_status), the
+    # variables they set and what they print
+    for source, result, variables, output in [
+        ("function f(x) { if (x > 2) { return x } else { return f(x + 1) } }; y = f(0)", (3, None), {"y": 3}, ""),
+        ("function f() { while (1) { return 3 } }; x = f(); if (0) { y = 1 }; while (0) { }", (None, False), {"x": 3}, ""),
+        ("x = [1, {\"a\": 2}]; x[1].b = !1 || 0 && 1", (False, None), {"x": [1, {"a": 2, "b": False}]}, ""),
+        ("y = -1 ^ 2 * 3 / 4 - 5; z = \"a\" * 2 <= \"b\"", (True, None), {"y": -4.25, "z": True}, ""),
+        ("print; print 1 != 2; assert 1 == 1; x = length([1]) + head(tail([1, 2]))", (3, None), {"x": 3}, "\ntrue\n"),
+        ("return 1; x = 2", (1, "return"), {}, ""),
+        ("function f() { return 1 }; f()", (1, False), {}, ""),
+        ("length([1, 2])", (2, None), {}, ""),
+        ("x = [1]; x[0]", (1, False), {"x": [1]}, ""),
+        ("", (None, None), {}, ""),
+        ("function f(x) { return length(x) }; f([1])", (1, False), {}, ""),
+        ("if (1) { 2 }", (None, False), {}, ""),
+        ("i = 0; while (i < 2) { i = i + 1 }", (None, False), {"i": 2}, ""),
+    ]:
+        environment = {}
+        with contextlib.redirect_stdout(io.StringIO()) as printed:
+            assert evaluate(parse(tokenize(source)), environment) == result, source
+        assert {name: environment[name] for name in variables} == variables, source
+        assert printed.getvalue() == output, source
+    ast = parse(tokenize("function f() { }"))
+    assert evaluate(ast, {}) == (ast.statements[0].value.as_dict(), None)
+
+    for source, error, message in [
+        ("x = [1, {\"a\": 2}]; x[1].b = !x[0] || 0 && 1", AssertionError, "Cannot index base of type <class 'bool'>"),
+        ("x = 1 + \"a\"", Exception, "Illegal types for +: number-string"),
+        ("x = {1: 2}", AssertionError, "Object key must be a string"),
+        ("assert 1 == 2", Exception, "('Assertion failed:', '(1==2)')"),
+        ("x = [1][2]", AssertionError, "List index out of range"),
+        ("y = z", Exception, "Unknown identifier: 'z'"),
+        ("x = 1; x.y = 2", AssertionError, "Cannot assign to base of type <class 'int'>"),
+        ("break", AssertionError, "Unknown tag [break] in AST"),
+        ("1 = 2", Exception, "Invalid assignment target [number]"),
+        ("x = 1; f() = x", Exception, "Invalid assignment target [call]"),
+    ]:
+        try:
+            evaluate(parse(tokenize(source)), {})
+            assert False, f"Should have an exception: {source}"
+        except Exception as e:
+            # the first line, since pytest adds an explanation to a failed assert's message
+            assert type(e) is error and str(e).split("\n")[0] == message, source
+
+
+def test_evaluate_deeply_nested():
+    print("test evaluate of deeply nested programs")
+    # the explicit-stack evaluator gives the same results as the recursive one
+    for name in ["basic-test.t", "feature-test.t"]:
+        with open(name) as f:
+            ast = parse(tokenize(f.read()))
+        results = []
+        for evaluate_with in [evaluate, lambda ast, environment: run_steps(evaluate_steps(ast, environment))]:
+            environment = {}
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                value = evaluate_with(ast, environment)
+            results.append((value, environment, output.getvalue()))
+        assert results[0] == results[1], name
+    for code in ["x = 1 + \"a\"", "x = {1: 2}", "assert 1 == 2", "x = [1][2]", "y = z", "x = 1; x.y = 2"]:
+        errors = []
+        for evaluate_with in [evaluate, lambda ast, environment: run_steps(evaluate_steps(ast, environment))]:
+            try:
+                evaluate_with(parse(tokenize(code)), {})
+            except Exception as e:
+                errors.append(str(e))
+        assert len(errors) == 2 and errors[0] == errors[1], code
+
+    # nesting and calls far beyond the recursion limit
+    environment = {}
+    evaluate(parse(tokenize("x = " + "(" * 100_000 + "1" + ")" * 100_000 + " + 1")), environment)
+    assert environment["x"] == 2
+    code = "if (x == 0) { y = 0 }" + "".join(f" else if (x == {i}) {{ y = {i} }}" for i in range(1, 5000))
+    environment = {"x": 4999}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["y"] == 4999
+    environment = {}
+    evaluate(parse(tokenize("x = " + "[" * 5000 + "]" * 5000 + "; n = 0; while (length(x) > 0) { x = x[0]; n = n + 1 }")), environment)
+    assert environment["n"] == 4999
+    code = "function count(n) { if (n > 0) { return count(n - 1) + 1 } return 0 }; x = count(3000)"
+    environment = {}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["x"] == 3000
+
+
+def test_evaluate_tail_calls():
+    print("test evaluate of tail calls")
+    code = "function loop(n, acc) { if (n == 0) { return acc }; return loop(n - 1, acc + n) }; x = loop(3000, 0)"
+    environment = {}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["x"] == 4501500
+    # from loops and else branches, to other functions, and to builtins
+    code = """
+        function even(n) { while (1) { if (n == 0) { return true } else { return odd(n - 1) } } };
+        function odd(n) { if (n == 0) { return false }; return even(n - 1) };
+        function size(x) { return length(x) };
+        x = [even(1001), odd(1001), even(10), size([1, 2, 3])]
+    """
+    environment = {}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["x"] == [False, True, True, 3]
+    # the callee still sees the caller's variables, and its own parameters
+    # over them, and the caller's environment isn't changed
+    code = """
+        function g(a) { return [a, b, c] };
+        function f(a, b) { c = a + b; return g(a * 10) };
+        function h(b) { return g() };
+        x = [f(1, 2), h(5)]
+    """
+    environment = {"a": 0, "b": 0, "c": 0}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["x"] == [[10, 2, 3], [0, 5, 0]]
+    assert environment["a"] == environment["b"] == environment["c"] == 0
+    # a call that isn't in a return isn't a tail call
+    code = "function f(n) { if (n > 0) { f(n - 1) }; return n }; x = f(3)"
+    environment = {}
+    evaluate(parse(tokenize(code)), environment)
+    assert environment["x"] == 3
+
+
 if __name__ == "__main__":
     # statements and programs are tested implicitly
     test_evaluate_single_value()
@@ -772,4 +1393,11 @@ if __name__ == "__main__":
     test_evaluate_object_literal()
     test_evaluate_builtins()
     test_evaluator_with_new_tags()
+    test_evaluate_program()
+    test_evaluate_statements()
+    test_evaluate_interned()
+    test_evaluate_constant()
+    test_evaluate_results()
+    test_evaluate_deeply_nested()
+    test_evaluate_tail_calls()
     print("done.")
\ No newline at end of file
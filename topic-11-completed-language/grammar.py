@@ -0,0 +1,456 @@
+import os
+import re
+import sys
+
+from tokenizer import keywords, patterns
+
+# GRAMMAR ANALYSIS
+
+# Reads the EBNF grammar in parser.py, computes FIRST and FOLLOW sets, reports
+# LL(1) conflicts and generates parser_tables.py, the dispatch tables that the
+# parser uses to choose between alternatives with a single token of lookahead.
+#
+#   python grammar.py             runs the tests
+#   python grammar.py generate    regenerates parser_tables.py
+#
+# Grammar expressions are tuples:
+#   ("terminal", tag)       "=" or <number>, and names that aren't rules, like identifier
+#   ("rule", name)          another rule
+#   ("sequence", [items])   items one after another
+#   ("choice", [items])     a | b
+#   ("optional", item)      [ item ]
+#   ("repeat", item)        { item }
+# The end of the tokens is the terminal None.
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+grammar_token_pattern = re.compile(r'\s*(?:("[^"]*")|<(\w+)>|(\w+)|([=|()\[\]{}]))')
+
+
+def read_grammar(text):
+    """
+    Reads the rules of an EBNF grammar, one "name = expression" per line, into
+    a dict of grammar expressions. Text after ## is a comment.
+    """
+    definitions = {}
+    for line in text.split("\n"):
+        line = line.split("##")[0].strip()
+        if line == "":
+            continue
+        name, definition = line.split("=", 1)
+        assert name.strip() not in definitions, f"Rule {name.strip()} is defined twice."
+        definitions[name.strip()] = definition
+    rules = {}
+    for name, definition in definitions.items():
+        items = read_tokens(definition)
+        expression, items = read_choice(items, definitions)
+        assert items == [], f"Unexpected {items[0]} in rule {name}."
+        rules[name] = expression
+    return rules
+
+
+def read_tokens(text):
+    items = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = grammar_token_pattern.match(text, position)
+        assert match, f"Can't read grammar at [{text[position:]}]."
+        quoted, token_class, name, symbol = match.groups()
+        if quoted is not None:
+            items.append(("terminal", quoted[1:-1]))
+        elif token_class is not None:
+            items.append(("terminal", token_class))
+        elif name is not None:
+            items.append(("name", name))
+        else:
+            items.append(("symbol", symbol))
+        position = match.end()
+    return items
+
+
+def read_choice(items, definitions):
+    alternatives = []
+    alternative, items = read_sequence(items, definitions)
+    alternatives.append(alternative)
+    while items and items[0] == ("symbol", "|"):
+        alternative, items = read_sequence(items[1:], definitions)
+        alternatives.append(alternative)
+    if len(alternatives) == 1:
+        return alternatives[0], items
+    return ("choice", alternatives), items
+
+
+def read_sequence(items, definitions):
+    sequence = []
+    closing = {("symbol", ")"), ("symbol", "]"), ("symbol", "}"), ("symbol", "|")}
+    while items and items[0] not in closing:
+        kind, value = items[0]
+        if kind == "symbol":
+            close, wrap = {"(": (")", None), "[": ("]", "optional"), "{": ("}", "repeat")}[value]
+            inner, items = read_choice(items[1:], definitions)
+            assert items and items[0] == ("symbol", close), f"Expected {close} in grammar."
+            sequence.append(inner if wrap is None else (wrap, inner))
+        elif kind == "name" and value in definitions:
+            sequence.append(("rule", value))
+        elif kind == "name":
+            # a token tag such as identifier
+            sequence.append(("terminal", value))
+        else:
+            sequence.append(items[0])
+        items = items[1:]
+    if len(sequence) == 1:
+        return sequence[0], items
+    return ("sequence", sequence), items
+
+
+def describe(expression):
+    kind, value = expression
+    if kind == "terminal":
+        return f'"{value}"'
+    if kind == "rule":
+        return value
+    if kind == "sequence":
+        return " ".join(describe(item) for item in value)
+    if kind == "choice":
+        return "( " + " | ".join(describe(item) for item in value) + " )"
+    if kind == "optional":
+        return "[ " + describe(value) + " ]"
+    return "{ " + describe(value) + " }"
+
+
+class Grammar:
+    """
+    The rules of a grammar with their nullability and FIRST and FOLLOW sets.
+    """
+
+    def __init__(self, rules, start):
+        self.rules = rules
+        self.start = start
+        self.nullable = {name: False for name in rules}
+        self.first = {name: set() for name in rules}
+        self.follow = {name: set() for name in rules}
+        self.follow[start].add(None)
+        # iterate to a fixed point
+        changed = True
+        while changed:
+            changed = False
+            for name, expression in rules.items():
+                nullable = self.is_nullable(expression)
+                first = self.first_of(expression)
+                if nullable != self.nullable[name] or not first <= self.first[name]:
+                    self.nullable[name] = nullable
+                    self.first[name] |= first
+                    changed = True
+        changed = True
+        while changed:
+            changed = False
+            for name, expression in rules.items():
+                changed = self.add_follow(expression, self.follow[name]) or changed
+
+    def is_nullable(self, expression):
+        kind, value = expression
+        if kind == "terminal":
+            return False
+        if kind == "rule":
+            return self.nullable[value]
+        if kind == "sequence":
+            return all(self.is_nullable(item) for item in value)
+        if kind == "choice":
+            return any(self.is_nullable(item) for item in value)
+        return True
+
+    def first_of(self, expression):
+        kind, value = expression
+        if kind == "terminal":
+            return {value}
+        if kind == "rule":
+            return set(self.first[value])
+        if kind == "sequence":
+            first = set()
+            for item in value:
+                first |= self.first_of(item)
+                if not self.is_nullable(item):
+                    break
+            return first
+        if kind == "choice":
+            return set().union(*(self.first_of(item) for item in value))
+        return self.first_of(value)
+
+    def add_follow(self, expression, follow):
+        # adds to the FOLLOW sets of the rules in expression, which is followed by follow
+        kind, value = expression
+        changed = False
+        if kind == "rule":
+            if not follow <= self.follow[value]:
+                self.follow[value] |= follow
+                changed = True
+        elif kind == "sequence":
+            for i, item in enumerate(value):
+                changed = self.add_follow(item, self.follow_in_sequence(value[i + 1 :], follow)) or changed
+        elif kind == "choice":
+            for item in value:
+                changed = self.add_follow(item, follow) or changed
+        elif kind == "optional":
+            changed = self.add_follow(value, follow)
+        elif kind == "repeat":
+            changed = self.add_follow(value, follow | self.first_of(value))
+        return changed
+
+    def follow_in_sequence(self, rest, follow):
+        # the tokens that can come after an item followed by rest and then follow
+        first = self.first_of(("sequence", rest)) if rest else set()
+        if not rest or self.is_nullable(("sequence", rest)):
+            first |= follow
+        return first
+
+    def conflicts(self):
+        """
+        The LL(1) conflicts of the grammar, as (rule, description, tags) tuples:
+        places where one token of lookahead doesn't decide what to parse.
+        """
+        conflicts = []
+        for name, expression in self.rules.items():
+            self.find_conflicts(name, expression, self.follow[name], conflicts)
+        return conflicts
+
+    def find_conflicts(self, name, expression, follow, conflicts):
+        kind, value = expression
+        if kind == "sequence":
+            for i, item in enumerate(value):
+                self.find_conflicts(name, item, self.follow_in_sequence(value[i + 1 :], follow), conflicts)
+        elif kind == "choice":
+            seen = set()
+            for item in value:
+                first = self.first_of(item)
+                if self.is_nullable(item):
+                    first |= follow
+                if seen & first:
+                    conflicts.append((name, describe(expression), frozenset(seen & first)))
+                seen |= first
+                self.find_conflicts(name, item, follow, conflicts)
+        elif kind in ["optional", "repeat"]:
+            inner_follow = follow | self.first_of(value) if kind == "repeat" else follow
+            overlap = self.first_of(value) & follow
+            if overlap:
+                conflicts.append((name, describe(expression), frozenset(overlap)))
+            self.find_conflicts(name, value, inner_follow, conflicts)
+
+    def terminals(self):
+        found = set()
+
+        def visit(expression):
+            kind, value = expression
+            if kind == "terminal":
+                found.add(value)
+            elif kind in ["sequence", "choice"]:
+                for item in value:
+                    visit(item)
+            elif kind in ["optional", "repeat"]:
+                visit(value)
+
+        for expression in self.rules.values():
+            visit(expression)
+        return found
+
+    def options(self, name):
+        # the FIRST sets of the [ ... ] and { ... } parts of a rule, in order
+        found = []
+
+        def visit(expression):
+            kind, value = expression
+            if kind in ["optional", "repeat"]:
+                found.append(self.first_of(value))
+                visit(value)
+            elif kind in ["sequence", "choice"]:
+                for item in value:
+                    visit(item)
+
+        visit(self.rules[name])
+        return found
+
+    def dispatch(self, name):
+        # the alternative of a choice rule to parse for each token: the rule's
+        # name for alternatives that are rules, or else the alternative's index
+        kind, value = self.rules[name]
+        assert kind == "choice", f"{name} is not a choice."
+        table = {}
+        for i, item in enumerate(value):
+            label = item[1] if item[0] == "rule" else i
+            for tag in self.first_of(item):
+                # earlier alternatives win, as in the hand-written parsers
+                table.setdefault(tag, label)
+        return table
+
+
+def check(grammar, resolved, tags):
+    """
+    Raises an exception for every conflict of grammar that isn't listed in
+    resolved, a dict from (rule, tag) to how the parser resolves it, and for
+    terminals that aren't in tags, the tags of the tokenizer.
+    """
+    unresolved = []
+    for terminal in sorted(grammar.terminals() - set(tags)):
+        unresolved.append(f"  {terminal!r} is neither a rule nor a token")
+    for name, description, tags in grammar.conflicts():
+        for tag in sorted(tags, key=str):
+            if (name, tag) not in resolved:
+                unresolved.append(f"  {name}: {description} can't decide on {tag!r}")
+    if unresolved:
+        raise Exception("Grammar errors:\n" + "\n".join(unresolved))
+
+
+def sorted_set(tags):
+    # frozensets print in a stable order, so the generated file only changes with the grammar
+    return "frozenset({" + ", ".join(repr(tag) for tag in sorted(tags, key=str)) + "})"
+
+
+def generate_tables(text, resolved, start="program"):
+    """
+    The source of parser_tables.py for the grammar text. Raises an exception
+    if the grammar has unresolved conflicts.
+    """
+    grammar = Grammar(read_grammar(text), start)
+    check(grammar, resolved, token_tags)
+    lines = [
+        "# Generated by grammar.py from the grammar in parser.py. Do not edit;",
+        "# run python grammar.py generate after changing the grammar.",
+        "",
+        "# the tokens that can start each rule",
+        "first = {",
+    ]
+    for name in grammar.rules:
+        lines.append(f"    {name!r}: {sorted_set(grammar.first[name])},")
+    lines += ["}", "", "# the tokens that can follow each rule", "follow = {"]
+    for name in grammar.rules:
+        lines.append(f"    {name!r}: {sorted_set(grammar.follow[name])},")
+    lines += ["}", "", "# the tokens that start each [ ... ] and { ... } of a rule, in order", "options = {"]
+    for name in grammar.rules:
+        options = grammar.options(name)
+        if options:
+            lines.append(f"    {name!r}: [" + ", ".join(sorted_set(tags) for tags in options) + "],")
+    lines += ["}", "", "# the alternative to parse for each token, for the rules that are choices", "dispatch = {"]
+    for name, (kind, value) in grammar.rules.items():
+        if kind == "choice":
+            table = grammar.dispatch(name)
+            entries = ", ".join(f"{tag!r}: {table[tag]!r}" for tag in sorted(table, key=str))
+            lines.append(f"    {name!r}: {{{entries}}},")
+    lines += ["}", ""]
+    return "\n".join(lines)
+
+
+# every tag the tokenizer produces
+token_tags = {tag for pattern, tag in patterns} | set(keywords.values())
+
+
+def tables_path():
+    return os.path.join(here, "parser_tables.py")
+
+
+def test_read_grammar():
+    print("testing read_grammar...")
+    rules = read_grammar(
+        """
+        list = "[" [ expression { "," expression } ] "]"   ## a comment
+        expression = <number> | identifier | list | ( "-" expression )
+        """
+    )
+    assert rules["list"] == (
+        "sequence",
+        [
+            ("terminal", "["),
+            ("optional", ("sequence", [("rule", "expression"), ("repeat", ("sequence", [("terminal", ","), ("rule", "expression")]))])),
+            ("terminal", "]"),
+        ],
+    )
+    assert rules["expression"] == (
+        "choice",
+        [
+            ("terminal", "number"),
+            ("terminal", "identifier"),
+            ("rule", "list"),
+            ("sequence", [("terminal", "-"), ("rule", "expression")]),
+        ],
+    )
+    assert describe(rules["list"]) == '"[" [ expression { "," expression } ] "]"'
+
+
+def test_first_and_follow():
+    print("testing first and follow...")
+    grammar = Grammar(
+        read_grammar(
+            """
+            program = [ statement ] { ";" [ statement ] }
+            statement = ( "print" [ expression ] ) | expression
+            expression = term { "+" term }
+            term = <number> | ( "(" expression ")" )
+            """
+        ),
+        "program",
+    )
+    assert grammar.nullable == {"program": True, "statement": False, "expression": False, "term": False}
+    assert grammar.first["statement"] == {"print", "number", "("}
+    assert grammar.first["program"] == {"print", "number", "(", ";"}
+    assert grammar.follow["statement"] == {";", None}
+    assert grammar.follow["expression"] == {";", ")", None}
+    assert grammar.follow["term"] == {"+", ";", ")", None}
+    assert grammar.conflicts() == []
+    assert grammar.options("statement") == [{"number", "("}]
+    assert grammar.dispatch("term") == {"number": 0, "(": 1}
+
+
+def test_conflicts():
+    print("testing conflicts...")
+    grammar = Grammar(
+        read_grammar(
+            """
+            statement = function_statement | expression
+            function_statement = "function" identifier
+            expression = identifier | "function" | ( identifier "(" ")" )
+            list = "[" { expression "," } [ expression "," ] "]"
+            """
+        ),
+        "statement",
+    )
+    conflicts = {(name, tag) for name, description, tags in grammar.conflicts() for tag in tags}
+    assert conflicts == {("statement", "function"), ("expression", "identifier"), ("list", "identifier"), ("list", "function")}
+    try:
+        check(grammar, {("statement", "function"): "function statements win"}, token_tags)
+        assert False, "Should have unresolved conflicts."
+    except Exception as e:
+        assert "expression: " in str(e) and "can't decide on 'identifier'" in str(e)
+        assert "statement: " not in str(e)
+
+    # names that are neither rules nor tokens are errors too
+    grammar = Grammar(read_grammar('function = "function" "(" ")" statements'), "function")
+    try:
+        check(grammar, {}, token_tags)
+        assert False, "Should have an unknown token."
+    except Exception as e:
+        assert "'statements' is neither a rule nor a token" in str(e)
+
+
+def test_parser_tables():
+    print("testing parser_tables...")
+    from parser import grammar, resolved_conflicts
+
+    # the grammar has no other conflicts, and the generated tables are current
+    source = generate_tables(grammar, resolved_conflicts)
+    with open(tables_path()) as f:
+        assert f.read() == source, "parser_tables.py is out of date: run python grammar.py generate"
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["generate"]:
+        from parser import grammar, resolved_conflicts
+
+        with open(tables_path(), "w") as f:
+            f.write(generate_tables(grammar, resolved_conflicts))
+        print(f"wrote {tables_path()}")
+    else:
+        print("testing grammar.")
+        test_read_grammar()
+        test_first_and_follow()
+        test_conflicts()
+        test_parser_tables()
+        print("done.")
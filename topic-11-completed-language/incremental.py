@@ -0,0 +1,194 @@
+import bisect
+import random
+
+from tokenizer import tokenize, retokenize
+from parser import TokenView, parse, parse_terminated_statement, token_view
+from nodes import node
+
+# INCREMENTAL PARSING
+
+# Parsing a top-level statement only depends on its own tokens, so after an
+# edit only the statements around the re-lexed tokens need to be parsed again.
+# Parsing restarts after the last statement that ends before the edit, and
+# stops as soon as a statement ends where an old statement ended after the
+# edit: from there on, the tokens and so the statements are the same as before.
+
+
+class IncrementalParser:
+    """
+    The tokens and AST of a source that is edited a piece at a time, as in a
+    REPL or notebook cell. program is the program node; its statements list
+    is updated in place, and spans[i] is the (start, stop) token index range
+    of statements[i].
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.tokens = None
+        self.program = node("program", statements=[])
+        self.spans = []
+        self.reparse()
+
+    def reparse(self):
+        # parses the whole source, for the first parse and after errors
+        tokens = tokenize(self.source)
+        statements, spans = self.parse_statements(tokens, 0)
+        self.tokens = tokens
+        self.program.statements[:] = statements
+        self.spans = spans
+        return range(len(statements))
+
+    def parse_statements(self, tokens, index, resync=None):
+        # parses the top-level statements from tokens[index:], stopping at the
+        # end or when resync(stop) is true after a statement
+        statements = []
+        spans = []
+        view = token_view(tokens)[index:]
+        while True:
+            if view[0].tag is None:
+                return statements, spans
+            if view[0].tag == ";":
+                view = view[1:]
+                continue
+            start = view.index
+            statement, view = parse_terminated_statement(view, None)
+            assert type(view) is TokenView
+            statements.append(statement)
+            spans.append((start, view.index))
+            if resync is not None and resync(view.index):
+                return statements, spans
+
+    def edit(self, offset, deleted_length, inserted_text):
+        """
+        Replaces deleted_length characters at offset with inserted_text and
+        updates the AST. Returns the range of the indexes of the statements
+        that were parsed again; the statements after it are unchanged, though
+        they may have moved.
+        """
+        if self.tokens is None:
+            # the last edit failed, so start over
+            self.source = self.source[:offset] + inserted_text + self.source[offset + deleted_length :]
+            return self.reparse()
+        source = self.source
+        try:
+            return self.update(offset, deleted_length, inserted_text)
+        except Exception:
+            # the AST no longer matches the source, until an edit makes it parse again
+            self.source = source[:offset] + inserted_text + source[offset + deleted_length :]
+            self.tokens = None
+            raise
+
+    def update(self, offset, deleted_length, inserted_text):
+        tokens = self.tokens
+        old_length = len(tokens)
+        source, start, old_stop, new_stop = retokenize(self.source, tokens, offset, deleted_length, inserted_text)
+        self.source = source
+        delta = new_stop - old_stop
+
+        # the first statement that ends at or after the first re-lexed token,
+        # since new tokens right after a statement can extend it
+        spans = self.spans
+        stops = [stop for start_, stop in spans]
+        first = bisect.bisect_left(stops, start)
+        resume = spans[first - 1][1] if first > 0 else 0
+
+        # old statements that end after the re-lexed tokens, by their end
+        later = {stop: i for i, (start_, stop) in enumerate(spans[first:], first) if stop >= old_stop}
+        if old_stop == old_length:
+            later = {}
+        last = []
+
+        def resync(stop):
+            # a statement ends where an old one ended, past the edit
+            if stop >= new_stop and stop - delta in later:
+                last.append(later[stop - delta])
+                return True
+            return False
+
+        statements, new_spans = self.parse_statements(tokens, resume, resync)
+        replaced_stop = last[0] + 1 if last else len(spans)
+        shifted = [(a + delta, b + delta) for a, b in spans[replaced_stop:]]
+        self.program.statements[first:replaced_stop] = statements
+        self.spans[first:] = new_spans + shifted
+        return range(first, first + len(statements))
+
+
+def check_edits(source, edits):
+    # applies the edits incrementally and compares with parsing from scratch
+    incremental = IncrementalParser(source)
+    for offset, deleted_length, inserted_text in edits:
+        before = list(incremental.program.statements)
+        source = source[:offset] + inserted_text + source[offset + deleted_length :]
+        try:
+            expected = parse(tokenize(source))
+        except Exception:
+            expected = None
+        try:
+            changed = incremental.edit(offset, deleted_length, inserted_text)
+        except Exception:
+            assert expected is None, f"unexpected error after {[source]}"
+            continue
+        assert expected is not None, f"missing error after {[source]}"
+        assert incremental.program == expected, f"mismatch after {[source]}"
+        statements = incremental.program.statements
+        # the statements outside the changed range are the old nodes
+        assert statements[: changed.start] == before[: changed.start]
+        for old, new in zip(reversed(before), reversed(statements[changed.stop :])):
+            assert old is new
+        for statement, (start, stop) in zip(statements, incremental.spans):
+            assert parse_terminated_statement(token_view(incremental.tokens)[start:], None)[0] == statement
+
+
+def test_incremental_parser():
+    print("testing IncrementalParser...")
+    source = "x = 1;\nfunction f(a) { return a + 1 }\ny = f(x);\nprint y"
+    incremental = IncrementalParser(source)
+    assert incremental.program == parse(tokenize(source))
+    statements = list(incremental.program.statements)
+
+    # an edit inside the function only reparses the function
+    offset = source.index("+ 1") + 2
+    changed = incremental.edit(offset, 1, "22")
+    assert changed == range(1, 2)
+    assert incremental.program.statements[1]["value"]["body"]["statements"][0]["value"]["right"]["value"] == 22
+    assert incremental.program.statements[0] is statements[0]
+    assert incremental.program.statements[2] is statements[2] and incremental.program.statements[3] is statements[3]
+    assert incremental.spans[2][0] == incremental.spans[1][1]
+
+    # a new statement
+    changed = incremental.edit(len(incremental.source), 0, ";\nz = 3")
+    assert changed == range(3, 5)
+    assert incremental.program == parse(tokenize(incremental.source))
+
+    # splitting and joining statements
+    check_edits("x = 1; y = 2; z = 3", [(5, 1, ""), (5, 0, ";"), (0, 0, "w = 0;"), (0, 6, "")])
+    # editing separators only, and the end
+    check_edits("x = 1;; y = 2;", [(6, 0, ";"), (14, 0, " ;"), (0, 0, ";")])
+    # errors are reported, and the next good edit parses again
+    check_edits("x = 1; y = 2", [(4, 1, "("), (4, 1, "1"), (4, 0, "$"), (4, 1, "")])
+    check_edits("x = 1; y = 2", [(11, 1, ")"), (11, 1, "3"), (0, 0, "z = (1;"), (0, 7, "")])
+
+    # random edits of the test program, each undone if it doesn't parse
+    random.seed(14)
+    with open("basic-test.t") as f:
+        original = f.read()
+    pieces = ["x", "1", ";", " ", "(", ")", "{", "}", "+", "\n", "if", "print", "function", "\"", "//"]
+    source = original
+    edits = []
+    for _ in range(60):
+        offset = random.randint(0, len(source))
+        deleted_length = random.randint(0, min(3, len(source) - offset))
+        inserted_text = "".join(random.choice(pieces) for _ in range(random.randint(0, 2)))
+        edits.append((offset, deleted_length, inserted_text))
+        edited = source[:offset] + inserted_text + source[offset + deleted_length :]
+        try:
+            parse(tokenize(edited))
+            source = edited
+        except Exception:
+            edits.append((offset, len(inserted_text), source[offset : offset + deleted_length]))
+    check_edits(original, edits)
+
+if __name__ == "__main__":
+    print("testing incremental.")
+    test_incremental_parser()
+    print("done.")
@@ -0,0 +1,422 @@
+from tokenizer import Token
+
+# AST NODES
+
+# the fields of each kind of node, by tag. fields that a node doesn't have,
+# like the "else" of an if statement without one, are left unset.
+node_fields = {
+    "number": ("value",),
+    "string": ("value",),
+    "boolean": ("value",),
+    "identifier": ("value",),
+    "null": (),
+    "list": ("items",),
+    "object": ("items",),
+    "constant": ("value", "nested"),  # a prebuilt list or object, see parse_bulk_literal()
+    "function": ("parameters", "body"),
+    "complex": ("base", "index"),
+    "call": ("function", "arguments"),
+    "negate": ("value",),
+    "not": ("value",),
+    "assign": ("target", "value"),
+    "statement_list": ("statements",),
+    "program": ("statements",),
+    "if": ("condition", "then", "else"),
+    "while": ("condition", "do"),
+    "return": ("value",),
+    "print": ("value",),
+    "exit": ("value",),
+    "import": ("value",),
+    "break": (),
+    "continue": (),
+    "assert": ("condition", "explanation"),
+}
+for tag in ["+", "-", "*", "/", "^", "<", ">", "<=", ">=", "==", "!=", "&&", "||"]:
+    node_fields[tag] = ("left", "right")
+
+
+class Node:
+    """
+    An AST node. Each tag has its own subclass with slots for its fields, and
+    the tag as a class attribute, so a node is much smaller than the
+    equivalent dict. Nodes still support node["tag"], "else" in node and
+    node.get(), and compare equal to the equivalent dict.
+    """
+
+    __slots__ = ()
+    tag = None
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def __getitem__(self, key):
+        if key == "tag":
+            return self.tag
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key == "tag" or (key in self.__slots__ and hasattr(self, key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return ["tag"] + [key for key in self.__slots__ if hasattr(self, key)]
+
+    def as_dict(self):
+        # a shallow dict of the node: child nodes are not converted
+        return {key: self[key] for key in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, (Node, dict)):
+            return self.as_dict() == (other.as_dict() if isinstance(other, Node) else other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class Block(Node):
+    """
+    A node that the engines compile as a whole: a function body or a program.
+    It has a slot for its compiled forms, see compiled(), which isn't one of
+    its fields, so the forms live as long as the node and no longer.
+    """
+
+    __slots__ = ("compiled",)
+
+
+block_tags = ["statement_list", "program"]
+
+node_classes = {
+    tag: type(f"Node[{tag}]", (Block if tag in block_tags else Node,), {"__slots__": fields, "tag": tag})
+    for tag, fields in node_fields.items()
+}
+
+
+def node(tag, **fields):
+    """
+    Makes the node for tag with the given fields, e.g. node("+", left=a, right=b).
+    """
+    return node_classes[tag](**fields)
+
+
+def compiled_forms(ast):
+    """
+    The compiled forms of the function body or program ast, by engine, kept
+    on the node. Other nodes have nowhere to keep them, and get a new dict.
+    """
+    if not isinstance(ast, Block):
+        return {}
+    try:
+        return ast.compiled
+    except AttributeError:
+        forms = ast.compiled = {}
+        return forms
+
+
+def compiled(ast, engine, compile):
+    """
+    The compiled form of the function body or program ast for engine, such as
+    "closures", made by compile(ast) the first time it is asked for.
+    """
+    forms = compiled_forms(ast)
+    form = forms.get(engine)
+    if form is None:
+        form = forms[engine] = compile(ast)
+    return form
+
+
+def from_dict(ast):
+    """
+    Converts a dict AST, such as one written out in a test, into nodes.
+    """
+    if isinstance(ast, list):
+        return [from_dict(item) for item in ast]
+    if isinstance(ast, dict) and ast.get("tag") in node_classes:
+        return node(ast["tag"], **{key: from_dict(value) for key, value in ast.items() if key != "tag"})
+    if isinstance(ast, dict):
+        # object items are kept as dicts
+        return {key: from_dict(value) for key, value in ast.items()}
+    return ast
+
+
+def to_dict(ast):
+    """
+    Converts nodes back into a tree of dicts.
+    """
+    if isinstance(ast, list):
+        return [to_dict(item) for item in ast]
+    if isinstance(ast, Node):
+        return {key: to_dict(ast[key]) for key in ast.keys()}
+    if isinstance(ast, dict):
+        return {key: to_dict(value) for key, value in ast.items()}
+    return ast
+
+
+# HASH-CONSING
+
+# Generated programs repeat the same subtrees many times, like x.value.inner or
+# a constant list literal. A NodeTable makes structurally equal subtrees share
+# one node, and keeps the structural hash of each shared node, so the hash is
+# a dict lookup instead of a walk of the subtree. The hashes are kept in the
+# table instead of in the nodes, which would make every node 8 bytes bigger.
+
+
+class NodeTable:
+    """
+    A hash-consing table for ASTs. intern() returns a tree in which equal
+    subtrees, including the lists, object item dicts and function parameter
+    tokens in it, are the same object. Within the table, two interned
+    subtrees are equal exactly when they are the same object, and
+    structural_hash() is the same for equal subtrees in any table. Nodes must
+    not be changed once interned, since other parts of the tree may share them.
+    """
+
+    def __init__(self):
+        self.shared = {}  # the key of a subtree -> its shared copy
+        self.hashes = {}  # id of a shared subtree -> its structural hash
+
+    def __len__(self):
+        return len(self.shared)
+
+    def intern(self, ast):
+        """
+        Returns the shared copy of ast, adding it and its subtrees to the
+        table. The nodes of ast are reused, and changed to refer to the
+        shared copies of their children, so ast itself shouldn't be used after.
+        """
+        # post-order with an explicit stack, since ASTs can be nested deeper
+        # than the recursion limit: children leave their shared copies in
+        # results for their parent to collect
+        results = []
+        stack = [(ast, None, 0)]
+        while stack:
+            item, fields, count = stack.pop()
+            if fields is not None:
+                values = results[len(results) - count :]
+                del results[len(results) - count :]
+                results.append(self.share(item, fields, values))
+                continue
+            if isinstance(item, Node):
+                fields = [field for field in item.__slots__ if hasattr(item, field)]
+                values = [getattr(item, field) for field in fields]
+            elif isinstance(item, list):
+                fields = ()
+                values = item
+            elif isinstance(item, dict):
+                fields = list(item)
+                values = list(item.values())
+            else:
+                results.append(self.share(item, None, ()))
+                continue
+            stack.append((item, fields, len(values)))
+            stack.extend((value, None, 0) for value in reversed(values))
+        return results[0]
+
+    def share(self, item, fields, values):
+        # the shared copy of item, whose children are already shared; fields
+        # are the names of the children, or None for a leaf
+        kind = type(item)
+        if kind is Token:
+            key = (Token, item.tag, item.value, item.position)
+        elif fields is None:
+            # numbers, strings, booleans and None, by type since 1 and 1.0 print differently
+            key = (kind, item)
+        else:
+            key = (kind, *fields, *[id(value) for value in values])
+        shared = self.shared.setdefault(key, item)
+        if shared is not item:
+            return shared
+        if kind is Token:
+            structure = key[1:]
+        elif fields is None:
+            structure = (kind.__name__, item)
+        else:
+            structure = (getattr(item, "tag", kind.__name__), *fields, *[self.hashes[id(value)] for value in values])
+            if kind is list:
+                item[:] = values
+            elif kind is dict:
+                item.update(zip(fields, values))
+            else:
+                for field, value in zip(fields, values):
+                    setattr(item, field, value)
+        self.hashes[id(item)] = hash(structure)
+        return item
+
+    def structural_hash(self, ast):
+        """
+        The structural hash of ast, interning it first unless it is already
+        a shared copy. Equal subtrees have the same hash, within a process.
+        """
+        structural_hash = self.hashes.get(id(ast))
+        if structural_hash is None:
+            structural_hash = self.hashes[id(self.intern(ast))]
+        return structural_hash
+
+
+def intern(ast):
+    """
+    Makes structurally equal subtrees of ast share one node, as an optional
+    pass after parsing, and returns the shared tree. See NodeTable.
+    """
+    return NodeTable().intern(ast)
+
+
+def test_node():
+    print("testing node...")
+    a = node("+", left=node("number", value=1), right=node("identifier", value="x"))
+    assert a.tag == "+" and a.left.value == 1
+    assert a["tag"] == "+" and a["right"]["value"] == "x"
+    assert a == {
+        "tag": "+",
+        "left": {"tag": "number", "value": 1},
+        "right": {"tag": "identifier", "value": "x"},
+    }
+    assert {"tag": "number", "value": 1} == a.left
+    assert a != {"tag": "-", "left": a.left, "right": a.right}
+    assert a != node("+", left=a.left, right=node("identifier", value="y"))
+    assert repr(a) == repr(to_dict(a))
+    assert not hasattr(a, "__dict__")
+
+    # missing fields are absent, as in the dicts
+    n = node("if", condition=a, then=node("statement_list", statements=[]))
+    assert "then" in n and "else" not in n and "position" not in n
+    assert n.get("else") is None and n.keys() == ["tag", "condition", "then"]
+    try:
+        n["else"]
+        assert False, "Should be a KeyError."
+    except KeyError:
+        pass
+    n = node("return")
+    assert n == {"tag": "return"} and n != {"tag": "return", "value": None}
+
+    # conversion to and from dicts
+    ast = {
+        "tag": "program",
+        "statements": [
+            {"tag": "object", "items": [{"key": {"tag": "string", "value": "k"}, "value": {"tag": "null"}}]},
+            {"tag": "assign", "target": {"tag": "identifier", "value": "y"}, "value": {"tag": "number", "value": 2}},
+        ],
+    }
+    nodes = from_dict(ast)
+    assert isinstance(nodes.statements[0], Node) and isinstance(nodes.statements[0].items[0]["key"], Node)
+    assert nodes == ast and to_dict(nodes) == ast
+    assert type(to_dict(nodes)["statements"][1]) is dict
+
+    # compiled forms are kept on blocks, by engine, and aren't fields
+    body = node("statement_list", statements=[])
+    calls = []
+    assert compiled(body, "engine", lambda ast: calls.append(ast) or "form") == "form"
+    assert compiled(body, "engine", lambda ast: calls.append(ast) or "other") == "form" and calls == [body]
+    assert compiled(body, "other", lambda ast: "other") == "other"
+    assert body == {"tag": "statement_list", "statements": []} and body.keys() == ["tag", "statements"]
+    expression = node("number", value=1)
+    assert compiled(expression, "engine", lambda ast: "form") == "form" and compiled_forms(expression) == {}
+    assert not hasattr(expression, "compiled")
+
+
+def test_node_table():
+    print("testing NodeTable...")
+
+    def member():
+        # x.value.inner
+        return from_dict(
+            {
+                "tag": "complex",
+                "base": {
+                    "tag": "complex",
+                    "base": {"tag": "identifier", "value": "x"},
+                    "index": {"tag": "string", "value": "value"},
+                },
+                "index": {"tag": "string", "value": "inner"},
+            }
+        )
+
+    def program():
+        constant = {"tag": "list", "items": [{"tag": "number", "value": 1}, {"tag": "number", "value": 2}]}
+        return from_dict(
+            {
+                "tag": "program",
+                "statements": [
+                    {"tag": "print", "value": member()},
+                    {"tag": "assign", "target": {"tag": "identifier", "value": "y"}, "value": member()},
+                    {"tag": "print", "value": constant},
+                    {"tag": "print", "value": constant},
+                    {"tag": "print", "value": {"tag": "number", "value": 1.0}},
+                    {"tag": "if", "condition": member(), "then": {"tag": "statement_list", "statements": []}},
+                    {
+                        "tag": "if",
+                        "condition": member(),
+                        "then": {"tag": "statement_list", "statements": []},
+                        "else": {"tag": "statement_list", "statements": []},
+                    },
+                ],
+            }
+        )
+
+    expected = to_dict(program())
+    table = NodeTable()
+    ast = table.intern(program())
+    assert ast == expected
+    statements = ast.statements
+    assert statements[0].value is statements[1].value is statements[5].condition
+    assert statements[0] is not statements[1] and statements[2] is statements[3]
+    # 1 and 1.0 print differently, and an if without else is different
+    assert statements[4] is not statements[2].value.items[0]
+    assert type(statements[4].value.value) is float and type(statements[2].value.items[0].value) is int
+    assert statements[5] != statements[6] and statements[5].then is statements[6]["else"]
+    # interning again changes nothing
+    size = len(table)
+    assert table.intern(ast) is ast and table.intern(program()) is ast and len(table) == size
+
+    # equal subtrees have the same hash, in any table
+    other = NodeTable()
+    assert other.structural_hash(member()) == table.structural_hash(statements[0].value)
+    assert table.structural_hash(member()) == table.structural_hash(statements[0].value)
+    assert table.structural_hash(ast) == NodeTable().structural_hash(program())
+    assert table.structural_hash(statements[0]) != table.structural_hash(statements[1])
+    assert table.structural_hash(statements[5]) != table.structural_hash(statements[6])
+    assert len({table.structural_hash(statement) for statement in statements}) == 6
+
+    # parameters are tokens, and tokens at different positions are different
+    def function(position):
+        return node(
+            "function",
+            parameters=[Token("identifier", "a", position)],
+            body=node("statement_list", statements=[node("return", value=member())]),
+        )
+
+    functions = table.intern([function(10), function(10), function(20)])
+    assert functions[0] is functions[1] and functions[0] is not functions[2]
+    assert functions[0].body is functions[2].body
+
+    # deeply nested trees don't use the recursion stack
+    def nested(depth):
+        ast = node("number", value=1)
+        for _ in range(depth):
+            ast = node("negate", value=ast)
+        return ast
+
+    size = len(table)
+    deep = table.intern([nested(100_000), nested(100_000)])
+    # the negate nodes and the list, since the number is already in the table
+    assert deep[0] is deep[1] and len(table) == size + 100_001
+
+
+if __name__ == "__main__":
+    print("testing nodes.")
+    test_node()
+    test_node_table()
+    print("done.")
@@ -1,5 +1,10 @@
-from tokenizer import tokenize
+from tokenizer import LineIndex, Token, tokenize, tokenize_stream
+from nodes import node
+from parser_tables import dispatch, options
 from pprint import pprint
+import io
+import re
+import sys
 
 # *(&(*& NOTES))
 
@@ -14,14 +19,14 @@ from pprint import pprint
 grammar = """
     simple_expression = identifier | <boolean> | <number> | <string> | <null> | list | object | ("-" simple_expression) | ("!" simple_expression) | function | ( "(" expression ")" )
 
-    list = "[" expression { "," expression } "]"
-    object = "{" [ expression ":" expression { "," expression ":" expression } ] "}"
-    function = "function" "(" [ identifier { "," identifier } ] ")" statements
+    list = "[" [ expression { "," expression } ] "]"   ## a trailing "," is allowed
+    object = "{" [ expression ":" expression { "," expression ":" expression } ] "}"   ## here too
+    function = "function" "(" [ identifier { "," identifier } ] ")" statement_list
 
     complex_expression = simple_expression { ("[" expression "]") | ("." identifier) | "(" [ expression { "," expression } ] ")" }
 
     arithmetic_factor = complex_expression
-    exponent_expression = (arithmetic_factor "^" arithmetic_factor) | arithmetic_factor   ## Either get exponent or returns arithmetic_factor
+    exponent_expression = arithmetic_factor { "^" arithmetic_factor }
     arithmetic_term = exponent_expression { ("*" | "/") exponent_expression }             
     arithmetic_expression = arithmetic_term { ("+" | "-") arithmetic_term }
     relational_expression = arithmetic_expression { ("<" | ">" | "<=" | ">=" | "==" | "!=") arithmetic_expression }
@@ -34,11 +39,11 @@ grammar = """
 
     return_statement = "return" [ expression ]
     print_statement = "print" [ expression ]
-    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statements
+    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statement_list
 
     if_statement = "if" "(" expression ")" statement_list [ "else" (if_statement | statement_list) ]
     while_statement = "while" "(" expression ")" statement_list
-    statement_list = "{" statement { ";" statement } "}"
+    statement_list = "{" [ statement ] { ";" [ statement ] } "}"   ## no ";" is needed after a statement that ends with "}"
     exit_statement = "exit" [ expression ]
     assert_statement = "assert" expression [ "," expression ]
     import_statement = "import" expression
@@ -47,8 +52,175 @@ grammar = """
 
     statement = if_statement | while_statement | function_statement | return_statement | print_statement | exit_statement | import_statement | break_statement | continue_statement | assert_statement | expression
 
-    program = [ statement { ";" statement } {";"} ]
+    program = [ statement ] { ";" [ statement ] }   ## as in statement_list
+    """
+
+# The LL(1) conflicts of the grammar, and how the parser resolves them.
+# grammar.py reports any others when it generates parser_tables.py.
+resolved_conflicts = {
+    ("statement", "function"): "a statement starting with function is a function_statement",
+}
+
+# TOKEN STREAMS
+
+
+# the most frames a token source uses to produce a token: the generators of
+# tokenize_file(), tokenize_bytes() and tokenize_stream(), and the calls they make
+source_frames = 8
+
+
+def check_source_room():
+    """
+    Raises RecursionError unless the stack has room for source_frames more
+    Python frames below the recursion limit. sys._getframe(n) finds a frame
+    only if the stack is more than n frames deep. The limit counts Python
+    frames on every version; since 3.12 C recursion is limited separately.
+    """
+    try:
+        sys._getframe(sys.getrecursionlimit() - source_frames)
+    except ValueError:
+        return
+    raise RecursionError("no room on the stack to resume the token source")
+
+
+class TokenStream:
     """
+    A buffer of tokens pulled on demand from a list or an iterator of tokens,
+    such as tokenize_stream(). Tokens before the release point are dropped, so
+    only a bounded window of a long stream is kept in memory.
+    """
+
+    def __init__(self, tokens, lines=None):
+        self.lines = lines  # the LineIndex of the source, if known
+        if isinstance(tokens, list):
+            # the list is shared with the caller, so nothing is released
+            self.tokens = tokens
+            self.source = None
+        else:
+            self.tokens = []
+            self.source = iter(tokens)
+        self.start = 0  # index of self.tokens[0] in the whole stream
+        self.not_literal = set()  # indexes of "[" and "{" known not to start a bulk literal
+
+    def get(self, index):
+        i = index - self.start
+        assert i >= 0, f"Token {index} was already released."
+        while i >= len(self.tokens):
+            if not self.source or self.pull() is None:
+                raise IndexError("token stream exhausted")
+        return self.tokens[i]
+
+    def pull(self):
+        # the source may be resumed deep in the recursive parser. a generator
+        # that raises RecursionError is finished, and the explicit-stack parser
+        # couldn't read the rest of its tokens, so the room the source needs is
+        # checked first: if it isn't there, RecursionError is raised here, and
+        # parse_terminated_statement parses again from the tokens kept so far.
+        check_source_room()
+        token = next(self.source, None)
+        if token is not None:
+            self.tokens.append(token)
+        return token
+
+    def release(self, index):
+        if self.source:
+            del self.tokens[: index - self.start]
+            self.start = index
+            self.not_literal.clear()
+
+
+class TokenView:
+    """
+    The tokens of a TokenStream from an index onwards. Supports the list
+    operations used by the parser: tokens[0], tokens[1:] and prefix + tokens.
+    """
+
+    __slots__ = ("stream", "index")
+
+    def __init__(self, stream, index=0):
+        self.stream = stream
+        self.index = index
+
+    def __getitem__(self, key):
+        if type(key) is slice:
+            assert key.stop is None and key.step is None, "Only tokens[n:] slices are supported."
+            return TokenView(self.stream, self.index + (key.start or 0))
+        return self.stream.get(self.index + key)
+
+    def __radd__(self, prefix):
+        return PrefixedTokenView(list(prefix), self)
+
+    def __eq__(self, other):
+        if isinstance(other, TokenView):
+            # views of one list are equal even when it was wrapped twice
+            return self.stream.tokens is other.stream.tokens and self.index == other.index
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TokenView({self.stream.get(self.index)}, ...)"
+
+    @property
+    def lines(self):
+        return self.stream.lines
+
+    def release(self):
+        self.stream.release(self.index)
+
+
+class PrefixedTokenView:
+    """
+    A few tokens in front of a TokenView, as built by prefix + tokens.
+    """
+
+    __slots__ = ("prefix", "rest")
+
+    def __init__(self, prefix, rest):
+        self.prefix = prefix
+        self.rest = rest
+
+    def __getitem__(self, key):
+        n = len(self.prefix)
+        if type(key) is slice:
+            assert key.stop is None and key.step is None, "Only tokens[n:] slices are supported."
+            start = key.start or 0
+            if start >= n:
+                return self.rest[start - n :]
+            return PrefixedTokenView(self.prefix[start:], self.rest)
+        if key < n:
+            return self.prefix[key]
+        return self.rest[key - n]
+
+    def __radd__(self, prefix):
+        return PrefixedTokenView(list(prefix) + self.prefix, self.rest)
+
+    def __repr__(self):
+        return f"PrefixedTokenView({self.prefix}, {self.rest})"
+
+    @property
+    def lines(self):
+        return self.rest.lines
+
+
+def token_view(tokens, lines=None):
+    """
+    Wraps a list or iterator of tokens for parsing. Views are returned as they are.
+    lines is the LineIndex of the source, used to report errors by line and column.
+    """
+    if isinstance(tokens, (TokenView, PrefixedTokenView)):
+        return tokens
+    return TokenView(TokenStream(tokens, lines))
+
+
+def location(tokens):
+    """
+    Describes where tokens[0] is in the source, for error messages.
+    """
+    position = tokens[0].position
+    lines = getattr(tokens, "lines", None)
+    if lines is None or position is None:
+        return f"position {position}"
+    return lines.describe(position)
+
 
 # BASIC EXPRESSIONS
 
@@ -57,40 +229,41 @@ def parse_simple_expression(tokens):
     """
     simple_expression = identifier | <boolean> | <number> | <string> | <null> | list | object | ("-" simple_expression) | ("!" simple_expression) | function | ( "(" expression ")" )
     """
+    tokens = token_view(tokens)
 
     token = tokens[0]
 
-    if token["tag"] in {"identifier", "boolean", "number", "string"}:
-        return {"tag": token["tag"], "value": token["value"]}, tokens[1:]
+    if token.tag in {"identifier", "boolean", "number", "string"}:
+        return node(token.tag, value=token.value), tokens[1:]
     
-    if token["tag"] == "null":
-        return {"tag": "null"}, tokens[1:]
+    if token.tag == "null":
+        return node("null"), tokens[1:]
 
-    if token["tag"] == "[":
+    if token.tag == "[":
         return parse_list(tokens)
 
-    if token["tag"] == "{":
+    if token.tag == "{":
         return parse_object(tokens)
 
-    if token["tag"] == "-":
+    if token.tag == "-":
         value, tokens = parse_simple_expression(tokens[1:])
-        return {"tag": "negate", "value": value}, tokens
+        return node("negate", value=value), tokens
 
-    if token["tag"] == "!":
+    if token.tag == "!":
         value, tokens = parse_simple_expression(tokens[1:])
-        return {"tag": "not", "value": value}, tokens
+        return node("not", value=value), tokens
 
-    if token["tag"] == "function":
+    if token.tag == "function":
         return parse_function(tokens)
 
-    if token["tag"] == "(":
+    if token.tag == "(":
         ast, tokens = parse_expression(tokens[1:])
         assert (
-            tokens[0]["tag"] == ")"
-        ), f"Expected ')' at position {tokens[0]['position']}"
+            tokens[0].tag == ")"
+        ), f"Expected ')' at {location(tokens)}"
         return ast, tokens[1:]
     
-    assert False, f"Unexpected token '{token['tag']}' at position {token['position']}"
+    assert False, f"Unexpected token '{token.tag}' at {location(tokens)}"
 
 
 def test_parse_simple_expression():
@@ -164,29 +337,186 @@ def test_parse_simple_expression():
     }
 
 
+# BULK LITERALS
+
+# Data embedded in a script, like a list of a million numbers or records, is
+# scanned by a loop over its tokens into a prebuilt value, instead of going
+# through parse_expression() for each element and being rebuilt by evaluate()
+# each time it runs. Only literal-only regions are scanned: numbers, strings,
+# booleans, null, negative numbers and lists and objects of them, with string
+# keys. Smaller literals are cheap either way, and stay ordinary nodes.
+
+bulk_literal_size = 32  # the fewest tokens scanned into a constant node
+
+
+def parse_bulk_literal(tokens):
+    """
+    Scans the list or object at tokens[0] into a constant node, whose value
+    is the prebuilt list or dict, if it is a literal-only region of at least
+    bulk_literal_size tokens. Returns (constant, tokens after it), or None
+    to parse it as usual.
+    """
+    if type(tokens) is not TokenView:
+        return None
+    stream = tokens.stream
+    not_literal = stream.not_literal
+    start = tokens.index
+    if start in not_literal:
+        return None
+    get = stream.get
+    containers = []  # the open lists and objects, innermost last
+    keys = []  # the key of the next item of each open object
+    starts = []  # the index of the "[" or "{" of each
+    nested = False
+    index = start
+    state = "value"
+    try:
+        while True:
+            token = get(index)
+            tag = token.tag
+            index += 1
+            if state == ":":
+                if tag != ":":
+                    break
+                state = "value"
+                continue
+            if state == "key" and tag == "string":
+                keys[-1] = token.value
+                state = ":"
+                continue
+            if state == "after" and tag == ",":
+                state = "value" if type(containers[-1]) is list else "key"
+                continue
+            if state == "value":
+                if tag == "[" or tag == "{":
+                    if index - 1 in not_literal:
+                        break
+                    if containers:
+                        nested = True
+                    containers.append([] if tag == "[" else {})
+                    keys.append(None)
+                    starts.append(index - 1)
+                    state = "value" if tag == "[" else "key"
+                    continue
+                if tag == "number" or tag == "string" or tag == "boolean":
+                    value = token.value
+                elif tag == "null":
+                    value = None
+                elif tag == "-" and get(index).tag == "number":
+                    value = -get(index).value
+                    index += 1
+                elif tag == "]" and type(containers[-1]) is list:
+                    # an empty list, or a trailing ","
+                    value = containers.pop()
+                    keys.pop()
+                    starts.pop()
+                else:
+                    break
+            elif tag == ("]" if type(containers[-1]) is list else "}"):
+                # the end of a list after an item, or of an object after an item, "{" or ","
+                value = containers.pop()
+                keys.pop()
+                starts.pop()
+            else:
+                break
+            if not containers:
+                if index - start < bulk_literal_size:
+                    return None
+                return node("constant", value=value, nested=nested), tokens[index - start :]
+            if type(containers[-1]) is list:
+                containers[-1].append(value)
+            else:
+                containers[-1][keys[-1]] = value
+            state = "after"
+    except IndexError:
+        pass
+    # the open lists and objects aren't literal-only, which saves scanning
+    # them again when the parser reaches the nested ones
+    not_literal.update(starts)
+    return None
+
+
+def test_parse_bulk_literal():
+    print("testing parse_bulk_literal...")
+    global bulk_literal_size
+    numbers = list(range(100))
+    ast = parse(tokenize("x = [" + ", ".join(map(str, numbers)) + "]")).statements[0]
+    assert ast.value == {"tag": "constant", "value": numbers, "nested": False}
+    # records with negative numbers, booleans, null and trailing commas
+    records = "".join(f'{{"id": {i}, "score": -{i}.5, "tags": ["a", "b",], "ok": true, "up": null}},' for i in range(5))
+    ast = parse(tokenize("[" + records + "]")).statements[0]
+    expected = [{"id": i, "score": -i - 0.5, "tags": ["a", "b"], "ok": True, "up": None} for i in range(5)]
+    assert ast.tag == "constant" and ast.nested and ast.value == expected
+    assert type(ast.value[0]["id"]) is int and type(ast.value[0]["score"]) is float
+    # small literals stay ordinary nodes
+    assert parse(tokenize("[1, 2, [3]]")).statements[0].items[2] == {"tag": "list", "items": [{"tag": "number", "value": 3}]}
+
+    # regions that aren't literal-only are parsed as usual, except for the
+    # literal-only regions inside them
+    items = ", ".join(map(str, numbers))
+    ast = parse(tokenize("[" + items + ", f(1)]")).statements[0]
+    assert ast.tag == "list" and len(ast.items) == 101 and ast.items[100].tag == "call"
+    ast = parse(tokenize("[[" + items + "], f(1), 1 + 2]")).statements[0]
+    assert ast.tag == "list" and ast.items[0].tag == "constant" and ast.items[2].tag == "+"
+    ast = parse(tokenize("{1: [" + items + "], \"a\": x}")).statements[0]
+    assert ast.tag == "object" and ast.items[0]["value"].tag == "constant"
+    for source in ["[" + items, "[" + items + ",,]", "[" + items + "}", "{\"a\" " + items + "}", "[" + items + ", -]"]:
+        errors = []
+        for size in [bulk_literal_size, len(source) + 1]:
+            bulk_literal_size, saved = size, bulk_literal_size
+            try:
+                parse(tokenize(source))
+                assert False, "Should be a syntax error."
+            except Exception as e:
+                errors.append(str(e))
+            finally:
+                bulk_literal_size = saved
+        assert errors[0] == errors[1] and "Should be" not in errors[0], source
+
+    # the explicit-stack parser and streamed tokens give the same constants
+    source = "x = [" + records + "]; y = [[" + items + "], f(1)]"
+    ast = parse(tokenize(source))
+    assert run_steps(parse_statement_steps(token_view(tokenize(source))))[0] == ast.statements[0]
+    assert parse(tokenize_stream(io.StringIO(source), chunk_size=16)) == ast
+
+    # nesting is scanned without recursion, and a region that isn't
+    # literal-only is scanned once, not once per level
+    ast = parse(tokenize("[" * 100_000 + "1" + "]" * 100_000)).statements[0]
+    value, depth = ast.value, 1
+    while type(value[0]) is list:
+        value, depth = value[0], depth + 1
+    assert ast.tag == "constant" and depth == 100_000 and value == [1]
+    ast = parse(tokenize("[" * 10_000 + "x" + "]" * 10_000)).statements[0]
+    assert ast.tag == "list"
+
+
 def parse_list(tokens):
     """
-    list = "[" expression { "," expression } "]"
+    list = "[" [ expression { "," expression } ] "]"
     """
-    assert tokens[0]["tag"] == "[", f"Expected '[' at position {tokens[0]['position']}"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "[", f"Expected '[' at {location(tokens)}"
+    constant = parse_bulk_literal(tokens)
+    if constant:
+        return constant
     tokens = tokens[1:]
     items = []
-    if tokens[0]["tag"] != "]":
+    if tokens[0].tag != "]":
         value, tokens = parse_expression(tokens)
         items.append(value)
-        while tokens[0]["tag"] == ",":
+        while tokens[0].tag == ",":
             tokens = tokens[1:]
-            if tokens[0]["tag"] == "]": # allow for extra ","
+            if tokens[0].tag == "]": # allow for extra ","
                 break; 
             value, tokens = parse_expression(tokens)
             items.append(value)
-    assert tokens[0]["tag"] == "]", f"Expected ']' at position {tokens[0]['position']}, got {tokens[0:]}."
-    return {"tag": "list", "items": items}, tokens[1:]
+    assert tokens[0].tag == "]", f"Expected ']' at {location(tokens)}, got {tokens[0:]}."
+    return node("list", items=items), tokens[1:]
 
 
 def test_parse_list():
     """
-    list = "[" expression { "," expression } "]"
+    list = "[" [ expression { "," expression } ] "]"
     """
     # print("testing parse_list...")
     # ast, tokens = parse_list(tokenize("[1,2,3]"))
@@ -236,30 +566,34 @@ def parse_object(tokens):
     """
     object = "{" [ expression ":" expression { "," expression ":" expression } ] "}"
     """
-    assert tokens[0]["tag"] == "{", f"Expected '{{' at position {tokens[0]['position']}"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "{", f"Expected '{{' at {location(tokens)}"
+    constant = parse_bulk_literal(tokens)
+    if constant:
+        return constant
     tokens = tokens[1:]
     items = []
-    if tokens[0]["tag"] != "}":
+    if tokens[0].tag != "}":
         key, tokens = parse_expression(tokens)
         assert (
-            tokens[0]["tag"] == ":"
-        ), f"Expected ':' at position {tokens[0]['position']}"
+            tokens[0].tag == ":"
+        ), f"Expected ':' at {location(tokens)}"
         tokens = tokens[1:]
         value, tokens = parse_expression(tokens)
         items.append({"key": key, "value": value})
-        while tokens[0]["tag"] == ",":
+        while tokens[0].tag == ",":
             tokens = tokens[1:]
-            if tokens[0]["tag"] == "}": # allow for extra ","
+            if tokens[0].tag == "}": # allow for extra ","
                 break; 
             key, tokens = parse_expression(tokens)
             assert (
-                tokens[0]["tag"] == ":"
-            ), f"Expected ':' at position {tokens[0]['position']}"
+                tokens[0].tag == ":"
+            ), f"Expected ':' at {location(tokens)}"
             tokens = tokens[1:]
             value, tokens = parse_expression(tokens)
             items.append({"key": key, "value": value})
-    assert tokens[0]["tag"] == "}", f"Expected '}}' at position {tokens[0]['position']}"
-    return {"tag": "object", "items": items}, tokens[1:]
+    assert tokens[0].tag == "}", f"Expected '}}' at {location(tokens)}"
+    return node("object", items=items), tokens[1:]
 
 
 def test_parse_object():
@@ -334,41 +668,38 @@ def test_parse_object():
 
 def parse_function(tokens):
     """
-    function = "function" "(" [ identifier { "," identifier } ] ")" statements
+    function = "function" "(" [ identifier { "," identifier } ] ")" statement_list
     """
+    tokens = token_view(tokens)
     assert (
-        tokens[0]["tag"] == "function"
-    ), f"Expected 'function' at position {tokens[0]['position']}"
+        tokens[0].tag == "function"
+    ), f"Expected 'function' at {location(tokens)}"
     tokens = tokens[1:]
-    assert tokens[0]["tag"] == "(", f"Expected '(' at position {tokens[0]['position']}"
+    assert tokens[0].tag == "(", f"Expected '(' at {location(tokens)}"
     tokens = tokens[1:]
     parameters = []
-    if tokens[0]["tag"] != ")":
+    if tokens[0].tag != ")":
         assert (
-            tokens[0]["tag"] == "identifier"
-        ), f"Expected identifier at position {tokens[0]['position']}"
+            tokens[0].tag == "identifier"
+        ), f"Expected identifier at {location(tokens)}"
         parameters.append(tokens[0])
         tokens = tokens[1:]
-        while tokens[0]["tag"] == ",":
+        while tokens[0].tag == ",":
             tokens = tokens[1:]
             assert (
-                tokens[0]["tag"] == "identifier"
-            ), f"Expected identifier at position {tokens[0]['position']}"
+                tokens[0].tag == "identifier"
+            ), f"Expected identifier at {location(tokens)}"
             parameters.append(tokens[0])
             tokens = tokens[1:]
-    assert tokens[0]["tag"] == ")", f"Expected ']' at position {tokens[0]['position']}"
+    assert tokens[0].tag == ")", f"Expected ')' at {location(tokens)}"
     tokens = tokens[1:]
     body_statements, tokens = parse_statement_list(tokens)
-    return {
-        "tag": "function",
-        "parameters": parameters,
-        "body": body_statements,
-    }, tokens
+    return node("function", parameters=parameters, body=body_statements), tokens
 
 
 def test_parse_function():
     """
-    function = "function" "(" [ identifier { "," identifier } ] ")" statements
+    function = "function" "(" [ identifier { "," identifier } ] ")" statement_list
     """
     print("testing parse_function...")
     ast, tokens = parse_function(tokenize("function(x,y){}"))
@@ -438,45 +769,46 @@ def test_parse_function():
         ],
     }
 
+# the tokens that continue a complex expression: "[", "." and "("
+complex_suffixes = options["complex_expression"][0]
+
+
 def parse_complex_expression(tokens):
     """
-    complex_expression = simple_expression { ( ) | ("." identifier) | "(" [ expression { "," expression } ] ")" }
+    complex_expression = simple_expression { ("[" expression "]") | ("." identifier) | "(" [ expression { "," expression } ] ")" }
     """
+    tokens = token_view(tokens)
     ast, tokens = parse_simple_expression(tokens)
-    while tokens[0]["tag"] in ["[", ".", "("]:
-        if tokens[0]["tag"] == "[":
+    while tokens[0].tag in complex_suffixes:
+        if tokens[0].tag == "[":
             tokens = tokens[1:]
             index_ast, tokens = parse_expression(tokens)
             assert (
-                tokens[0]["tag"] == "]"
-            ), f"Expected ']' at position {tokens[0]['position']}"
+                tokens[0].tag == "]"
+            ), f"Expected ']' at {location(tokens)}"
             tokens = tokens[1:]
-            ast = {"tag": "complex", "base": ast, "index": index_ast}
-        if tokens[0]["tag"] == ".":
+            ast = node("complex", base=ast, index=index_ast)
+        if tokens[0].tag == ".":
             tokens = tokens[1:]
             assert (
-                tokens[0]["tag"] == "identifier"
-            ), f"Expected identifier at position {tokens[0]['position']}"
-            ast = {
-                "tag": "complex",
-                "base": ast,
-                "index": {"tag": "string", "value": tokens[0]["value"]},
-            }
+                tokens[0].tag == "identifier"
+            ), f"Expected identifier at {location(tokens)}"
+            ast = node("complex", base=ast, index=node("string", value=tokens[0].value))
             tokens = tokens[1:]
-        if tokens[0]["tag"] == "(":
+        if tokens[0].tag == "(":
             tokens = tokens[1:]
             items = []
-            if tokens[0]["tag"] != ")":
+            if tokens[0].tag != ")":
                 value, tokens = parse_expression(tokens)
                 items.append(value)
-                while tokens[0]["tag"] == ",":
-                    value, tokens = parse_simple_expression(tokens[1:])
+                while tokens[0].tag == ",":
+                    value, tokens = parse_expression(tokens[1:])
                     items.append(value)
             assert (
-                tokens[0]["tag"] == ")"
-            ), f"Expected ')' at position {tokens[0]['position']}"
+                tokens[0].tag == ")"
+            ), f"Expected ')' at {location(tokens)}"
             tokens = tokens[1:]
-            ast = {"tag": "call", "function": ast, "arguments": items}
+            ast = node("call", function=ast, arguments=items)
     return ast, tokens
 
 
@@ -488,6 +820,16 @@ def test_parse_complex_expression():
     for s in ["x", '{"a":4,"b":"x"}', "{}"]:
         t = tokenize(s)
         assert parse_complex_expression(t) == parse_simple_expression(t)
+    # every argument is an expression, not just the first
+    ast, tokens = parse_complex_expression(tokenize("f(1, 2 + 3)"))
+    assert ast == {
+        "tag": "call",
+        "function": {"tag": "identifier", "value": "f"},
+        "arguments": [
+            {"tag": "number", "value": 1},
+            {"tag": "+", "left": {"tag": "number", "value": 2}, "right": {"tag": "number", "value": 3}},
+        ],
+    }
     ast, tokens = parse_complex_expression(tokenize("x[3]"))
     assert ast == {
         "tag": "complex",
@@ -535,6 +877,92 @@ def test_parse_complex_expression():
 # ARITHMETIC EXPRESSIONS
 
 
+# BINARY EXPRESSIONS
+
+# The binary operator levels of the grammar, from the loosest to the tightest.
+# Each level's rule is a loop over the next level, except assignment, whose
+# right side is another assignment_expression, so "=" is right associative.
+binary_levels = [
+    ("assignment_expression", ["="]),
+    ("logical_expression", ["||"]),
+    ("logical_term", ["&&"]),
+    ("relational_expression", ["<", ">", "<=", ">=", "==", "!="]),
+    ("arithmetic_expression", ["+", "-"]),
+    ("arithmetic_term", ["*", "/"]),
+    ("exponent_expression", ["^"]),
+]
+right_associative = {"="}
+
+precedence = {}
+for level, (rule, operators) in enumerate(binary_levels, 1):
+    for operator in operators:
+        precedence[operator] = level
+
+
+def parse_binary_expression(tokens, minimum_precedence):
+    """
+    Parses the expression rules from assignment_expression down to
+    exponent_expression by precedence climbing: operators that bind less
+    tightly than minimum_precedence are left for the caller. This gives the
+    same ASTs as one function per level, with far fewer calls per operand.
+    """
+    tokens = token_view(tokens)
+    ast, tokens = parse_complex_expression(tokens)
+    while True:
+        tag = tokens[0].tag
+        level = precedence.get(tag)
+        if level is None or level < minimum_precedence:
+            return ast, tokens
+        if tag in right_associative:
+            next_ast, tokens = parse_binary_expression(tokens[1:], level)
+        else:
+            next_ast, tokens = parse_binary_expression(tokens[1:], level + 1)
+        if tag == "=":
+            ast = node("assign", target=ast, value=next_ast)
+        else:
+            ast = node(tag, left=ast, right=next_ast)
+
+
+def test_parse_binary_expression():
+    print("testing parse_binary_expression...")
+    # the precedence table agrees with the grammar
+    for rule, operators in binary_levels:
+        definition = [line for line in grammar.split("\n") if line.strip().startswith(rule + " =")]
+        assert len(definition) == 1, f"No grammar rule for {rule}."
+        quoted = set(re.findall(r'"([^"]+)"', definition[0].split("##")[0])) - {"(", ")"}
+        assert quoted == set(operators), f"{rule}: grammar has {quoted}, table has {operators}"
+
+    # the operators group as the grammar's levels do
+    def grouping(ast):
+        if ast.tag == "assign":
+            return f"({grouping(ast.target)} = {grouping(ast.value)})"
+        if ast.tag in precedence:
+            return f"({grouping(ast.left)} {ast.tag} {grouping(ast.right)})"
+        if ast.tag in ["identifier", "number"]:
+            return str(ast.value)
+        return ast.tag
+
+    for code, expected in [
+        ("x", "x"),
+        ("1 + 2 * 3 - 4 / 5 ^ 6 ^ 7", "((1 + (2 * 3)) - (4 / ((5 ^ 6) ^ 7)))"),
+        ("a = b = c || d && e == f + 1", "(a = (b = (c || (d && (e == (f + 1))))))"),
+        ("a || b = c", "((a || b) = c)"),
+        ("x < y <= z != (1 + 2) * -3", "(((x < y) <= z) != ((1 + 2) * negate))"),
+        ("f(1)[2].g ^ 2 == !h && i || j", "((((complex ^ 2) == not) && i) || j)"),
+        ("x = function (a) { return a * 2 }", "(x = function)"),
+    ]:
+        ast, tokens = parse_binary_expression(tokenize(code), 1)
+        assert grouping(ast) == expected and tokens[0].tag is None, code
+    # only tighter operators are parsed when the minimum precedence is higher
+    ast, tokens = parse_binary_expression(tokenize("x * y + z"), precedence["*"])
+    assert ast == {
+        "tag": "*",
+        "left": {"tag": "identifier", "value": "x"},
+        "right": {"tag": "identifier", "value": "y"},
+    }
+    assert tokens[0].tag == "+"
+
+
 def parse_arithmetic_factor(tokens):
     """
     arithmetic_factor = complex_expression
@@ -554,17 +982,13 @@ def test_parse_arithmetic_factor():
 
 def parse_exponent_expression(tokens):
     """
-    exponent_expression = (arithmetic_factor "^" arithmetic_factor) | arithmetic_factor   ## Either get exponent or returns arithmetic_factor
+    exponent_expression = arithmetic_factor { "^" arithmetic_factor }
     """
-    node, tokens = parse_arithmetic_factor(tokens)
-    while tokens[0]["tag"] == "^":
-        next_node, tokens = parse_arithmetic_factor(tokens[1:])
-        node = {"tag": "^", "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, precedence["^"])
 
 def test_parse_exponent_expression():
     """
-    exponent_expression = (arithmetic_factor "^" arithmetic_factor) | arithmetic_factor   ## Either get exponent or returns arithmetic_factor
+    exponent_expression = arithmetic_factor { "^" arithmetic_factor }
     """
     print("testing parse_exponent_expression...")
     # Tests base case is still the same
@@ -587,12 +1011,7 @@ def parse_arithmetic_term(tokens):
     arithmetic_term = exponent_expression { ("*" | "/") exponent_expression }
     ### arithmetic_term now handle exponent_expression not arithmetic_factor (which messes up naming but shhhh)
     """
-    node, tokens = parse_exponent_expression(tokens)    # Exponents are handled before terms
-    while tokens[0]["tag"] in ["*", "/"]:
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_exponent_expression(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, precedence["*"])
 
 
 def test_parse_arithmetic_term():
@@ -655,12 +1074,7 @@ def parse_arithmetic_expression(tokens):
     """
     arithmetic_expression = arithmetic_term { ("+" | "-") arithmetic_term }
     """
-    node, tokens = parse_arithmetic_term(tokens)
-    while tokens[0]["tag"] in ["+", "-"]:
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_arithmetic_term(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, precedence["+"])
 
 
 def test_parse_arithmetic_expression():
@@ -745,12 +1159,7 @@ def parse_relational_expression(tokens):
     """
     relational_expression = arithmetic_expression { ("<" | ">" | "<=" | ">=" | "==" | "!=") arithmetic_expression }
     """
-    node, tokens = parse_arithmetic_expression(tokens)
-    while tokens[0]["tag"] in ["<", ">", "<=", ">=", "==", "!="]:
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_arithmetic_expression(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, precedence["<"])
 
 
 def test_parse_relational_expression():
@@ -786,7 +1195,7 @@ def parse_logical_factor(tokens):
     """
     logical_factor = relational_expression
     """
-    return parse_relational_expression(tokens)
+    return parse_binary_expression(tokens, precedence["<"])
 
 
 def test_parse_logical_factor():
@@ -805,12 +1214,7 @@ def parse_logical_term(tokens):
     """
     logical_term = logical_factor { "&&" logical_factor }
     """
-    node, tokens = parse_logical_factor(tokens)
-    while tokens[0]["tag"] == "&&":
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_logical_factor(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, precedence["&&"])
 
 
 def test_parse_logical_term():
@@ -839,12 +1243,7 @@ def parse_logical_expression(tokens):
     """
     logical_expression = logical_term { "||" logical_term }
     """
-    node, tokens = parse_logical_term(tokens)
-    while tokens[0]["tag"] == "||":
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_logical_term(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, precedence["||"])
 
 
 def test_parse_logical_expression():
@@ -876,12 +1275,7 @@ def parse_assignment_expression(tokens):
     """
     assignment_expression = logical_expression [ "=" assignment_expression ]
     """
-    left, tokens = parse_logical_expression(tokens)
-    if tokens[0]["tag"] == "=":
-        tokens = tokens[1:]
-        right, tokens = parse_assignment_expression(tokens)
-        return {"tag": "assign", "target": left, "value": right}, tokens
-    return left, tokens
+    return parse_binary_expression(tokens, precedence["="])
 
 def test_parse_assignment_expression():
     """
@@ -929,7 +1323,7 @@ def parse_expression(tokens):
     """
     expression = assignment_expression
     """
-    return parse_assignment_expression(tokens)
+    return parse_binary_expression(tokens, precedence["="])
 
 
 def test_parse_expression():
@@ -944,37 +1338,71 @@ def test_parse_expression():
 
 # STATEMENTS
 
-def parse_statement_list(tokens):
+# statements that end with a block, so they need no ";" after them
+block_statements = {"if", "while", "function"}
+
+
+def parse_statements(tokens, terminator, positions=None):
     """
-    statement_list = "{" statement { ";" statement } "}"
+    statement { ";" statement }, up to but not including the terminator tag
+    the start position of each statement is appended to positions, if given
     """
-    assert tokens[0]["tag"] == "{", f"Expected '{{' at position {tokens[0]['position']}"
-    tokens = tokens[1:]
+    tokens = token_view(tokens)
     statements = []
     while True:
+        # at the top level, the tokens of finished statements aren't needed
+        if terminator is None and type(tokens) is TokenView:
+            tokens.release()
         # terminate at end of statement list
-        if tokens[0]["tag"] == "}":
-            tokens = tokens[1:]             
-            return {"tag": "statement_list", "statements": statements}, tokens
+        if tokens[0].tag == terminator:
+            return statements, tokens
         # skip extra separators
-        if tokens[0]["tag"] == ";":
+        if tokens[0].tag == ";":
             tokens = tokens[1:]             
             continue
         # parse a statement and add it to the list
-        statement, tokens = parse_statement(tokens)
+        if positions is not None:
+            positions.append(tokens[0].position)
+        statement, tokens = parse_terminated_statement(tokens, terminator)
         statements.append(statement)
-        # we don't need a semicolon terminator after block-terminated statements
-        if statement["tag"] in ["if","while","function"]:     
-            continue
-        # we don't need a semicolon terminator after function assignments
-        if statement["tag"] == "assign" and statement["value"]["tag"] == "function":
-            continue        
-        # otherwise require a terminator
-        assert tokens[0]["tag"] in [";","}"], f"Statement terminator missing {tokens}."
+
+
+def parse_terminated_statement(tokens, terminator):
+    """
+    a statement, which must be followed by ";" or the terminator tag unless it ends with a block
+    """
+    if terminator is None:
+        try:
+            statement, tokens = parse_statement(tokens)
+        except RecursionError:
+            # nested too deeply for the recursive parser, so parse it again
+            # with an explicit stack
+            statement, tokens = run_steps(parse_statement_steps(tokens))
+    else:
+        statement, tokens = parse_statement(tokens)
+    # we don't need a semicolon terminator after block-terminated statements
+    if statement.tag in block_statements:
+        return statement, tokens
+    # we don't need a semicolon terminator after function assignments
+    if statement.tag == "assign" and statement.value.tag == "function":
+        return statement, tokens
+    # otherwise require a terminator
+    assert tokens[0].tag == ";" or tokens[0].tag == terminator, f"Statement terminator missing at {location(tokens)}."
+    return statement, tokens
+
+
+def parse_statement_list(tokens):
+    """
+    statement_list = "{" [ statement ] { ";" [ statement ] } "}"
+    """
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "{", f"Expected '{{' at {location(tokens)}"
+    statements, tokens = parse_statements(tokens[1:], "}")
+    return node("statement_list", statements=statements), tokens[1:]
 
 def test_parse_statement_list():
     """
-    statement_list = "{" statement { ";" statement } "}"
+    statement_list = "{" [ statement ] { ";" [ statement ] } "}"
     """
     print("testing parse_statements...")
     ast, tokens = parse_statement_list(tokenize("{}"))
@@ -1009,31 +1437,29 @@ def parse_if_statement(tokens):
     """
     if_statement = "if" "(" expression ")" statement_list [ "else" (if_statement | statement_list) ]
     """
-    assert tokens[0]["tag"] == "if"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "if"
     tokens = tokens[1:]
-    if tokens[0]["tag"] != "(":
-        raise Exception(f"Expected '(': {tokens[0]}")
+    if tokens[0].tag != "(":
+        raise Exception(f"Expected '(' at {location(tokens)}")
     condition, tokens = parse_expression(tokens[1:])
-    if tokens[0]["tag"] != ")":
-        raise Exception(f"Expected ')': {tokens[0]}")
+    if tokens[0].tag != ")":
+        raise Exception(f"Expected ')' at {location(tokens)}")
     then_statements, tokens = parse_statement_list(tokens[1:])
-    node = {
-        "tag": "if",
-        "condition": condition,
-        "then": then_statements,
-    }
-    if tokens[0]["tag"] == "else":
+    ast = node("if", condition=condition, then=then_statements)
+    if tokens[0].tag == "else":
         tokens = tokens[1:]
-        assert tokens[0]["tag"] in [
+        assert tokens[0].tag in [
             "{",
             "if",
-        ], "Else must be followed by statements or if statement."
-        if tokens[0]["tag"] == "{":
+        ], f"Else must be followed by statements or if statement at {location(tokens)}."
+        if tokens[0].tag == "{":
             else_statements, tokens = parse_statement_list(tokens)
         else:
             else_statements, tokens = parse_if_statement(tokens)
-        node["else"] = else_statements
-    return node, tokens
+        # else is a keyword, so the field can't be set as ast.else
+        setattr(ast, "else", else_statements)
+    return ast, tokens
 
 
 def test_parse_if_statement():
@@ -1075,15 +1501,16 @@ def parse_while_statement(tokens):
     """
     while_statement = "while" "(" expression ")" statement_list
     """
-    assert tokens[0]["tag"] == "while"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "while"
     tokens = tokens[1:]
-    if tokens[0]["tag"] != "(":
-        raise Exception(f"Expected '(': {tokens[0]}")
+    if tokens[0].tag != "(":
+        raise Exception(f"Expected '(' at {location(tokens)}")
     condition, tokens = parse_expression(tokens[1:])
-    if tokens[0]["tag"] != ")":
-        raise Exception(f"Expected ')': {tokens[0]}")
+    if tokens[0].tag != ")":
+        raise Exception(f"Expected ')' at {location(tokens)}")
     do_statements, tokens = parse_statement_list(tokens[1:])
-    return {"tag": "while", "condition": condition, "do": do_statements}, tokens
+    return node("while", condition=condition, do=do_statements), tokens
 
 
 def test_parse_while_statement():
@@ -1106,14 +1533,14 @@ def parse_return_statement(tokens):
     """
     return_statement = "return" [ expression ]
     """
-    assert tokens[0]["tag"] == "return"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "return"
     tokens = tokens[1:]
-    if tokens[0]["tag"] in ["}", ";", None]:
-        value = None
-        return {"tag": "return"}, tokens
+    if tokens[0].tag not in options["return_statement"][0]:
+        return node("return"), tokens
     else:
         value, tokens = parse_expression(tokens)
-        return {"tag": "return", "value": value}, tokens
+        return node("return", value=value), tokens
 
 
 def test_parse_return_statement():
@@ -1137,14 +1564,15 @@ def parse_print_statement(tokens):
     """
     print_statement = "print" [ expression ]
     """
-    assert tokens[0]["tag"] == "print"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "print"
     tokens = tokens[1:]
-    if tokens[0]["tag"] in ["}", ";", None]:
+    if tokens[0].tag not in options["print_statement"][0]:
         # no expression
-        return {"tag": "print", "value": None}, tokens
+        return node("print", value=None), tokens
     else:
         value, tokens = parse_expression(tokens)
-        return {"tag": "print", "value": value}, tokens
+        return node("print", value=value), tokens
 
 
 def test_parse_print_statement():
@@ -1159,14 +1587,15 @@ def parse_exit_statement(tokens):
     """
     exit_statement = "exit" [ expression ]
     """
-    assert tokens[0]["tag"] == "exit"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "exit"
     tokens = tokens[1:]
-    if tokens[0]["tag"] in ["}", ";", None]:
+    if tokens[0].tag not in options["exit_statement"][0]:
         # no expression
-        return {"tag": "exit", "value": None}, tokens
+        return node("exit", value=None), tokens
     else:
         value, tokens = parse_expression(tokens)
-        return {"tag": "exit", "value": value}, tokens
+        return node("exit", value=value), tokens
 
 
 def test_parse_exit_statement():
@@ -1181,10 +1610,11 @@ def parse_import_statement(tokens):
     """
     import_statement = "import" expression
     """
-    assert tokens[0]["tag"] == "import"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "import"
     tokens = tokens[1:]
     value, tokens = parse_expression(tokens)
-    return {"tag": "import", "value": value}, tokens
+    return node("import", value=value), tokens
 
 
 def test_parse_import_statement():
@@ -1199,9 +1629,10 @@ def parse_break_statement(tokens):
     """
     break_statement = "break"
     """
-    assert tokens[0]["tag"] == "break"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "break"
     tokens = tokens[1:]
-    return {"tag": "break"}, tokens
+    return node("break"), tokens
 
 
 def test_parse_break_statement():
@@ -1216,9 +1647,10 @@ def parse_continue_statement(tokens):
     """
     continue_statement = "continue"
     """
-    assert tokens[0]["tag"] == "continue"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "continue"
     tokens = tokens[1:]
-    return {"tag": "continue"}, tokens
+    return node("continue"), tokens
 
 
 def test_parse_continue_statement():
@@ -1232,17 +1664,19 @@ def test_parse_continue_statement():
 
 def parse_function_statement(tokens):
     """
-    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statements
+    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statement_list
     """
-    assert tokens[0]["tag"] == "function"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "function"
+    function_token = tokens[0]
     tokens = tokens[1:]
-    assert tokens[0]["tag"] == "identifier"
+    assert tokens[0].tag == "identifier"
     identifier_token = tokens[0]
     tokens = tokens[1:]
     tokens = [
         identifier_token,
-        {"tag": "=", "value": "="},
-        {"tag": "function", "value": "function"},
+        Token("=", "=", identifier_token.position),
+        function_token,
     ] + tokens
     return parse_assignment_expression(tokens)
 
@@ -1251,15 +1685,16 @@ def parse_assert_statement(tokens):
     """
     assert_statement = "assert" expression [ "," expression ]
     """
-    assert tokens[0]["tag"] == "assert"
+    tokens = token_view(tokens)
+    assert tokens[0].tag == "assert"
     tokens = tokens[1:]
     condition, tokens = parse_expression(tokens)
-    if tokens[0]["tag"] == ",":
+    if tokens[0].tag == ",":
         tokens = tokens[1:]
         explanation, tokens = parse_expression(tokens)
-        return {"tag": "assert", "condition": condition, "explanation": explanation},   tokens
+        return node("assert", condition=condition, explanation=explanation), tokens
     else:
-        return {"tag": "assert", "condition": condition}, tokens
+        return node("assert", condition=condition), tokens
 
 def test_parse_assert_statement():
     """
@@ -1274,7 +1709,7 @@ def test_parse_assert_statement():
 
 def test_parse_function_statement():
     """
-    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statements
+    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statement_list
     """
     print("testing parse_function_statement...")
     ast, result = parse_function_statement(tokenize("function x(y){2}"))
@@ -1296,29 +1731,13 @@ def parse_statement(tokens):
     """
     statement = if_statement | while_statement | function_statement | return_statement | print_statement | exit_statement | import_statement | break_statement | continue_statement | assert_statement | expression
     """
-    tag = tokens[0]["tag"]
-    # note: none of these consumes a token
-    if tag == "if":
-        return parse_if_statement(tokens)
-    if tag == "while":
-        return parse_while_statement(tokens)
-    if tag == "function":
-        return parse_function_statement(tokens)
-    if tag == "return":
-        return parse_return_statement(tokens)
-    if tag == "print":
-        return parse_print_statement(tokens)
-    if tag == "exit":
-        return parse_exit_statement(tokens)
-    if tag == "import":
-        return parse_import_statement(tokens)
-    if tag == "break":
-        return parse_break_statement(tokens)
-    if tag == "continue":
-        return parse_continue_statement(tokens)
-    if tag == "assert":
-        return parse_assert_statement(tokens)
-    return parse_expression(tokens)
+    # the alternative is chosen by the first token; anything else is an
+    # expression, which reports unexpected tokens
+    return statement_parsers.get(tokens[0].tag, parse_expression)(tokens)
+
+
+# the parse function for each token that can start a statement, from the grammar
+statement_parsers = {tag: globals()["parse_" + rule] for tag, rule in dispatch["statement"].items()}
 
 
 def test_parse_statement():
@@ -1354,19 +1773,17 @@ def test_parse_statement():
     )
 
 
-def parse_program(tokens):
+def parse_program(tokens, positions=None):
     """
-    program = [ statement { ";" statement } ]
+    program = [ statement ] { ";" [ statement ] }
     """
-    tokens = [{'tag': '{'}] + tokens[:-1] + [{'tag': '}'}] + tokens[-1:]
-    ast, tokens = parse_statement_list(tokens)
-    ast["tag"] = "program"
-    return ast, tokens
+    statements, tokens = parse_statements(tokens, None, positions)
+    return node("program", statements=statements), tokens
 
 
 def test_parse_program():
     """
-    program = [ statement { ";" statement } {";"} ]
+    program = [ statement ] { ";" [ statement ] }
     """
     print("testing parse_program...")
     ast, tokens = parse_program(tokenize("print 1; print 2"))
@@ -1390,11 +1807,455 @@ def test_parse_program():
     assert ast=={'tag': 'program', 'statements': [{'tag': 'if', 'condition': {'tag': 'number', 'value': 1}, 'then': {'tag': 'statement_list', 'statements': [{'tag': 'print', 'value': {'tag': 'number', 'value': 3}}]}}, {'tag': 'print', 'value': {'tag': 'number', 'value': 4}}, {'tag': 'print', 'value': {'tag': 'number', 'value': 5}}]}
 
 
-def parse(tokens):
-    ast, tokens = parse_program(tokens)
+def parse(tokens, positions=None):
+    ast, tokens = parse_program(tokens, positions)
     return ast
 
 
+def parse_statements_lazily(tokens):
+    """
+    Parses a program one top-level statement at a time, yielding each
+    statement and its start position as soon as it is parsed. The tokens and
+    line starts before the next statement are released, so a stream of
+    tokens is parsed in bounded memory.
+    """
+    tokens = token_view(tokens)
+    while True:
+        if type(tokens) is TokenView:
+            tokens.release()
+        if tokens[0].tag is None:
+            return
+        if tokens[0].tag == ";":
+            tokens = tokens[1:]
+            continue
+        position = tokens[0].position
+        if tokens.lines is not None:
+            tokens.lines.release(position)
+        statement, tokens = parse_terminated_statement(tokens, None)
+        yield statement, position
+
+
+def test_parse_statements_lazily():
+    print("testing parse_statements_lazily...")
+    code = "x = 1;; function f(a) { return a } print f(x);\n y = [1, 2]"
+    positions = []
+    ast = parse(tokenize(code), positions)
+    statements = parse_statements_lazily(tokenize(code))
+    assert list(statements) == list(zip(ast.statements, positions))
+
+    # statements are parsed as they are needed, and earlier tokens and lines are released
+    lines = LineIndex()
+    tokens = token_view(tokenize_stream(io.StringIO("x = 1;\n" * 1000 + "y = ("), chunk_size=16, lines=lines), lines)
+    statements = parse_statements_lazily(tokens)
+    for i in range(1000):
+        statement, position = next(statements)
+        assert statement == {"tag": "assign", "target": {"tag": "identifier", "value": "x"}, "value": {"tag": "number", "value": 1}}
+        assert position == 7 * i
+        assert len(tokens.stream.tokens) < 10 and len(lines.starts) < 10
+    try:
+        next(statements)
+        assert False, "Should have a syntax error."
+    except Exception as e:
+        assert "line 1001, column 6" in str(e), str(e)
+
+
+# EXPLICIT-STACK PARSING
+
+# Each parse function takes a few Python frames per level of nesting, so
+# input nested a few hundred levels deep, as code generators produce, hits
+# the recursion limit. The functions below parse the same grammar as
+# generators: instead of calling the function for a nested rule, they yield
+# its generator and are sent its result, and run_steps() keeps the pending
+# generators on a list instead of Python's stack. They are slower than the
+# recursive functions, so a top-level statement is only parsed by them after
+# it raises RecursionError (see parse_terminated_statement).
+
+
+def run_steps(steps):
+    """
+    Runs a generator that yields a generator for each call it makes and is
+    sent the call's result, and returns its result. The pending calls are
+    kept on a list, so they can be nested as deeply as memory allows.
+    """
+    stack = [steps]
+    value = None
+    while True:
+        try:
+            call = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            if not stack:
+                return stop.value
+            value = stop.value
+        else:
+            stack.append(call)
+            value = None
+
+
+def parse_simple_expression_steps(tokens):
+    token = tokens[0]
+    if token.tag == "[":
+        return (yield parse_list_steps(tokens))
+    if token.tag == "{":
+        return (yield parse_object_steps(tokens))
+    if token.tag in ["-", "!"]:
+        value, tokens = yield parse_simple_expression_steps(tokens[1:])
+        return node("negate" if token.tag == "-" else "not", value=value), tokens
+    if token.tag == "function":
+        return (yield parse_function_steps(tokens))
+    if token.tag == "(":
+        ast, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+        assert tokens[0].tag == ")", f"Expected ')' at {location(tokens)}"
+        return ast, tokens[1:]
+    return parse_simple_expression(tokens)
+
+
+def parse_list_steps(tokens):
+    constant = parse_bulk_literal(tokens)
+    if constant:
+        return constant
+    tokens = tokens[1:]
+    items = []
+    if tokens[0].tag != "]":
+        value, tokens = yield parse_binary_expression_steps(tokens, 1)
+        items.append(value)
+        while tokens[0].tag == ",":
+            tokens = tokens[1:]
+            if tokens[0].tag == "]":
+                break
+            value, tokens = yield parse_binary_expression_steps(tokens, 1)
+            items.append(value)
+    assert tokens[0].tag == "]", f"Expected ']' at {location(tokens)}, got {tokens[0:]}."
+    return node("list", items=items), tokens[1:]
+
+
+def parse_object_steps(tokens):
+    constant = parse_bulk_literal(tokens)
+    if constant:
+        return constant
+    tokens = tokens[1:]
+    items = []
+    while tokens[0].tag != "}":
+        key, tokens = yield parse_binary_expression_steps(tokens, 1)
+        assert tokens[0].tag == ":", f"Expected ':' at {location(tokens)}"
+        value, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+        items.append({"key": key, "value": value})
+        if tokens[0].tag != ",":
+            break
+        tokens = tokens[1:]
+    assert tokens[0].tag == "}", f"Expected '}}' at {location(tokens)}"
+    return node("object", items=items), tokens[1:]
+
+
+def parse_function_steps(tokens):
+    tokens = tokens[1:]
+    assert tokens[0].tag == "(", f"Expected '(' at {location(tokens)}"
+    tokens = tokens[1:]
+    parameters = []
+    while tokens[0].tag != ")":
+        if parameters:
+            assert tokens[0].tag == ",", f"Expected ')' at {location(tokens)}"
+            tokens = tokens[1:]
+        assert tokens[0].tag == "identifier", f"Expected identifier at {location(tokens)}"
+        parameters.append(tokens[0])
+        tokens = tokens[1:]
+    body_statements, tokens = yield parse_statement_list_steps(tokens[1:])
+    return node("function", parameters=parameters, body=body_statements), tokens
+
+
+def parse_complex_expression_steps(tokens):
+    ast, tokens = yield parse_simple_expression_steps(tokens)
+    while tokens[0].tag in complex_suffixes:
+        if tokens[0].tag == "[":
+            index_ast, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+            assert tokens[0].tag == "]", f"Expected ']' at {location(tokens)}"
+            tokens = tokens[1:]
+            ast = node("complex", base=ast, index=index_ast)
+        if tokens[0].tag == ".":
+            tokens = tokens[1:]
+            assert tokens[0].tag == "identifier", f"Expected identifier at {location(tokens)}"
+            ast = node("complex", base=ast, index=node("string", value=tokens[0].value))
+            tokens = tokens[1:]
+        if tokens[0].tag == "(":
+            tokens = tokens[1:]
+            items = []
+            if tokens[0].tag != ")":
+                value, tokens = yield parse_binary_expression_steps(tokens, 1)
+                items.append(value)
+                while tokens[0].tag == ",":
+                    value, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+                    items.append(value)
+            assert tokens[0].tag == ")", f"Expected ')' at {location(tokens)}"
+            tokens = tokens[1:]
+            ast = node("call", function=ast, arguments=items)
+    return ast, tokens
+
+
+def parse_binary_expression_steps(tokens, minimum_precedence):
+    ast, tokens = yield parse_complex_expression_steps(tokens)
+    while True:
+        tag = tokens[0].tag
+        level = precedence.get(tag)
+        if level is None or level < minimum_precedence:
+            return ast, tokens
+        if tag in right_associative:
+            next_ast, tokens = yield parse_binary_expression_steps(tokens[1:], level)
+        else:
+            next_ast, tokens = yield parse_binary_expression_steps(tokens[1:], level + 1)
+        if tag == "=":
+            ast = node("assign", target=ast, value=next_ast)
+        else:
+            ast = node(tag, left=ast, right=next_ast)
+
+
+def parse_statement_list_steps(tokens):
+    assert tokens[0].tag == "{", f"Expected '{{' at {location(tokens)}"
+    tokens = tokens[1:]
+    statements = []
+    while tokens[0].tag != "}":
+        if tokens[0].tag == ";":
+            tokens = tokens[1:]
+            continue
+        statement, tokens = yield parse_terminated_statement_steps(tokens, "}")
+        statements.append(statement)
+    return node("statement_list", statements=statements), tokens[1:]
+
+
+def parse_terminated_statement_steps(tokens, terminator):
+    statement, tokens = yield parse_statement_steps(tokens)
+    if statement.tag in block_statements:
+        return statement, tokens
+    if statement.tag == "assign" and statement.value.tag == "function":
+        return statement, tokens
+    assert tokens[0].tag == ";" or tokens[0].tag == terminator, f"Statement terminator missing at {location(tokens)}."
+    return statement, tokens
+
+
+def parse_if_statement_steps(tokens):
+    tokens = tokens[1:]
+    if tokens[0].tag != "(":
+        raise Exception(f"Expected '(' at {location(tokens)}")
+    condition, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+    if tokens[0].tag != ")":
+        raise Exception(f"Expected ')' at {location(tokens)}")
+    then_statements, tokens = yield parse_statement_list_steps(tokens[1:])
+    ast = node("if", condition=condition, then=then_statements)
+    if tokens[0].tag == "else":
+        tokens = tokens[1:]
+        assert tokens[0].tag in [
+            "{",
+            "if",
+        ], f"Else must be followed by statements or if statement at {location(tokens)}."
+        if tokens[0].tag == "{":
+            else_statements, tokens = yield parse_statement_list_steps(tokens)
+        else:
+            else_statements, tokens = yield parse_if_statement_steps(tokens)
+        setattr(ast, "else", else_statements)
+    return ast, tokens
+
+
+def parse_while_statement_steps(tokens):
+    tokens = tokens[1:]
+    if tokens[0].tag != "(":
+        raise Exception(f"Expected '(' at {location(tokens)}")
+    condition, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+    if tokens[0].tag != ")":
+        raise Exception(f"Expected ')' at {location(tokens)}")
+    do_statements, tokens = yield parse_statement_list_steps(tokens[1:])
+    return node("while", condition=condition, do=do_statements), tokens
+
+
+def parse_keyword_statement_steps(tokens):
+    # return, print, exit and import, which are a keyword and an expression
+    tag = tokens[0].tag
+    rule = tag + "_statement"
+    if tag != "import" and tokens[1].tag not in options[rule][0]:
+        return globals()["parse_" + rule](tokens)
+    value, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+    return node(tag, value=value), tokens
+
+
+def parse_assert_statement_steps(tokens):
+    condition, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+    if tokens[0].tag == ",":
+        explanation, tokens = yield parse_binary_expression_steps(tokens[1:], 1)
+        return node("assert", condition=condition, explanation=explanation), tokens
+    return node("assert", condition=condition), tokens
+
+
+def parse_function_statement_steps(tokens):
+    function_token, identifier_token = tokens[0], tokens[1]
+    assert identifier_token.tag == "identifier"
+    tokens = [
+        identifier_token,
+        Token("=", "=", identifier_token.position),
+        function_token,
+    ] + tokens[2:]
+    return (yield parse_binary_expression_steps(tokens, 1))
+
+
+statement_steps = {
+    "if": parse_if_statement_steps,
+    "while": parse_while_statement_steps,
+    "function": parse_function_statement_steps,
+    "return": parse_keyword_statement_steps,
+    "print": parse_keyword_statement_steps,
+    "exit": parse_keyword_statement_steps,
+    "import": parse_keyword_statement_steps,
+    "assert": parse_assert_statement_steps,
+}
+
+
+def parse_statement_steps(tokens):
+    tag = tokens[0].tag
+    if tag in statement_steps:
+        return (yield statement_steps[tag](tokens))
+    if tag in ["break", "continue"]:
+        return statement_parsers[tag](tokens)
+    return (yield parse_binary_expression_steps(tokens, 1))
+
+
+def test_parse_deeply_nested():
+    print("testing parse of deeply nested input...")
+    # the same ASTs as the recursive parser
+    for name in ["basic-test.t", "feature-test.t"]:
+        with open(name) as f:
+            tokens = token_view(tokenize(f.read()))
+        expected = parse(tokens)
+        while tokens[0].tag is not None:
+            if tokens[0].tag == ";":
+                tokens = tokens[1:]
+                continue
+            statement, view = parse_terminated_statement(tokens, None)
+            assert run_steps(parse_terminated_statement_steps(tokens, None)) == (statement, view)
+            tokens = view
+    for code in [
+        "f(a)(b)[c].d = -!x ^ 2 * y / z + 1 - 2 < 3 <= 4 == 5 != 6 || 7 && (8 = 9)",
+        "x = {}; y = {1:2,}; z = []; w = [1,2,]; {3: 4, 5: [6]}",
+        "function f() {} function g(a, b) { return; print } h = function(c) {print c; exit c}",
+        "if (1) {} else if (2) {;;;} else { while (x) { break; continue } }; import \"x.t\"; return 1;",
+        "assert 1; assert 1, 2; print; exit",
+    ]:
+        tokens = token_view(tokenize(code))
+        expected = parse(tokens)
+        statements = []
+        while tokens[0].tag is not None:
+            if tokens[0].tag == ";":
+                tokens = tokens[1:]
+                continue
+            statement, tokens = run_steps(parse_terminated_statement_steps(tokens, None))
+            statements.append(statement)
+        assert node("program", statements=statements) == expected, code
+    # and the same errors
+    for code in ["(1", "[1 2]", "{1 2}", "{1: 2", "f(1", "if 1", "if (1) {} else 2", "x y", "function (a b) {}", "function (a,) {}", "function () }"]:
+        errors = []
+        for parse_statement_with in [parse_statement, lambda tokens: run_steps(parse_statement_steps(tokens))]:
+            try:
+                parse_statement_with(token_view(tokenize(code)))
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+        assert errors[0] == errors[1], code
+
+    # nesting far beyond the recursion limit
+    ast = parse(tokenize("x = " + "(" * 100_000 + "1" + ")" * 100_000))
+    assert ast.statements[0].value == {"tag": "number", "value": 1}
+    depth = 5000
+    for code in [
+        "x = " + "[" * depth + "]" * depth,
+        "x = " + "-" * depth + "1",
+        "x = " + "f(" * depth + ")" * depth,
+        "x = " + "{\"k\": " * depth + "1" + "}" * depth,
+        "if (x) {}" + " else if (x) {}" * depth + "; y = 1",
+        "while (x) {" * depth + "}" * depth,
+        "x = " + " = ".join(["y"] * depth),
+    ]:
+        positions = []
+        ast = parse(tokenize(code), positions)
+        assert positions[0] == 0
+    # the ASTs are as deep as the input
+    value = ast.statements[0]
+    for _ in range(depth - 1):
+        value = value.value
+    assert value.tag == "assign" and value.target.value == "y" and value.value.value == "y"
+
+    # tokens read from a stream while the recursive parser is deep are kept,
+    # wherever the recursion limit is reached. "[" nesting is parsed as a bulk
+    # literal, so these nest through the recursive parse functions.
+    def parse_at_depth(frames, code):
+        if frames > 0:
+            return parse_at_depth(frames - 1, code)
+        return parse(tokenize_stream(code))
+
+    limit = sys.getrecursionlimit()
+    for code in ["x = " + "(" * depth + "1" + ")" * depth + "; y = 2", "x = " + "-" * depth + "1; y = 2"]:
+        for frames in range(2 * source_frames):
+            ast = parse_at_depth(frames, code)
+            assert len(ast.statements) == 2 and ast.statements[1] == parse(tokenize("y = 2")).statements[0]
+            assert sys.getrecursionlimit() == limit
+
+
+def test_token_view():
+    print("testing token_view...")
+    code = """
+        x = 3;
+        function g(q)
+            {return [q, 2]};
+        if (x) { print g(4) } else { print 5 }
+        """
+    assert parse(token_view(tokenize(code))) == parse(tokenize(code))
+    assert parse(token_view(tokenize_stream(code))) == parse(tokenize(code))
+
+    tokens = token_view(tokenize("1 2 3"))
+    assert tokens[0]["value"] == 1 and tokens[2]["value"] == 3
+    assert tokens[1:][0]["value"] == 2
+    assert tokens[1:] == tokens[1:] and tokens[1:] != tokens[2:]
+    tokens = [{"tag": "identifier", "value": "x"}] + tokens[1:]
+    assert [tokens[i]["value"] for i in range(3)] == ["x", 2, 3]
+    assert tokens[1:][0]["value"] == 2 and tokens[2:][0]["value"] == 3
+
+    # lists are parsed through a view, so the remaining tokens are never copied
+    t = tokenize("x + 1; y")
+    ast, tokens = parse_expression(t)
+    assert isinstance(tokens, TokenView) and tokens.stream.tokens is t and tokens.index == 3
+
+    # tokens are only pulled from the stream as the parser needs them
+    stream = TokenStream(tokenize_stream("print 1; print 2; print 3"))
+    ast, tokens = parse_statement(TokenView(stream))
+    assert ast == {"tag": "print", "value": {"tag": "number", "value": 1}}
+    assert len(stream.tokens) == 3
+
+    # the program's finished statements are released, so the buffer stays small
+    stream = TokenStream(tokenize_stream("x = x + 1;" * 1000))
+    ast, tokens = parse_program(TokenView(stream))
+    assert len(ast["statements"]) == 1000
+    assert stream.start > 5000 and len(stream.tokens) == 1
+
+    # errors are reported by line and column when the LineIndex is known
+    code = "x = 1;\ny = (2 + 3;\nz = 4"
+    lines = LineIndex()
+    for tokens, where in [
+        (token_view(tokenize(code, lines=lines), lines), "line 2, column 11"),
+        (tokenize(code), "position 17"),
+    ]:
+        try:
+            parse(tokens)
+            assert False, "Should have a parse error."
+        except AssertionError as e:
+            # the first line, since pytest adds an explanation to a failed assert's message
+            assert str(e).split("\n")[0] == f"Expected ')' at {where}", str(e)
+
+    # the positions of top-level statements can be recorded
+    positions = []
+    parse(tokenize("x = 1; if (x) { y = 2 } ;; print x"), positions)
+    assert positions == [0, 7, 27]
+
+    # lists are shared with the caller and never released
+    t = tokenize("x = x + 1;" * 10)
+    ast, tokens = parse_program(token_view(t))
+    assert len(t) == 61
+
+
 def test_parse():
     print("testing parse")
     tokens = tokenize("2+3*4+5^6")
@@ -1507,4 +2368,9 @@ if __name__ == "__main__":
     #     print(f"Untested grammar = [[[ {test_grammar} ]]]")
 
     test_parse()
+    test_parse_binary_expression()
+    test_token_view()
+    test_parse_statements_lazily()
+    test_parse_bulk_literal()
+    test_parse_deeply_nested()
     print("all tests passed")
@@ -0,0 +1,95 @@
+# Generated by grammar.py from the grammar in parser.py. Do not edit;
+# run python grammar.py generate after changing the grammar.
+
+# the tokens that can start each rule
+first = {
+    'simple_expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'list': frozenset({'['}),
+    'object': frozenset({'{'}),
+    'function': frozenset({'function'}),
+    'complex_expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'arithmetic_factor': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'exponent_expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'arithmetic_term': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'arithmetic_expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'relational_expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'logical_factor': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'logical_term': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'logical_expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'assignment_expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'expression': frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}),
+    'return_statement': frozenset({'return'}),
+    'print_statement': frozenset({'print'}),
+    'function_statement': frozenset({'function'}),
+    'if_statement': frozenset({'if'}),
+    'while_statement': frozenset({'while'}),
+    'statement_list': frozenset({'{'}),
+    'exit_statement': frozenset({'exit'}),
+    'assert_statement': frozenset({'assert'}),
+    'import_statement': frozenset({'import'}),
+    'break_statement': frozenset({'break'}),
+    'continue_statement': frozenset({'continue'}),
+    'statement': frozenset({'!', '(', '-', '[', 'assert', 'boolean', 'break', 'continue', 'exit', 'function', 'identifier', 'if', 'import', 'null', 'number', 'print', 'return', 'string', 'while', '{'}),
+    'program': frozenset({'!', '(', '-', ';', '[', 'assert', 'boolean', 'break', 'continue', 'exit', 'function', 'identifier', 'if', 'import', 'null', 'number', 'print', 'return', 'string', 'while', '{'}),
+}
+
+# the tokens that can follow each rule
+follow = {
+    'simple_expression': frozenset({'!=', '&&', '(', ')', '*', '+', ',', '-', '.', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, '[', ']', '^', '||', '}'}),
+    'list': frozenset({'!=', '&&', '(', ')', '*', '+', ',', '-', '.', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, '[', ']', '^', '||', '}'}),
+    'object': frozenset({'!=', '&&', '(', ')', '*', '+', ',', '-', '.', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, '[', ']', '^', '||', '}'}),
+    'function': frozenset({'!=', '&&', '(', ')', '*', '+', ',', '-', '.', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, '[', ']', '^', '||', '}'}),
+    'complex_expression': frozenset({'!=', '&&', ')', '*', '+', ',', '-', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, ']', '^', '||', '}'}),
+    'arithmetic_factor': frozenset({'!=', '&&', ')', '*', '+', ',', '-', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, ']', '^', '||', '}'}),
+    'exponent_expression': frozenset({'!=', '&&', ')', '*', '+', ',', '-', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, ']', '||', '}'}),
+    'arithmetic_term': frozenset({'!=', '&&', ')', '+', ',', '-', ':', ';', '<', '<=', '=', '==', '>', '>=', None, ']', '||', '}'}),
+    'arithmetic_expression': frozenset({'!=', '&&', ')', ',', ':', ';', '<', '<=', '=', '==', '>', '>=', None, ']', '||', '}'}),
+    'relational_expression': frozenset({'&&', ')', ',', ':', ';', '=', None, ']', '||', '}'}),
+    'logical_factor': frozenset({'&&', ')', ',', ':', ';', '=', None, ']', '||', '}'}),
+    'logical_term': frozenset({')', ',', ':', ';', '=', None, ']', '||', '}'}),
+    'logical_expression': frozenset({')', ',', ':', ';', '=', None, ']', '}'}),
+    'assignment_expression': frozenset({')', ',', ':', ';', None, ']', '}'}),
+    'expression': frozenset({')', ',', ':', ';', None, ']', '}'}),
+    'return_statement': frozenset({';', None, '}'}),
+    'print_statement': frozenset({';', None, '}'}),
+    'function_statement': frozenset({';', None, '}'}),
+    'if_statement': frozenset({';', None, '}'}),
+    'while_statement': frozenset({';', None, '}'}),
+    'statement_list': frozenset({'!=', '&&', '(', ')', '*', '+', ',', '-', '.', '/', ':', ';', '<', '<=', '=', '==', '>', '>=', None, '[', ']', '^', 'else', '||', '}'}),
+    'exit_statement': frozenset({';', None, '}'}),
+    'assert_statement': frozenset({';', None, '}'}),
+    'import_statement': frozenset({';', None, '}'}),
+    'break_statement': frozenset({';', None, '}'}),
+    'continue_statement': frozenset({';', None, '}'}),
+    'statement': frozenset({';', None, '}'}),
+    'program': frozenset({None}),
+}
+
+# the tokens that start each [ ... ] and { ... } of a rule, in order
+options = {
+    'list': [frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}), frozenset({','})],
+    'object': [frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}), frozenset({','})],
+    'function': [frozenset({'identifier'}), frozenset({','})],
+    'complex_expression': [frozenset({'(', '.', '['}), frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'}), frozenset({','})],
+    'exponent_expression': [frozenset({'^'})],
+    'arithmetic_term': [frozenset({'*', '/'})],
+    'arithmetic_expression': [frozenset({'+', '-'})],
+    'relational_expression': [frozenset({'!=', '<', '<=', '==', '>', '>='})],
+    'logical_term': [frozenset({'&&'})],
+    'logical_expression': [frozenset({'||'})],
+    'assignment_expression': [frozenset({'='})],
+    'return_statement': [frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'})],
+    'print_statement': [frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'})],
+    'function_statement': [frozenset({'identifier'}), frozenset({','})],
+    'if_statement': [frozenset({'else'})],
+    'statement_list': [frozenset({'!', '(', '-', '[', 'assert', 'boolean', 'break', 'continue', 'exit', 'function', 'identifier', 'if', 'import', 'null', 'number', 'print', 'return', 'string', 'while', '{'}), frozenset({';'}), frozenset({'!', '(', '-', '[', 'assert', 'boolean', 'break', 'continue', 'exit', 'function', 'identifier', 'if', 'import', 'null', 'number', 'print', 'return', 'string', 'while', '{'})],
+    'exit_statement': [frozenset({'!', '(', '-', '[', 'boolean', 'function', 'identifier', 'null', 'number', 'string', '{'})],
+    'assert_statement': [frozenset({','})],
+    'program': [frozenset({'!', '(', '-', '[', 'assert', 'boolean', 'break', 'continue', 'exit', 'function', 'identifier', 'if', 'import', 'null', 'number', 'print', 'return', 'string', 'while', '{'}), frozenset({';'}), frozenset({'!', '(', '-', '[', 'assert', 'boolean', 'break', 'continue', 'exit', 'function', 'identifier', 'if', 'import', 'null', 'number', 'print', 'return', 'string', 'while', '{'})],
+}
+
+# the alternative to parse for each token, for the rules that are choices
+dispatch = {
+    'simple_expression': {'!': 8, '(': 10, '-': 7, '[': 'list', 'boolean': 1, 'function': 'function', 'identifier': 0, 'null': 4, 'number': 2, 'string': 3, '{': 'object'},
+    'statement': {'!': 'expression', '(': 'expression', '-': 'expression', '[': 'expression', 'assert': 'assert_statement', 'boolean': 'expression', 'break': 'break_statement', 'continue': 'continue_statement', 'exit': 'exit_statement', 'function': 'function_statement', 'identifier': 'expression', 'if': 'if_statement', 'import': 'import_statement', 'null': 'expression', 'number': 'expression', 'print': 'print_statement', 'return': 'return_statement', 'string': 'expression', 'while': 'while_statement', '{': 'expression'},
+}
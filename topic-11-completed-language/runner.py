@@ -1,27 +1,101 @@
 #!/usr/bin/env python
 
-import sys
+import argparse
 
-from tokenizer import tokenize
+from tokenizer import LineIndex, tokenize, tokenize_stream
 
-from parser import parse
+from parser import parse, parse_statements_lazily, token_view
 
-from evaluator import evaluate
+from evaluator import evaluate, evaluate_program, evaluate_statements
+
+import closures
+
+import bytecode
+
+import transpiler
+
+import tiered
+
+from cache import parse_file
+
+from nodes import intern
+
+# the evaluate() of each way of running a script
+engines = {
+    "tree": evaluate,
+    "closures": closures.evaluate,
+    "bytecode": bytecode.evaluate,
+    "python": transpiler.evaluate,
+    "tiered": tiered.evaluate,
+}
 
 def main():
+    arguments_parser = argparse.ArgumentParser(description="Runs a Trivial script, or a REPL without one.")
+    arguments_parser.add_argument("script", nargs="?", help="the script to run")
+    arguments_parser.add_argument(
+        "--no-cache", action="store_true", help="always parse the script, without reading or writing __pycache__"
+    )
+    arguments_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="parse and run the script one statement at a time, in bounded memory, without the cache;"
+        " statements before a syntax error are run",
+    )
+    arguments_parser.add_argument(
+        "--intern",
+        action="store_true",
+        help="share the identical subtrees of the parsed script, which saves memory for generated scripts;"
+        " ignored with --stream and --engine python",
+    )
+    arguments_parser.add_argument(
+        "--engine",
+        choices=list(engines),
+        default="tree",
+        help="how to run the script: walking the AST (the default), compiled to Python closures,"
+        " compiled to bytecode for a stack VM, translated to Python (cached in __pycache__),"
+        " or in the VM with hot functions and loops translated to Python",
+    )
+    arguments_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="with --engine tiered, print the functions and loops that were compiled, and the time that saved",
+    )
+    arguments_parser.add_argument(
+        "--disassemble", action="store_true", help="print the script's bytecode instead of running it"
+    )
+    arguments = arguments_parser.parse_args()
+    if arguments.stats and arguments.engine != "tiered":
+        arguments_parser.error("--stats needs --engine tiered")
+    engine = engines[arguments.engine]
     environment = {}
     
     # Check for command line arguments
-    if len(sys.argv) > 1:
+    if arguments.script:
         # Filename provided, read and execute it
-        with open(sys.argv[1], 'r') as f:
-            source_code = f.read()
+        # the parsed script is cached in __pycache__ next to it
         try:
-            tokens = tokenize(source_code)
-            ast = parse(tokens)
-            evaluate(ast, environment)
+            lines = LineIndex()
+            if arguments.stream:
+                # each statement is dropped once it has run, unless it defined a function
+                with open(arguments.script, "r") as f:
+                    tokens = token_view(tokenize_stream(f, lines=lines), lines)
+                    evaluate_statements(parse_statements_lazily(tokens), environment, lines, engine)
+            elif arguments.engine == "python" and not arguments.disassemble:
+                # the translated script is cached instead of the AST
+                transpiler.run_file(arguments.script, environment, use_cache=not arguments.no_cache)
+            else:
+                positions = []
+                ast = parse_file(arguments.script, lines, positions, use_cache=not arguments.no_cache)
+                if arguments.intern:
+                    ast = intern(ast)
+                if arguments.disassemble:
+                    print(bytecode.disassemble(bytecode.compile(ast)))
+                    return
+                evaluate_program(ast, environment, positions, lines, engine)
         except Exception as e:
             print(f"Error: {e}")
+        if arguments.stats:
+            print(tiered.profile.report())
 
 
     else:
@@ -36,9 +110,11 @@ def main():
                     break
 
                 # Tokenize, parse, and execute the code
-                tokens = tokenize(source_code)
-                ast = parse(tokens)
-                print(evaluate(ast, environment) [0])   
+                lines = LineIndex()
+                tokens = token_view(tokenize(source_code, lines=lines), lines)
+                positions = []
+                ast = parse(tokens, positions)
+                print(evaluate_program(ast, environment, positions, lines, engine) [0])   
 
                 
             except Exception as e:
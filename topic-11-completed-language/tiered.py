@@ -0,0 +1,327 @@
+import time
+
+from tokenizer import tokenize
+from parser import parse
+from evaluator import ast_to_string
+import bytecode
+import transpiler
+import contextlib
+import io
+
+# TIERED EXECUTION
+
+# Scripts start in the bytecode VM, which is cheap to compile to, with a
+# Profile that counts the calls of each function and the iterations of each
+# while loop. A function called call_threshold times is translated to Python
+# by the transpiler, and its later calls run the translated def. A loop that
+# has iterated iteration_threshold times is translated too, and the rest of
+# the run of it, and its later runs, use the translation.
+#
+# The translated code makes no assumptions about types: it does arithmetic on
+# numbers inline, and everything else the evaluator's way, so a value of an
+# unexpected type takes the slow path instead of invalidating the code. A
+# function or loop that fails to translate, e.g. one nested too deeply for
+# CPython's compiler, stays in the VM.
+#
+# The Profile also times each function and loop in both tiers, to estimate
+# the time that compiling them saved, which report() shows.
+
+call_threshold = 100
+iteration_threshold = 1000
+
+
+class Unit:
+    """
+    The counts and times of a function body or while loop in the two tiers.
+    """
+
+    def __init__(self, node, kind):
+        self.node = node
+        self.kind = kind  # "call" or "iteration"
+        self.label = None
+        self.entered = 0  # calls or iterations started in the VM
+        self.interpreted = 0  # calls or iterations timed in the VM
+        self.interpreted_time = 0.0
+        self.counter = [0]  # calls or iterations run by the translated code
+        # the time the VM spent running the translated code, and how many of
+        # the counted calls or iterations that was
+        self.compiled_time = 0.0
+        self.measured = 0
+        self.compile_time = None  # set once promoted
+        self.compiled = None
+        self.failed = None  # why it couldn't be translated
+
+    def saved(self):
+        # estimated from the average times in each tier, for all the compiled
+        # calls or iterations, less the time to compile
+        if not self.interpreted or not self.measured:
+            return 0.0
+        difference = self.interpreted_time / self.interpreted - self.compiled_time / self.measured
+        return self.counter[0] * difference - self.compile_time
+
+    def describe(self):
+        kind = self.kind + "s"
+        line = f"{self.label}: {self.interpreted} {kind} interpreted"
+        if self.interpreted:
+            line += f" ({self.interpreted_time / self.interpreted * 1e6:.2f} us each)"
+        if self.failed:
+            return line + f", not compiled: {self.failed}"
+        line += f", {self.counter[0]} compiled"
+        if self.measured:
+            line += f" ({self.compiled_time / self.measured * 1e6:.2f} us each)"
+        line += f", {self.compile_time * 1000:.2f} ms to compile, saved about {self.saved() * 1000:.2f} ms"
+        return line
+
+
+class Profile:
+    """
+    The counters of a tiered run, and the functions and loops it promoted.
+    bytecode.run() calls call() and leave() around the calls it runs, and
+    loop() at the end of each loop iteration.
+    """
+
+    def __init__(self):
+        self.functions = {}  # id of a function body -> its Unit
+        self.loops = {}  # (id of a Code, offset of a loop in it) -> (the Code, its Unit)
+        self.timers = []  # [Unit, start] of each call running in the VM, innermost last
+        self.iterations = {}  # id of a loop's Unit -> (environment, time) of its last iteration
+
+    def call(self, function, local_environment):
+        # counts a call of function, and returns whether to run it compiled
+        body = function["body"]
+        unit = self.functions.get(id(body))
+        if unit is None or unit.node is not body:
+            unit = self.functions[id(body)] = Unit(body, "call")
+        # the calling function's time doesn't include this call, or compiling
+        now = time.perf_counter()
+        self.pause(now)
+        if unit.compiled is None and unit.failed is None:
+            unit.entered += 1
+            if unit.entered > call_threshold:
+                unit.label = function_label(function, local_environment["$parent"])
+                self.promote(unit, lambda: transpiler.compile_function(body, unit.counter))
+                now = time.perf_counter()
+        if unit.compiled is not None:
+            if self.timers:
+                self.timers[-1][1] = now
+            return True
+        # time the call in the VM, excluding the calls it makes
+        self.timers.append([unit, now])
+        return False
+
+    def leave(self):
+        # a call timed by call() returned
+        now = time.perf_counter()
+        unit, start = self.timers.pop()
+        unit.interpreted += 1
+        unit.interpreted_time += now - start
+        if self.timers:
+            self.timers[-1][1] = now
+
+    def pause(self, now):
+        # stops timing the innermost call, which is calling another function
+        if self.timers:
+            timer = self.timers[-1]
+            timer[0].interpreted_time += now - timer[1]
+
+    def run_function(self, function, local_environment):
+        unit = self.functions[id(function["body"])]
+        count = unit.counter[0]
+        start = time.perf_counter()
+        self.pause(start)
+        try:
+            return transpiler.call_body(function["body"], local_environment)
+        finally:
+            now = time.perf_counter()
+            unit.compiled_time += now - start
+            unit.measured += unit.counter[0] - count
+            if self.timers:
+                self.timers[-1][1] = now
+
+    def loop(self, code, offset, environment):
+        # counts an iteration of the loop at offset in code, and returns its
+        # translated def, to run the rest of the loop, once it is hot
+        entry = self.loops.get((id(code), offset))
+        if entry is None or entry[0] is not code:
+            ast = code.loops[offset][0]
+            entry = self.loops[id(code), offset] = (code, Unit(ast, "iteration"))
+        unit = entry[1]
+        if unit.compiled is not None:
+            return unit.compiled
+        if unit.failed is not None:
+            return None
+        now = time.perf_counter()
+        last = self.iterations.get(id(unit))
+        if last is not None and last[0] is environment:
+            unit.interpreted += 1
+            unit.interpreted_time += now - last[1]
+        self.iterations[id(unit)] = (environment, now)
+        unit.entered += 1
+        if unit.entered > iteration_threshold:
+            unit.label = loop_label(unit.node, code)
+            self.promote(unit, lambda: self.timed(unit, transpiler.compile_loop(unit.node, unit.counter)))
+            del self.iterations[id(unit)]
+        return unit.compiled
+
+    def timed(self, unit, loop):
+        def run(environment):
+            count = unit.counter[0]
+            start = time.perf_counter()
+            self.pause(start)
+            try:
+                return loop(environment)
+            finally:
+                now = time.perf_counter()
+                unit.compiled_time += now - start
+                unit.measured += unit.counter[0] - count
+                if self.timers:
+                    self.timers[-1][1] = now
+
+        return run
+
+    def promote(self, unit, translate):
+        # unit.compiled is set to what translate() returns
+        start = time.perf_counter()
+        try:
+            unit.compiled = translate()
+        except (SyntaxError, RecursionError, MemoryError) as e:
+            unit.failed = f"{type(e).__name__}: {e}"
+        unit.compile_time = time.perf_counter() - start
+
+    def report(self):
+        """
+        Describes the functions and loops that were promoted, with their
+        counts and times in each tier, and the time compiling them saved.
+        """
+        units = [unit for unit in self.functions.values() if unit.label]
+        units += [unit for _, unit in self.loops.values() if unit.label]
+        promoted = [unit for unit in units if not unit.failed]
+        lines = [f"tiered execution: {len(promoted)} of {len(units)} hot functions and loops compiled"]
+        for unit in sorted(units, key=lambda unit: -unit.saved() if not unit.failed else 0):
+            lines.append("  " + unit.describe())
+        if promoted:
+            lines.append(f"  total saved about {sum(unit.saved() for unit in promoted) * 1000:.2f} ms")
+        return "\n".join(lines)
+
+
+def function_label(function, environment):
+    # the name the function is called by, if the calling environment has one
+    parameters = ", ".join(parameter["value"] for parameter in function["parameters"])
+    scope = environment
+    while scope is not None:
+        for name, value in scope.items():
+            if isinstance(value, dict) and value.get("body") is function["body"]:
+                return f"{name}({parameters})"
+        scope = scope.get("$parent")
+    return f"function({parameters})"
+
+
+def loop_label(ast, code):
+    try:
+        condition = ast_to_string(ast.condition)
+    except (AssertionError, KeyError):
+        condition = "..."
+    if not condition.startswith("("):
+        condition = f"({condition})"
+    return f"while {condition} in {code.name}"
+
+
+profile = Profile()
+
+
+def evaluate(ast, environment, depth=0):
+    """
+    Runs ast in the bytecode VM with the module's profile, promoting hot
+    functions and loops to Python, as a drop-in replacement for
+    evaluator.evaluate().
+    """
+    timers = len(profile.timers)
+    try:
+        return bytecode.run(bytecode.compile(ast), environment, profile)
+    finally:
+        # calls left running by an error
+        del profile.timers[timers:]
+
+
+def run_program(evaluate_with, source):
+    # the result, environment and output of running source, or the error
+    environment = {}
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        try:
+            value = evaluate_with(parse(tokenize(source)), environment)
+        except Exception as e:
+            # the first line, since pytest adds an explanation to a failed assert's message
+            value = ("error", type(e), str(e).split("\n")[0])
+    return value, environment, output.getvalue()
+
+
+def test_tiered():
+    print("testing tiered evaluate...")
+    # promoted or not, functions and loops do what evaluate() does
+    global call_threshold, iteration_threshold, profile
+    import evaluator
+
+    sources = []
+    for name in ["basic-test.t", "feature-test.t", "../tmp.tc"]:
+        with open(name) as f:
+            sources.append(f.read())
+    sources += [
+        "function f(n) { if (n < 2) { return n }; return f(n - 1) + f(n - 2) }; x = f(12)",
+        "function f(x) { return x + x }; i = 0; y = []; while (i < 6) { y = y + [f(i), f(\"s\"), f([i])]; i = i + 1 }",
+        "function f(x) { return -x }; i = 0; while (i < 6) { i = i + 1; if (i == 5) { y = f(\"s\") } else { f(i) } }",
+        "function f() { i = 0; while (1) { i = i + 1; if (i > 5) { return i } } }; x = f() + f() + f()",
+        "i = 0; while (i < 10) { i = i + 1; if (i == 7) { return i } }",
+        "function f(n) { while (n > 0) { n = n - 1; g = n } ; return g }; x = [f(3), f(4), f(5), f(6)]",
+        "function f(n) { if (n == 0) { return 0 }; return 1 + f(n - 1) }; x = f(2000); y = f(10)",
+        "i = 0; while (i < 10) { i = i + 1; x = i / (5 - i) }",
+    ]
+    saved = call_threshold, iteration_threshold, profile
+    call_threshold, iteration_threshold = 2, 3
+    try:
+        for source in sources:
+            profile = Profile()
+            assert run_program(evaluate, source) == run_program(evaluator.evaluate, source), source
+        profile = Profile()
+        run_program(evaluate, sources[4])
+        [unit] = profile.functions.values()
+        assert unit.label == "f(x)" and unit.entered == 3 and unit.interpreted == 2 and unit.counter[0] == 16
+        [(_, unit)] = profile.loops.values()
+        assert unit.label == "while (i<6) in <program>" and unit.interpreted == 3 and unit.counter[0] == 2
+        assert "2 of 2 hot functions and loops compiled" in profile.report()
+
+        # a function that can't be translated stays in the VM
+        profile = Profile()
+        source = "function f(n) { " + "if (1) { " * 120 + "m = n" + " }" * 120 + "; return m }; x = [f(1), f(2), f(3), f(4)]"
+        limit = transpiler.statement_depth_limit
+        transpiler.statement_depth_limit = 1000
+        try:
+            assert run_program(evaluate, source)[1]["x"] == [1, 2, 3, 4]
+        finally:
+            transpiler.statement_depth_limit = limit
+        [unit] = profile.functions.values()
+        assert unit.failed.startswith("IndentationError") and unit.interpreted == 4
+        assert "0 of 1 hot functions and loops compiled" in profile.report()
+    finally:
+        call_threshold, iteration_threshold, profile = saved
+
+
+def test_evaluator_tests():
+    print("testing tiered evaluate with the evaluator's tests...")
+    import evaluator
+
+    tests = [value for name, value in vars(evaluator).items() if name.startswith("test_")]
+    saved = evaluator.evaluate
+    evaluator.evaluate = evaluate
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for test in tests:
+                test()
+    finally:
+        evaluator.evaluate = saved
+
+
+if __name__ == "__main__":
+    print("testing tiered.")
+    test_tiered()
+    test_evaluator_tests()
+    print("done.")
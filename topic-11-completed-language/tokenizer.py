@@ -1,30 +1,23 @@
+import array
+import bisect
+import codecs
+import concurrent.futures
+import contextlib
+import gc
+import io
+import itertools
+import mmap
+import os
 import re
+import sys
+import tempfile
 
 patterns = [
     [r"//[^\n]*", "comment"],  # Comment
     [r"\s+", "whitespace"],  # Whitespace
     [r"\d*\.\d+|\d+\.\d*|\d+", "number"],  # numeric literals
     [r'"([^"]|"")*"', "string"],  # string literals
-    [r"true|false", "boolean"],  # boolean literals
-    [r"null", "null"],  # the null literal
-    [r"function", "function"],  # function keyword
-    [r"return", "return"],  # return keyword
-    [r"if", "if"],  # if keyword
-    [r"else", "else"],  # else keyword
-    [r"while", "while"],  # while keyword
-    [r"for", "for"],  # for keyword
-    [r"break", "break"],  # for keyword
-    [r"continue", "continue"],  # for keyword
-    [r"print", "print"],  # print keyword
-    [r"import", "import"],  # import keyword
-    [r"external", "external"],  # external keyword
-    [r"input", "input"],  # function keyword
-    [r"exit", "exit"],  # exit keyword
-    [r"and", "&&"],  # alternate for &&
-    [r"or", "||"],  # alternate for ||
-    [r"not", "!"],  # alternate for !
-    [r"assert","assert"],
-    [r"[a-zA-Z_][a-zA-Z0-9_]*", "identifier"],  # identifiers
+    [r"[a-zA-Z_][a-zA-Z0-9_]*", "identifier"],  # identifiers and keywords
     [r"\+", "+"],
     [r"\-", "-"],
     [r"\*", "*"],
@@ -54,55 +47,723 @@ patterns = [
     [r".", "error"],  # unexpected content
 ]
 
+# words matched by the identifier pattern that are keywords or literals
+keywords = {
+    "true": "boolean",  # boolean literals
+    "false": "boolean",
+    "null": "null",  # the null literal
+    "function": "function",  # function keyword
+    "return": "return",  # return keyword
+    "if": "if",  # if keyword
+    "else": "else",  # else keyword
+    "while": "while",  # while keyword
+    "for": "for",  # for keyword
+    "break": "break",  # break keyword
+    "continue": "continue",  # continue keyword
+    "print": "print",  # print keyword
+    "import": "import",  # import keyword
+    "external": "external",  # external keyword
+    "input": "input",  # input keyword
+    "exit": "exit",  # exit keyword
+    "and": "&&",  # alternate for &&
+    "or": "||",  # alternate for ||
+    "not": "!",  # alternate for !
+    "assert": "assert",  # assert keyword
+}
+
 for pattern in patterns:
     pattern[0] = re.compile(pattern[0])
 
+# all of the patterns combined into a single alternation, one named group per
+# pattern. alternatives are tried in order, so the first pattern that matches
+# wins, exactly as in the pattern-by-pattern loop.
+master_pattern = re.compile(
+    "|".join(f"(?P<t{i}>{pattern.pattern})" for i, (pattern, tag) in enumerate(patterns))
+)
+
+# map from group number to tag. the named group for a pattern always closes
+# last, so match.lastindex is the number of the pattern's own group.
+group_tags = [None] * (master_pattern.groups + 1)
+for name, index in master_pattern.groupindex.items():
+    group_tags[index] = patterns[int(name[1:])][1]
+
+
+class Token:
+    """
+    A lexical token. Tokens use slots instead of a dict per token, but still
+    support token["tag"] and compare equal to the equivalent
+    {"tag", "value", "position"} dict.
+    """
+
+    __slots__ = ("tag", "value", "position")
+
+    def __init__(self, tag, value, position):
+        self.tag = tag
+        self.value = value
+        self.position = position
+
+    def __getitem__(self, key):
+        if key in Token.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in Token.__slots__
+
+    def keys(self):
+        return list(Token.__slots__)
+
+    def as_dict(self):
+        return {"tag": self.tag, "value": self.value, "position": self.position}
+
+    def __eq__(self, other):
+        if isinstance(other, Token):
+            return (
+                self.tag == other.tag
+                and self.value == other.value
+                and self.position == other.position
+            )
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+# the same patterns for lexing bytes, such as a memory-mapped file. on ASCII
+# they match what the str patterns do, once \s also matches the separators
+# \x1c-\x1f, as it does for str. other sources are lexed as text.
+master_bytes_pattern = re.compile(master_pattern.pattern.replace(r"\s", r"[\s\x1c-\x1f]").encode())
+non_ascii = re.compile(rb"[\x80-\xff]")
+byte_keywords = {keyword.encode(): tag for keyword, tag in keywords.items()}
+
+# values of the tokens whose text never needs decoding
+byte_values = {keyword.encode(): keyword for keyword in keywords}
+byte_values.update(
+    {tag.encode(): tag for pattern, tag in patterns if tag != "identifier" and pattern.fullmatch(tag)}
+)
+
+
+class LineIndex:
+    """
+    The start positions of the lines of a source, recorded while it is lexed,
+    for turning positions into line and column numbers (counting from 1).
+    """
+
+    def __init__(self, text=None):
+        self.starts = [0]
+        self.released = 0  # the number of lines before starts[0]
+        if text is not None:
+            self.add(text, 0)
+
+    def add(self, text, offset):
+        # record the lines that start in text, which begins at offset
+        newline = "\n" if isinstance(text, str) else b"\n"
+        starts = self.starts
+        i = text.find(newline)
+        while i >= 0:
+            starts.append(offset + i + 1)
+            i = text.find(newline, i + 1)
+
+    def locate(self, position):
+        line = bisect.bisect_right(self.starts, position)
+        return self.released + line, position - self.starts[line - 1] + 1
+
+    def release(self, position):
+        # forget the lines before the one containing position, which can no
+        # longer be located, so a long stream is indexed in bounded memory
+        line = bisect.bisect_right(self.starts, position) - 1
+        del self.starts[:line]
+        self.released += line
+
+    def describe(self, position):
+        line, column = self.locate(position)
+        return f"line {line}, column {column}"
+
+
+def illegal_character(character, position, lines):
+    return Exception(f"Syntax error: illegal character : {[character]} at {lines.describe(position)}")
+
+
 test_generated_tags = set()
 
 # The lex/tokenize function
-def tokenize(characters, generated_tags=test_generated_tags):
+def tokenize(characters, generated_tags=test_generated_tags, lines=None):
+    if lines is not None:
+        lines.add(characters, 0)
     tokens = []
     position = 0
-    while position < len(characters):
-        # find the first token pattern that matches
-        for pattern, tag in patterns:
-            match = pattern.match(characters, position)
-            if match:
-                break
-
-        # this should never fail, since the last pattern matches everything.
-        assert match
+    end = len(characters)
+    match_token = master_pattern.match
+    keyword_tag = keywords.get
+    while position < end:
+        # one match finds the first token pattern that matches
+        match = match_token(characters, position)
+        tag = group_tags[match.lastindex]
+        if tag == "identifier":
+            tag = keyword_tag(match.group(0), "identifier")
 
         # note that the tag was generated
         generated_tags.add(tag)
 
         # complain about errors and throw exception
         if tag == "error":
-            raise Exception(f"Syntax error: illegal character : {[match.group(0)]}")
+            raise illegal_character(match.group(0), position, lines or LineIndex(characters[:position]))
+
+        # skip whitespace and comments
+        if tag == "comment" or tag == "whitespace":
+            position = match.end()
+            continue
 
         # package the token
-        token = {"tag": tag, "value": match.group(0), "position": position}
-        if token["tag"] == "string":
-            token["value"] = token["value"][1:-1].replace('""', '"')
-        if token["tag"] == "number":
-            if "." in token["value"]:
-                token["value"] = float(token["value"])
+        value = token_value(tag, match.group(0))
+        tokens.append(Token(tag, value, position))
+
+        # update position for next match
+        position = match.end()
+
+    tokens.append(Token(None, None, position))
+    return tokens
+
+
+def token_value(tag, text):
+    if tag == "string":
+        return text[1:-1].replace('""', '"')
+    if tag == "number":
+        if "." in text:
+            return float(text)
+        return int(text)
+    if tag == "boolean":
+        return text == "true"
+    if tag == "identifier":
+        # interned, so environment lookups compare identical keys
+        return sys.intern(text)
+    return text
+
+
+# The streaming lex/tokenize generator. The source is a string or a file
+# object that is read chunk_size characters at a time, so tokens are produced
+# before the whole source has been read and only a window of it is kept.
+def tokenize_stream(source, generated_tags=test_generated_tags, chunk_size=65536, lines=None):
+    if lines is None:
+        lines = LineIndex()
+    if isinstance(source, str):
+        buffer, read, at_end = source, None, True
+        lines.add(source, 0)
+    else:
+        buffer, read, at_end = "", source.read, False
+    offset = 0  # position of buffer[0] in the whole source
+    position = 0  # position in the buffer
+    match_token = master_pattern.match
+    while True:
+        match = match_token(buffer, position)
+        tag = group_tags[match.lastindex] if match else None
+        if tag == "identifier":
+            tag = keywords.get(match.group(0), "identifier")
+
+        # a token that reaches the end of the buffer might continue in the
+        # next chunk, a string followed by a quote might continue with an
+        # embedded quote, and an error might be an unterminated string, so
+        # read more before deciding. reads grow with the buffer to stay linear.
+        if not at_end and (
+            match is None
+            or match.end() >= len(buffer) - 1
+            or tag == "error"
+            or (tag == "string" and buffer[match.end()] == '"')
+        ):
+            chunk = read(max(chunk_size, len(buffer) - position))
+            if chunk:
+                lines.add(chunk, offset + len(buffer))
+                offset = offset + position
+                buffer = buffer[position:] + chunk
+                position = 0
             else:
-                token["value"] = int(token["value"])
-        if token["tag"] == "boolean":
-            token["value"] = True if token["value"] == "true" else False
+                at_end = True
+            continue
+
+        # end of input
+        if match is None:
+            break
+
+        # note that the tag was generated
+        generated_tags.add(tag)
 
-        # append token to stream, skipping whitespace and comments
-        if tag not in ["comment", "whitespace"]:
-            tokens.append(token)
+        # complain about errors and throw exception
+        if tag == "error":
+            raise illegal_character(match.group(0), offset + position, lines)
+
+        # yield the token, skipping whitespace and comments
+        if tag != "comment" and tag != "whitespace":
+            value = token_value(tag, match.group(0))
+            yield Token(tag, value, offset + position)
 
         # update position for next match
         position = match.end()
 
-    tokens.append({"tag": None, "value": None, "position": position})
+    yield Token(None, None, offset + position)
+
+
+# Lexing of bytes, such as a memory-mapped file, with bytes regexes. Only the
+# text of string literals and identifiers is decoded (as UTF-8). Positions are
+# byte offsets, and the bytes patterns only match as the str patterns do for
+# ASCII, so a source with other characters, like a non-breaking space or an
+# accented letter, is decoded as it is lexed by tokenize_stream() instead, and
+# gives the same tokens and positions as tokenize().
+def tokenize_bytes(data, generated_tags=test_generated_tags, lines=None):
+    if non_ascii.search(data):
+        if isinstance(data, mmap.mmap):
+            data.seek(0)
+            source = data
+        else:
+            source = io.BytesIO(data)
+        yield from tokenize_stream(codecs.getreader("utf-8")(source), generated_tags, lines=lines)
+        return
+    if lines is not None:
+        lines.add(data, 0)
+    position = 0
+    end = len(data)
+    match_token = master_bytes_pattern.match
+    while position < end:
+        match = match_token(data, position)
+        tag = group_tags[match.lastindex]
+        text = match.group(0)
+        if tag == "identifier":
+            tag = byte_keywords.get(text, "identifier")
+
+        # note that the tag was generated
+        generated_tags.add(tag)
+
+        # complain about errors and throw exception
+        if tag == "error":
+            character = text.decode("utf-8", "replace")
+            raise illegal_character(character, position, lines or LineIndex(data[:position]))
+
+        # yield the token, skipping whitespace and comments
+        if tag == "identifier":
+            yield Token(tag, sys.intern(text.decode()), position)
+        elif tag == "string":
+            yield Token(tag, text[1:-1].decode().replace('""', '"'), position)
+        elif tag == "number":
+            yield Token(tag, float(text) if b"." in text else int(text), position)
+        elif tag == "boolean":
+            yield Token(tag, text == b"true", position)
+        elif tag != "comment" and tag != "whitespace":
+            yield Token(tag, byte_values[text], position)
+
+        # update position for next match
+        position = match.end()
+
+    yield Token(None, None, position)
+
+
+@contextlib.contextmanager
+def map_file(path):
+    # a read-only memory map of a file, so the operating system's page cache
+    # holds its contents instead of a Python bytes object
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # empty files can't be mapped
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+# Lexes a file through a read-only memory map.
+def tokenize_file(path, generated_tags=test_generated_tags, lines=None):
+    with map_file(path) as data:
+        yield from tokenize_bytes(data, generated_tags, lines)
+
+
+# Incremental re-lexing for editors and the REPL. The edit replaces
+# deleted_length characters at offset with inserted_text. tokens, the tokens
+# of characters, is updated in place and the edited source is returned along
+# with the index range of the replaced tokens: tokens[start:old_stop] of the
+# old list became tokens[start:new_stop].
+#
+# Matching a pattern only depends on the characters from the match position
+# up to one past the end of the match, so lexing restarts at the last token
+# that starts before the edit. Once a re-lexed token starts after the
+# inserted text at the shifted position of an old token, the rest of the
+# source lexes exactly as before and the old tokens are kept, with their
+# positions shifted.
+def retokenize(characters, tokens, offset, deleted_length, inserted_text, generated_tags=test_generated_tags):
+    assert 0 <= offset and offset + deleted_length <= len(characters), "Edit is outside the source."
+    characters = characters[:offset] + inserted_text + characters[offset + deleted_length :]
+    delta = len(inserted_text) - deleted_length
+    edit_end = offset + len(inserted_text)  # end of the edit in the new source
+
+    # restart at the last token that starts before the edit
+    start = bisect.bisect_left(tokens, offset, key=token_position) - 1
+    if start < 0:
+        start = 0
+        position = 0
+    else:
+        position = tokens[start].position
+
+    new_tokens = []
+    old_stop = start  # the first old token that can still be kept
+    end = len(characters)
+    match_token = master_pattern.match
+    while position < end:
+        match = match_token(characters, position)
+        tag = group_tags[match.lastindex]
+        if tag == "identifier":
+            tag = keywords.get(match.group(0), "identifier")
+        generated_tags.add(tag)
+        if tag == "error":
+            raise illegal_character(match.group(0), position, LineIndex(characters[:position]))
+        if tag != "comment" and tag != "whitespace":
+            # resynchronize when a token starts where an old token started
+            if position >= edit_end:
+                while tokens[old_stop].position + delta < position:
+                    old_stop = old_stop + 1
+                if tokens[old_stop].position + delta == position and tokens[old_stop].tag is not None:
+                    break
+            value = token_value(tag, match.group(0))
+            new_tokens.append(Token(tag, value, position))
+        position = match.end()
+    else:
+        # the re-lexed tokens run to the end of the source
+        new_tokens.append(Token(None, None, position))
+        old_stop = len(tokens)
+
+    tokens[start:old_stop] = new_tokens
+    new_stop = start + len(new_tokens)
+    if delta:
+        for token in itertools.islice(tokens, new_stop, None):
+            token.position = token.position + delta
+    return characters, start, old_stop, new_stop
+
+
+def token_position(token):
+    return token.position
+
+
+# Editing a large source. retokenize() moves every token after an edit, and
+# rebuilds the source string, so an edit takes time proportional to the size
+# of the source. A TokenBuffer keeps the source in blocks of about block_size
+# characters instead, each with the tokens that start in it, positioned from
+# the start of the block. An edit re-lexes from the blocks around it, as
+# retokenize() does, and replaces only those blocks: the blocks after them
+# keep their tokens, since the start of each block and the number of tokens
+# before it are sums over the blocks, kept in Fenwick trees.
+
+
+class PrefixSums:
+    """
+    A Fenwick tree of a number for each block, such as its length. prefix()
+    sums the numbers before a block, and add() changes one of them, in
+    O(log blocks) time. The numbers must not be negative, for find().
+    """
+
+    def __init__(self, values):
+        self.tree = [0] + list(values)
+        for index in range(1, len(self.tree)):
+            parent = index + (index & -index)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[index]
+
+    def add(self, block, change):
+        index = block + 1
+        while index < len(self.tree):
+            self.tree[index] += change
+            index += index & -index
+
+    def prefix(self, block):
+        total = 0
+        while block > 0:
+            total += self.tree[block]
+            block -= block & -block
+        return total
+
+    def find(self, target):
+        # the last block whose prefix is at most target, or the number of
+        # blocks if the sum of all of them is
+        block = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            index = block + step
+            if index < len(self.tree) and self.tree[index] <= target:
+                block = index
+                target -= self.tree[index]
+            step >>= 1
+        return block
+
+
+class TokenBuffer:
+    """
+    A source and its tokens, for editors: edit() changes them as retokenize()
+    does, in time that depends on the size of the edit and of the tokens
+    around it, but not on the size of the source. source() and tokens() give
+    the whole source and the tokens that tokenize() would.
+    """
+
+    def __init__(self, characters, generated_tags=test_generated_tags, block_size=1024):
+        self.generated_tags = generated_tags
+        self.block_size = block_size
+        tokens = tokenize(characters, generated_tags)
+        tokens.pop()
+        self.texts, self.blocks = self.split(characters, tokens)
+        self.index_blocks()
+
+    def index_blocks(self):
+        self.lengths = PrefixSums(map(len, self.texts))
+        self.counts = PrefixSums(map(len, self.blocks))
+
+    def split(self, text, tokens):
+        # text in blocks of about block_size characters, with the tokens that
+        # start in each, repositioned from the start of the block
+        count = max(1, len(text) // self.block_size)
+        texts = []
+        blocks = []
+        index = 0
+        for block in range(count):
+            start = block * self.block_size
+            stop = len(text) if block == count - 1 else start + self.block_size
+            texts.append(text[start:stop])
+            tokens_in_block = []
+            while index < len(tokens) and (tokens[index].position < stop or block == count - 1):
+                token = tokens[index]
+                token.position = token.position - start
+                tokens_in_block.append(token)
+                index = index + 1
+            blocks.append(tokens_in_block)
+        return texts, blocks
+
+    def source(self):
+        return "".join(self.texts)
+
+    def tokens(self):
+        tokens = []
+        start = 0
+        for text, block in zip(self.texts, self.blocks):
+            tokens.extend(Token(token.tag, token.value, token.position + start) for token in block)
+            start = start + len(text)
+        tokens.append(Token(None, None, start))
+        return tokens
+
+    def edit(self, offset, deleted_length, inserted_text):
+        """
+        Replaces deleted_length characters at offset with inserted_text, and
+        returns the index range of the replaced tokens as retokenize() does:
+        tokens()[start:old_stop] before the edit became tokens()[start:new_stop].
+        """
+        texts = self.texts
+        blocks = self.blocks
+        length = self.lengths.prefix(len(texts))
+        assert 0 <= offset and offset + deleted_length <= length, "Edit is outside the source."
+
+        # the blocks the edit touches, from the last one with a token that
+        # starts before the edit, since lexing restarts at that token
+        first = min(self.lengths.find(offset), len(texts) - 1)
+        base = self.lengths.prefix(first)
+        while first > 0 and not (blocks[first] and blocks[first][0].position < offset - base):
+            first = first - 1
+            base = base - len(texts[first])
+        stop = min(self.lengths.find(offset + deleted_length), len(texts) - 1) + 1
+
+        # the old tokens of the blocks, and their positions from base
+        old_tokens = []
+        positions = []
+        old_length = 0
+        for block in range(first, stop):
+            old_tokens.extend(blocks[block])
+            positions.extend(old_length + token.position for token in blocks[block])
+            old_length = old_length + len(texts[block])
+        old_text = "".join(texts[first:stop])
+        local = offset - base
+        text = old_text[:local] + inserted_text + old_text[local + deleted_length :]
+        delta = len(inserted_text) - deleted_length
+        edit_end = local + len(inserted_text)
+
+        def extend():
+            # takes in the next block, when the tokens so far can't tell
+            nonlocal text, old_length, stop
+            old_tokens.extend(blocks[stop])
+            positions.extend(old_length + token.position for token in blocks[stop])
+            text = text + texts[stop]
+            old_length = old_length + len(texts[stop])
+            stop = stop + 1
+
+        restart = bisect.bisect_left(positions, local) - 1
+        if restart < 0:
+            restart = 0
+            position = 0
+        else:
+            position = positions[restart]
+        new_tokens = []
+        old_stop = restart  # the first old token that can still be kept
+        at_end = False
+        match_token = master_pattern.match
+        while True:
+            if position >= len(text):
+                if stop == len(texts):
+                    # the re-lexed tokens run to the end of the source
+                    old_stop = len(old_tokens)
+                    at_end = True
+                    break
+                extend()
+                continue
+            match = match_token(text, position)
+            tag = group_tags[match.lastindex]
+            end = match.end()
+            if stop < len(texts) and (
+                end >= len(text) or (tag == "string" and text[end] == '"') or (tag == "error" and text[position] == '"')
+            ):
+                # the token may go on into the next block: a string goes on
+                # past a "" pair, and a " that starts no string here may start
+                # one that ends in a later block
+                extend()
+                continue
+            if tag == "identifier":
+                tag = keywords.get(match.group(0), "identifier")
+            self.generated_tags.add(tag)
+            if tag == "error":
+                before = "".join(texts[:first]) + text[:position]
+                raise illegal_character(match.group(0), len(before), LineIndex(before))
+            if tag != "comment" and tag != "whitespace":
+                # resynchronize when a token starts where an old token started
+                if position >= edit_end:
+                    while old_stop < len(positions) and positions[old_stop] + delta < position:
+                        old_stop = old_stop + 1
+                    if old_stop == len(positions) and stop < len(texts):
+                        extend()
+                        continue
+                    if old_stop < len(positions) and positions[old_stop] + delta == position:
+                        break
+                new_tokens.append(Token(tag, token_value(tag, match.group(0)), position))
+            position = match.end()
+
+        # the edited blocks, with the old tokens before and after the re-lexed ones
+        for token, position in zip(old_tokens[:restart], positions):
+            token.position = position
+        for token, position in zip(old_tokens[old_stop:], positions[old_stop:]):
+            token.position = position + delta
+        tokens_before = self.counts.prefix(first)
+        old_count = len(old_tokens)
+        new_texts, new_blocks = self.split(text, old_tokens[:restart] + new_tokens + old_tokens[old_stop:])
+        if len(new_texts) == stop - first:
+            for block, (new_text, new_block) in enumerate(zip(new_texts, new_blocks), first):
+                self.lengths.add(block, len(new_text) - len(texts[block]))
+                self.counts.add(block, len(new_block) - len(blocks[block]))
+            texts[first:stop] = new_texts
+            blocks[first:stop] = new_blocks
+        else:
+            texts[first:stop] = new_texts
+            blocks[first:stop] = new_blocks
+            self.index_blocks()
+
+        start = tokens_before + restart
+        if at_end:
+            # the end token was replaced too
+            return start, tokens_before + old_count + 1, start + len(new_tokens) + 1
+        return start, tokens_before + old_stop, start + len(new_tokens)
+
+
+# Parallel lexing of one large source. The source is split into chunks at
+# newlines outside string literals and comments: no other token contains a
+# newline, and whitespace tokens are skipped, so lexing each chunk on its own
+# and adding the chunk's offset to the positions gives the same tokens as
+# lexing the whole source. The chunks are lexed in a process pool, which only
+# pays for starting the workers and sending the tokens back with enough cores
+# and a large enough source, so otherwise the source is lexed sequentially.
+def tokenize_parallel(
+    characters, generated_tags=test_generated_tags, processes=None, chunk_size=1 << 20, lines=None, min_size=1 << 20
+):
+    cores = available_cores()
+    processes = cores if processes is None else min(processes, cores)
+    if processes == 1 or len(characters) < min_size:
+        return tokenize(characters, generated_tags, lines)
+    offsets = chunk_offsets(characters, max(chunk_size, len(characters) // (4 * processes) + 1))
+    if len(offsets) == 1:
+        return tokenize(characters, generated_tags, lines)
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        return lex_chunks(characters, offsets, executor.map, generated_tags, lines)
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def lex_chunks(characters, offsets, map_chunks, generated_tags=test_generated_tags, lines=None):
+    # the tokens of characters, from the results of lex_chunk() for the
+    # chunks at offsets, made by map_chunks(), such as a pool's map()
+    chunks = [characters[start:stop] for start, stop in zip(offsets, offsets[1:] + [len(characters)])]
+    tokens = []
+    intern = sys.intern
+    identifier = tag_codes["identifier"]
+    # the tokens hold no cycles, so collecting garbage while they are made,
+    # which takes longer the more of them there are, would only waste time
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for result in map_chunks(lex_chunk, chunks, offsets):
+            if result is None:
+                # a chunk has an illegal character: lex again for the same error
+                return tokenize(characters, generated_tags, lines)
+            codes, values, positions, chunk_tags = result
+            generated_tags.update(chunk_tags)
+            # identifiers are interned in this process, as tokenize() does
+            values = [intern(value) if code == identifier else value for code, value in zip(codes, values)]
+            tokens.extend(map(Token, map(tag_names.__getitem__, codes), values, positions))
+    finally:
+        if collecting:
+            gc.enable()
+    tokens.append(Token(None, None, len(characters)))
+    if lines is not None:
+        lines.add(characters, 0)
     return tokens
 
 
+def chunk_offsets(characters, chunk_size):
+    # the start offsets of the chunks: the first line start at least chunk_size
+    # past the previous chunk that is outside every string literal and comment
+    offsets = [0]
+    unsafe = re.finditer(r'"([^"]|"")*"|//[^\n]*', characters)
+    span = next(unsafe, None)
+    target = chunk_size
+    while target < len(characters):
+        newline = characters.find("\n", target)
+        if newline < 0 or newline + 1 == len(characters):
+            break
+        # skip the strings and comments that end before the newline
+        while span is not None and span.end() <= newline:
+            span = next(unsafe, None)
+        if span is not None and span.start() <= newline:
+            # the newline is inside a string: look again after it
+            target = span.end()
+            continue
+        offsets.append(newline + 1)
+        target = newline + 1 + chunk_size
+    return offsets
+
+
+# every tag, and its number in the results of lex_chunk()
+tag_names = tuple(sorted({tag for pattern, tag in patterns} | set(keywords.values())))
+tag_codes = {tag: code for code, tag in enumerate(tag_names)}
+
+
+def lex_chunk(chunk, offset):
+    # lexes a chunk in a worker process, returning the tags as a byte each
+    # and the positions as an array, since they are sent back as flat bytes
+    # rather than an object for each token
+    generated_tags = set()
+    try:
+        tokens = tokenize(chunk, generated_tags)
+    except Exception:
+        return None
+    tokens.pop()
+    codes = bytes([tag_codes[token.tag] for token in tokens])
+    values = [token.value for token in tokens]
+    positions = array.array("q", [token.position + offset for token in tokens])
+    return codes, values, positions, generated_tags
+
+
 def test_simple_tokens():
     print("testing simple tokens...")
     examples = ".,[,],+,-,*,/,^,(,),{,},;,:,!,&&,||,<,>,<=,>=,==,!=,=,%".split(",")
@@ -254,6 +915,23 @@ def test_keywords():
         assert "value" not in t
 
 
+def test_keyword_prefixes():
+    print("testing words that start with keywords...")
+    for s in ["iffy", "format", "android", "orange", "nothing", "trueish", "nullable", "printer", "x_if"]:
+        t = tokenize(s)
+        assert len(t) == 2
+        assert t[0]["tag"] == "identifier", f"expected identifier, got {t[0]}"
+        assert t[0]["value"] == s
+    assert [t["tag"] for t in tokenize("if iffy")] == ["if", "identifier", None]
+
+
+def test_identifier_interning():
+    print("testing identifier interning...")
+    t = tokenize("alpha_" + "beta + alpha_" + "beta")
+    assert t[0]["value"] is t[2]["value"]
+    assert t[0]["value"] is sys.intern("alpha_beta")
+
+
 def test_comments():
     print("testing comments...")
     assert verify_same_tokens("//comment", "\n")
@@ -274,10 +952,323 @@ def test_error():
         assert "illegal character" in error_string
 
 
+def test_line_index():
+    print("testing line index...")
+    code = "x = 1\ny = 2\n\n  z = 3"
+    lines = LineIndex()
+    tokens = tokenize(code, lines=lines)
+    assert lines.starts == [0, 6, 12, 13]
+    assert [lines.locate(t.position) for t in tokens] == [
+        (1, 1), (1, 3), (1, 5), (2, 1), (2, 3), (2, 5), (4, 3), (4, 5), (4, 7), (4, 8)
+    ]
+    assert lines.describe(tokens[6].position) == "line 4, column 3"
+    # released lines are still counted
+    released = LineIndex(code)
+    released.release(tokens[3].position)
+    assert released.starts == [6, 12, 13] and released.describe(tokens[6].position) == "line 4, column 3"
+    released.release(tokens[7].position)
+    assert released.starts == [13] and released.locate(tokens[9].position) == (4, 8)
+    # the streaming and bytes lexers build the same index
+    for chunk_size in [1, 4, 100]:
+        streamed = LineIndex()
+        list(tokenize_stream(io.StringIO(code), chunk_size=chunk_size, lines=streamed))
+        assert streamed.starts == lines.starts
+    mapped = LineIndex()
+    list(tokenize_bytes(code.encode(), lines=mapped))
+    assert mapped.starts == lines.starts
+    # errors report where they are
+    for lex in [tokenize, tokenize_stream]:
+        try:
+            list(lex("x = 1\n  y = $"))
+            assert False, "Should have a token exception."
+        except Exception as e:
+            assert str(e).endswith("at line 2, column 7"), str(e)
+
+
+def test_token():
+    print("testing token...")
+    t = tokenize("x")[0]
+    assert t.tag == "identifier" and t.value == "x" and t.position == 0
+    assert t["tag"] == "identifier" and t["value"] == "x" and t["position"] == 0
+    assert "tag" in t and "other" not in t
+    assert t == {"tag": "identifier", "value": "x", "position": 0}
+    assert {"tag": "identifier", "value": "x", "position": 0} == t
+    assert t != {"tag": "identifier", "value": "x"}
+    assert t == Token("identifier", "x", 0) and t != Token("identifier", "y", 0)
+    assert repr(t) == repr({"tag": "identifier", "value": "x", "position": 0})
+    try:
+        t["other"]
+        assert False, "Should have a KeyError."
+    except KeyError:
+        pass
+
+
+def test_tokenize_examples():
+    print("testing tokenize on mixed examples...")
+    tokens = tokenize('x = [1, 2.5, .5, 3.] // comment\n y = {"a": true, "b": null}')
+    assert [(t.tag, t.value, t.position) for t in tokens] == [
+        ("identifier", "x", 0), ("=", "=", 2), ("[", "[", 4), ("number", 1, 5), (",", ",", 6),
+        ("number", 2.5, 8), (",", ",", 11), ("number", 0.5, 13), (",", ",", 15), ("number", 3.0, 17),
+        ("]", "]", 19), ("identifier", "y", 33), ("=", "=", 35), ("{", "{", 37), ("string", "a", 38),
+        (":", ":", 41), ("boolean", True, 43), (",", ",", 47), ("string", "b", 49), (":", ":", 52),
+        ("null", "null", 54), ("}", "}", 58), (None, None, 59),
+    ]
+    tokens = tokenize('"an embedded "" quote" <= >= == != < > = ! && || ^ %')
+    assert tokens[0].value == 'an embedded " quote'
+    assert [t.tag for t in tokens[1:]] == ["<=", ">=", "==", "!=", "<", ">", "=", "!", "&&", "||", "^", "%", None]
+    # keywords are whole words
+    tokens = tokenize("assert import external input for and or iffy format \n\t  ")
+    assert [(t.tag, t.value) for t in tokens] == [
+        ("assert", "assert"), ("import", "import"), ("external", "external"), ("input", "input"),
+        ("for", "for"), ("&&", "and"), ("||", "or"), ("identifier", "iffy"), ("identifier", "format"),
+        (None, None),
+    ]
+    assert tokenize("") == [{"tag": None, "value": None, "position": 0}]
+    for example in ["$", "1 + $"]:
+        try:
+            tokenize(example)
+            assert False, "Should have a token exception."
+        except Exception as e:
+            assert "illegal character" in str(e)
+
+
+def test_tokenize_stream():
+    print("testing tokenize_stream...")
+    examples = [
+        "",
+        "1+2",
+        "x = 12.5 + .5 * 3. // comment\n y = xyz <= 10 && z != 1",
+        '"a long string with "" an embedded quote" + "" + "x"',
+        'print "line one\nline two"; while (x >= 1) { x = x - 1 }\n',
+    ]
+    for example in examples:
+        assert list(tokenize_stream(example)) == tokenize(example)
+        # small chunks split tokens, strings and comments across reads
+        for chunk_size in [1, 2, 3, 7]:
+            t = list(tokenize_stream(io.StringIO(example), chunk_size=chunk_size))
+            assert t == tokenize(example), f"mismatch for {[example]} at chunk size {chunk_size}"
+    for example in ["1 + $", '"unterminated']:
+        try:
+            list(tokenize_stream(io.StringIO(example), chunk_size=2))
+            assert False, "Should have a token exception."
+        except Exception as e:
+            assert "illegal character" in str(e)
+
+
+def test_tokenize_file():
+    print("testing tokenize_file...")
+    examples = [
+        "",
+        "x = 12.5 + .5 * 3. // comment\n y = xyz <= 10 && z != 1 or not iffy",
+        'print "a string with "" a quote"; if (true) { exit null } else { assert false }',
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "example.t")
+        for example in examples:
+            with open(path, "w") as f:
+                f.write(example)
+            assert list(tokenize_file(path)) == tokenize(example)
+            assert list(tokenize_bytes(example.encode())) == tokenize(example)
+
+        # sources that aren't ASCII lex as text does, with the same positions
+        for example in [
+            'x = "caf\u00e9"; y',
+            "x\u00a0= 1;\nprint x",
+            "x = \u0663\u0664 + 1\u0662 // \u00e9\n\u2028y",
+        ]:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(example)
+            assert list(tokenize_file(path)) == list(tokenize_bytes(example.encode())) == tokenize(example), example
+        lines = LineIndex()
+        list(tokenize_bytes('a\n"\u00e9"\nb'.encode(), lines=lines))
+        assert lines.starts == [0, 2, 6]
+        try:
+            list(tokenize_bytes("x = 1\n  \u00e9 \u20ac".encode()))
+            assert False, "Should have a token exception."
+        except Exception as e:
+            assert str(e).endswith("illegal character : ['\u00e9'] at line 2, column 3"), str(e)
+
+        # and ASCII lexes as text does, including the separators \x1c-\x1f
+        def lexed(lex, example):
+            try:
+                return list(lex(example))
+            except Exception as e:
+                return str(e)
+
+        for code in range(128):
+            example = f"x{chr(code)}{chr(code)}1 \"{chr(code)}\""
+            assert lexed(tokenize_bytes, example.encode()) == lexed(tokenize, example), code
+
+        with open(path, "w") as f:
+            f.write("x = 1 $")
+        try:
+            list(tokenize_file(path))
+            assert False, "Should have a token exception."
+        except Exception as e:
+            assert "illegal character : ['$']" in str(e)
+
+
+def test_token_buffer():
+    print("testing TokenBuffer...")
+
+    def check_edits(code, edits, block_size):
+        # edits, each made by a function of the source so far, give the same
+        # source, tokens and replaced range as retokenize()
+        tokens = tokenize(code)
+        buffer = TokenBuffer(code, block_size=block_size)
+        for edit in edits:
+            offset, deleted_length, inserted_text = edit(code)
+            try:
+                code, *expected = retokenize(code, tokens, offset, deleted_length, inserted_text)
+            except Exception as e:
+                expected = str(e)
+            try:
+                result = list(buffer.edit(offset, deleted_length, inserted_text))
+            except Exception as e:
+                result = str(e)
+            assert result == expected, (code, offset, deleted_length, inserted_text, block_size)
+            assert buffer.source() == code and buffer.tokens() == tokens, (code, block_size)
+
+    # random edits, with blocks small enough that tokens and edits cross them
+    random = __import__("random").Random(2)
+    pieces = ['"', '""', " ", "\n", "/", "//", "ab", "if", "1", ".", "=", "<", "x", "&&", "&", "$"]
+
+    def random_edit(code):
+        offset = random.randint(0, len(code))
+        deleted_length = random.randint(0, min(3, len(code) - offset))
+        return offset, deleted_length, "".join(random.choice(pieces) for _ in range(random.randint(0, 3)))
+
+    for block_size in [1, 3, 8, 64]:
+        for _ in range(300):
+            code = "".join(random.choice(pieces[:-1]) for _ in range(random.randint(0, 30)))
+            try:
+                tokenize(code)
+            except Exception:
+                continue
+            check_edits(code, [random_edit] * 5, block_size)
+
+    # strings that run on through many blocks, opened and closed again
+    code = "a = 1;\n" * 10_000
+    edits = [(69_990, 0, '"x"'), (7, 0, '"'), (8, 0, '""'), (7, 3, ""), (7, 0, "// "), (0, 10, "")]
+    check_edits(code, [lambda code, edit=edit: edit for edit in edits], 256)
+
+    # an edit only replaces the blocks around it
+    buffer = TokenBuffer(code, block_size=256)
+    blocks = list(buffer.blocks)
+    buffer.edit(35_001, 1, "  42")
+    assert buffer.tokens() == tokenize(code[:35_001] + "  42" + code[35_002:])
+    changed = [i for i, block in enumerate(buffer.blocks) if block is not blocks[i]]
+    assert len(buffer.blocks) == len(blocks) and len(changed) <= 2
+
+
+def test_tokenize_parallel():
+    print("testing tokenize_parallel...")
+    examples = [
+        "",
+        "x = 1\ny = 2\n",
+        'x = "a string\nacross lines // not a comment\n"\n// a comment "with a quote\ny = x + 1\n',
+        'print "one "" quote\n"; z = 3.5 // done\n\n\nwhile (z > 0) { z = z - 1 }',
+    ]
+    for example in examples:
+        for chunk_size in [1, 2, 5, 100]:
+            # the chunks lexed in this process, and in a pool if there are the cores for one
+            t = lex_chunks(example, chunk_offsets(example, chunk_size), map)
+            assert t == tokenize(example), f"mismatch for {[example]} at chunk size {chunk_size}"
+            t = tokenize_parallel(example, processes=2, chunk_size=chunk_size, min_size=0)
+            assert t == tokenize(example), f"mismatch for {[example]} at chunk size {chunk_size}"
+    # chunks only start at newlines outside of strings and comments
+    example = 'a\n"b\nc"\n// d\ne\n'
+    assert chunk_offsets(example, 1) == [0, 2, 8, 13]
+    assert all(example[offset - 1] == "\n" for offset in chunk_offsets(example, 1)[1:])
+
+    # identifiers are interned and line starts are recorded
+    code = "abc = 1\nabc = abc\n"
+    lines = LineIndex()
+    t = lex_chunks(code, chunk_offsets(code, 1), map, lines=lines)
+    assert t[5]["value"] is sys.intern("abc")
+    assert lines.starts == [0, 8, 18]
+
+    # errors are the same as the sequential ones
+    code = "x = 1\ny = 2\nz = $\n"
+    for lex in [
+        lambda: lex_chunks(code, chunk_offsets(code, 1), map, lines=LineIndex()),
+        lambda: tokenize_parallel(code, processes=2, chunk_size=1, min_size=0),
+    ]:
+        try:
+            lex()
+            assert False, "Should have a token exception."
+        except Exception as e:
+            assert str(e) == "Syntax error: illegal character : ['$'] at line 3, column 5", str(e)
+
+    # small sources, or a single core, are lexed sequentially
+    assert tokenize_parallel("x = 1", processes=1, min_size=0) == tokenize("x = 1")
+    assert tokenize_parallel("x = 1", processes=2) == tokenize("x = 1")
+
+
+def check_retokenize(characters, offset, deleted_length, inserted_text):
+    tokens = tokenize(characters)
+    edited = characters[:offset] + inserted_text + characters[offset + deleted_length :]
+    try:
+        expected = tokenize(edited)
+    except Exception as e:
+        expected = str(e)
+    try:
+        result, start, old_stop, new_stop = retokenize(characters, tokens, offset, deleted_length, inserted_text)
+        assert result == edited
+    except Exception as e:
+        tokens = str(e)
+    assert tokens == expected, f"mismatch editing {[characters]} at {offset}, -{deleted_length}, +{[inserted_text]}"
+
+
+def test_retokenize():
+    print("testing retokenize...")
+    code = 'x = 1; // a comment\ny = "a string"; z = x + y'
+    for offset in range(len(code) + 1):
+        for inserted_text in ["", "1", "ab", '"', '""', "//", "\n", " ", "<", "=", "."]:
+            for deleted_length in [0, 1, 3]:
+                if offset + deleted_length <= len(code):
+                    check_retokenize(code, offset, deleted_length, inserted_text)
+
+    # only the damaged region is re-lexed
+    code = "a = 1;\n" * 100
+    tokens = tokenize(code)
+    first = tokens[0]
+    last = tokens[-2]
+    result, start, old_stop, new_stop = retokenize(code, tokens, 354, 1, "42")
+    assert tokens == tokenize(result)
+    assert (start, old_stop, new_stop) == (201, 203, 203)
+    assert tokens[0] is first and tokens[-2] is last
+
+    # editing inside a string literal or a comment
+    code = 'x = "a string"; y = 2 // a comment\nz = 3'
+    check_retokenize(code, 7, 1, "")
+    check_retokenize(code, 7, 0, "n embedded "" quote in a")
+    check_retokenize(code, 13, 1, "")  # remove the closing quote
+    check_retokenize(code, 29, 0, "z = ")
+    check_retokenize(code, 34, 1, " ")  # join the comment with the next line
+    check_retokenize(code, 22, 0, "//")  # comment out the rest of a line
+
+    # random edits match tokenizing from scratch
+    random = __import__("random").Random(1)
+    pieces = ['"', '""', " ", "\n", "/", "//", "ab", "if", "1", ".", "=", "<", "x", "&&", "&"]
+    for _ in range(2000):
+        code = "".join(random.choice(pieces) for _ in range(random.randint(0, 10)))
+        try:
+            tokenize(code)
+        except Exception:
+            continue
+        offset = random.randint(0, len(code))
+        deleted_length = random.randint(0, len(code) - offset)
+        inserted_text = "".join(random.choice(pieces) for _ in range(random.randint(0, 3)))
+        check_retokenize(code, offset, deleted_length, inserted_text)
+
+
 def test_tag_coverage():
     print("testing tag coverage...")
     for pattern, tag in patterns:
         assert tag in test_generated_tags, f"Tag [ {tag} ] was not tested."
+    for keyword, tag in keywords.items():
+        assert tag in test_generated_tags, f"Tag [ {tag} ] was not tested."
 
 
 if __name__ == "__main__":
@@ -290,7 +1281,17 @@ if __name__ == "__main__":
     test_whitespace()
     test_multiple_tokens()
     test_keywords()
+    test_keyword_prefixes()
+    test_identifier_interning()
     test_comments()
     test_error()
+    test_line_index()
+    test_token()
+    test_tokenize_examples()
+    test_tokenize_stream()
+    test_tokenize_file()
+    test_retokenize()
+    test_token_buffer()
+    test_tokenize_parallel()
     test_tag_coverage()
     print("done.")
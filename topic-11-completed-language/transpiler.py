@@ -0,0 +1,871 @@
+import hashlib
+import marshal
+import math
+import os
+
+from tokenizer import LineIndex, map_file, tokenize
+from parser import parse, run_steps
+from nodes import compiled, compiled_forms
+from evaluator import (
+    __builtin_functions as builtin_functions,
+    ast_to_string,
+    binary_operations,
+    copy_constant,
+    evaluate as tree_evaluate,
+    evaluate_builtin_function,
+    evaluate_statements,
+    evaluate_steps,
+    index_operation,
+    invalid_assignment_target,
+    is_truthy,
+    unary_operations,
+)
+from cache import decode, interpreter_version, parse_file, write_cache
+import contextlib
+import io
+
+# PYTHON TRANSPILER
+
+# transpile() translates a program into Python source: while and if become
+# Python while and if, each function body a def, and the variables of each
+# scope Python locals. CPython then compiles the source to its own bytecode,
+# which run_file() caches by a hash of the script.
+#
+# Trivial scoping is dynamic: a name is looked up in the environment of the
+# running function, then of its caller, and so on. But an environment is only
+# ever assigned to by its own function, so while a function runs, every name
+# it doesn't assign keeps the value it had when the function was called. So
+# each def looks its names up once, when it starts, and keeps them in Python
+# locals. Assignments also write to the environment dict, where the functions
+# it calls look them up. A name that may not be assigned yet is checked for
+# _missing when read, which looks it up again to raise the same error as
+# evaluate().
+#
+# Operators do arithmetic on numbers inline, and leave other types, and
+# errors, to the evaluator's operator templates, as the bytecode VM does.
+
+# how deeply statements, and expressions within a statement, nest before the
+# rest of the subtree is run by the explicit-stack evaluator, within the
+# limits of CPython's parser and compiler. A def that has such a subtree
+# keeps its variables in the environment dict instead of Python locals,
+# since the evaluator assigns to the dict.
+statement_depth_limit = 40
+expression_depth_limit = 30
+# CPython allows at most 20 nested loops in a function
+loop_depth_limit = 15
+
+# a call made with more than this many transpiled calls already running runs
+# its function with the explicit-stack evaluator, so deep recursion doesn't
+# overflow Python's stack (each call adds two frames)
+call_budget = 250
+calls = 0
+
+number_types = (int, float)
+
+python_operators = {
+    "+": "+",
+    "-": "-",
+    "*": "*",
+    "/": "/",
+    "^": "**",
+    "<": "<",
+    ">": ">",
+    "<=": "<=",
+    ">=": ">=",
+}
+
+
+class Missing:
+    """
+    The value of a Python local for a name that isn't defined, or is a
+    builtin, when the def starts.
+    """
+
+    def __repr__(self):
+        return "<missing>"
+
+
+missing = Missing()
+
+
+class Module:
+    """
+    A program being translated: the Python source of its defs, and the
+    constants, like function nodes, that the source refers to as _c[k].
+    """
+
+    def __init__(self):
+        self.constants = []
+        self.constant_indexes = {}
+        self.lines = []
+        self.statements = []  # the names of the defs of the top-level statements
+        self.functions = []  # (constant index of the body, name of its def)
+        self.bodies = []  # the function bodies still to translate
+        # the constant index of a [count] list that counts the calls of the
+        # body at the constant index count_calls, or the iterations of
+        # top-level while loops if count_iterations is set
+        self.counter = None
+        self.count_calls = None
+        self.count_iterations = False
+
+    def constant(self, value):
+        # nodes are pooled by identity
+        if id(value) not in self.constant_indexes:
+            self.constant_indexes[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_indexes[id(value)]
+
+    def function(self, ast):
+        # the constant index of the function node, queueing its body
+        body = self.constant(ast.body)
+        if not any(index == body for index, _ in self.functions) and body not in self.bodies:
+            self.bodies.append(body)
+        return self.constant(ast)
+
+    def source(self):
+        while self.bodies:
+            body = self.bodies.pop(0)
+            name = f"function_{body}"
+            self.functions.append((body, name))
+            lines = translate_def(name, program_statements(self.constants[body]), self, top_level=False)
+            if body == self.count_calls:
+                lines.insert(1, f"    _c[{self.counter}][0] += 1")
+            self.lines += lines
+        lines = self.lines + [
+            f"statements = [{', '.join(self.statements)}]",
+            f"functions = [{', '.join(f'({body}, {name})' for body, name in self.functions)}]",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class Frame:
+    """
+    The state of translating one def: the names it reads, the names that
+    are certainly assigned at the current point, and its lines.
+    """
+
+    def __init__(self, module, top_level, in_environment):
+        self.module = module
+        self.top_level = top_level
+        self.in_environment = in_environment  # variables are kept in the environment dict only
+        self.lines = []
+        self.read = []  # names whose Python locals are set when the def starts
+        self.assigned = set()
+        self.temporaries = 0
+        self.evaluated = False  # whether a subtree is left to the evaluator
+
+    def temporary(self):
+        self.temporaries += 1
+        return f"t{self.temporaries}"
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+
+def transpile(ast):
+    """
+    Translates a program, or a single statement, into the Python source of a
+    module. Its statements list holds one def, which takes an environment
+    and returns (value, exit_status) as evaluate(ast, environment) would.
+    """
+    return translate([program_statements(ast)]).source()
+
+
+def program_statements(ast):
+    return ast.statements if ast.tag in ["program", "statement_list"] else [ast]
+
+
+def translate(entries):
+    # a Module with a def for each list of top-level statements in entries
+    module = Module()
+    for index, statements in enumerate(entries):
+        name = f"statement_{index}"
+        module.statements.append(name)
+        module.lines += translate_def(name, statements, module, top_level=True)
+    return module
+
+
+def translate_def(name, statements, module, top_level):
+    # translates with Python locals, unless part of it is left to the evaluator
+    frame = translate_frame(statements, module, top_level, in_environment=False)
+    if frame.evaluated:
+        frame = translate_frame(statements, module, top_level, in_environment=True)
+    lines = [f"def {name}(env):"]
+    if frame.read:
+        names = ", ".join(python_name(name) for name in frame.read)
+        lines.append(f"    {names}, = _find_all(env, {tuple(frame.read)!r})")
+    if top_level:
+        lines.append("    result = (None, None)")
+    lines += frame.lines
+    lines.append("    return result" if top_level else "    return None")
+    return lines + [""]
+
+
+def translate_frame(statements, module, top_level, in_environment):
+    frame = Frame(module, top_level, in_environment)
+    for statement in statements:
+        translate_statement(statement, frame, 1, 0, 0, top_level=top_level)
+    return frame
+
+
+def python_name(name):
+    # Trivial names are prefixed, so they can't clash with Python keywords or
+    # the helpers, and so are the evaluator's $ names, like $left
+    return "p_" + name[1:] if name.startswith("$") else "v_" + name
+
+
+def translate_block(ast, frame, indent, depth, loops):
+    count = len(frame.lines)
+    translate_statement(ast, frame, indent, depth, loops)
+    if len(frame.lines) == count:
+        frame.emit(indent, "pass")
+
+
+def translate_statement(ast, frame, indent, depth, loops, top_level=False):
+    tag = ast.tag
+    if depth > statement_depth_limit or tag == "while" and loops >= loop_depth_limit:
+        frame.evaluated = True
+        result = frame.temporary()
+        frame.emit(indent, f"{result} = _steps(env, _c[{frame.module.constant(ast)}])")
+        frame.emit(indent, f"if {result}[1]:")
+        frame.emit(indent + 1, f"return {result}" if frame.top_level else f"return {result}[0]")
+    elif tag == "if":
+        translate_if(ast, frame, indent, depth, loops)
+    elif tag == "while":
+        condition = translate_expression(ast.condition, frame, 0)[0]
+        frame.emit(indent, f"while {condition}:")
+        if top_level and frame.module.count_iterations:
+            frame.emit(indent + 1, f"_c[{frame.module.counter}][0] += 1")
+        assigned = set(frame.assigned)
+        translate_block(ast.do, frame, indent + 1, depth + 1, loops + 1)
+        frame.assigned = assigned
+    elif tag in ["statement_list", "program"]:
+        for statement in ast.statements:
+            translate_statement(statement, frame, indent, depth + 1, loops, top_level)
+    elif tag == "return":
+        value = translate_expression(ast.value, frame, 0)[0] if hasattr(ast, "value") else "None"
+        frame.emit(indent, f"return ({value}, 'return')" if frame.top_level else f"return {value}")
+    elif tag == "assign" and ast.target.tag == "identifier" and not frame.in_environment:
+        name = ast.target.value
+        value = translate_expression(ast.value, frame, 0)[0]
+        frame.emit(indent, f"{python_name(name)} = env[{name!r}] = {value}")
+        frame.assigned.add(name)
+        if top_level:
+            frame.emit(indent, f"result = ({python_name(name)}, None)")
+    elif top_level and tag == "call":
+        function, arguments = translate_call(ast, frame, 0)
+        frame.emit(indent, f"result = _call_statement({function}, [{arguments}], env)")
+    else:
+        value = translate_expression(ast, frame, 0)[0]
+        if top_level:
+            exit_status = False if tag in ["function", "complex"] else None
+            frame.emit(indent, f"result = ({value}, {exit_status})")
+        else:
+            frame.emit(indent, value)
+    if top_level and tag in ["if", "while"]:
+        frame.emit(indent, "result = (None, False)")
+
+
+def translate_if(ast, frame, indent, depth, loops):
+    # else if chains become elif, so they don't nest the Python source
+    keyword = "if"
+    branches = []  # the names certainly assigned at the end of each branch
+    while True:
+        condition = translate_expression(ast.condition, frame, 0)[0]
+        frame.emit(indent, f"{keyword} {condition}:")
+        reached = set(frame.assigned)
+        translate_block(ast.then, frame, indent + 1, depth + 1, loops)
+        branches.append(frame.assigned)
+        frame.assigned = set(reached)
+        if not hasattr(ast, "else"):
+            branches.append(reached)
+            break
+        otherwise = getattr(ast, "else")
+        if otherwise.tag == "statement_list" and len(otherwise.statements) == 1:
+            otherwise = otherwise.statements[0]
+        depth += 1
+        if otherwise.tag == "if" and depth <= statement_depth_limit:
+            keyword = "elif"
+            ast = otherwise
+            continue
+        frame.emit(indent, "else:")
+        translate_block(getattr(ast, "else"), frame, indent + 1, depth, loops)
+        branches.append(frame.assigned)
+        break
+    frame.assigned = set.intersection(*branches)
+
+
+def translate_expression(ast, frame, depth):
+    """
+    Returns the Python source of an expression, and its kind: "number" or
+    "literal" for a constant, "local" for a Python local that is certainly
+    assigned, or None. Sources other than names and constants are in
+    parentheses.
+    """
+    tag = ast.tag
+    depth = depth + 1
+    module = frame.module
+    if depth > expression_depth_limit or tag in ["if", "while", "statement_list", "program", "return"]:
+        # including a statement where an expression was expected, whose return
+        # doesn't return from the function
+        frame.evaluated = True
+        return f"_steps(env, _c[{module.constant(ast)}])[0]", None
+    if tag in ["number", "boolean", "string"]:
+        value = ast.value
+        types = {"number": [float, int], "string": [str]}.get(tag)
+        if types is not None and type(value) not in types or tag == "boolean" and value not in [True, False]:
+            # raise the error when the node runs, as evaluate() does
+            return f"_literal_error(_c[{module.constant(ast)}])", None
+        if tag != "number":
+            return repr(value), "literal"
+        if not math.isfinite(value):
+            return f"_c[{module.constant(ast)}].value", "number"
+        return f"({value!r})" if value < 0 else repr(value), "number"
+    if tag == "null":
+        return "None", "literal"
+    if tag == "identifier":
+        return translate_name(ast.value, frame)
+    if tag == "list":
+        return "[" + ", ".join(translate_expression(item, frame, depth)[0] for item in ast.items) + "]", None
+    if tag == "object":
+        items = []
+        for item in ast.items:
+            key = translate_expression(item["key"], frame, depth)[0]
+            value = translate_expression(item["value"], frame, depth)[0]
+            items.append(f"_key({key}): {value}")
+        return "{" + ", ".join(items) + "}", None
+    if tag == "constant":
+        return f"_copy(_c[{module.constant(ast)}])", None
+    if tag == "function":
+        # function values are dicts, which the language treats as objects
+        return f"_c[{module.function(ast)}].as_dict()", None
+    if tag == "call":
+        function, arguments = translate_call(ast, frame, depth)
+        return f"_call({function}, [{arguments}], env)", None
+    if tag == "complex":
+        base = translate_expression(ast.base, frame, depth)[0]
+        index = translate_expression(ast.index, frame, depth)[0]
+        return f"_index({base}, {index})", None
+    if tag in python_operators:
+        left = translate_expression(ast.left, frame, depth)
+        right = translate_expression(ast.right, frame, depth)
+        return translate_arithmetic(tag, left, right, frame), None
+    if tag in ["==", "!="]:
+        left = translate_expression(ast.left, frame, depth)[0]
+        right = translate_expression(ast.right, frame, depth)[0]
+        return f"({left} {tag} {right})", None
+    if tag in ["&&", "||"]:
+        # both sides are evaluated, as in evaluate()
+        left = translate_expression(ast.left, frame, depth)[0]
+        right = translate_expression(ast.right, frame, depth)[0]
+        return f"(_truthy({left}) {'&' if tag == '&&' else '|'} _truthy({right}))", None
+    if tag == "negate":
+        value, kind = translate_expression(ast.value, frame, depth)
+        if kind == "number":
+            return f"(-{value})", None
+        if kind == "local":
+            return f"(-{value} if type({value}) in _number else _negate({value}))", None
+        temporary = frame.temporary()
+        return f"(-{temporary} if type({temporary} := {value}) in _number else _negate({temporary}))", None
+    if tag in ["not", "!"]:
+        return f"(not _truthy({translate_expression(ast.value, frame, depth)[0]}))", None
+    if tag == "print":
+        if not ast.value:
+            return "_print_line()", None
+        return f"_print({translate_expression(ast.value, frame, depth)[0]})", None
+    if tag == "assert":
+        if not ast.condition:
+            return "'\\n'", "literal"
+        condition = translate_expression(ast.condition, frame, depth)[0]
+        return f"_assert({condition}, _c[{module.constant(ast.condition)}])", None
+    if tag == "assign":
+        return translate_assign(ast, frame, depth), None
+    return f"_unknown({tag!r})", None
+
+
+def translate_name(name, frame):
+    if frame.in_environment:
+        return f"_lookup(env, {name!r})", None
+    local = python_name(name)
+    if name in frame.assigned:
+        return local, "local"
+    if name not in frame.read:
+        frame.read.append(name)
+    return f"({local} if {local} is not _missing else _lookup(env, {name!r}))", None
+
+
+def translate_call(ast, frame, depth):
+    function = translate_expression(ast.function, frame, depth)[0]
+    arguments = ", ".join(translate_expression(argument, frame, depth)[0] for argument in ast.arguments)
+    return function, arguments
+
+
+def translate_arithmetic(tag, left, right, frame):
+    # numbers are added, compared and so on inline, and other types are left
+    # to the evaluator. Operands other than constants and names go in
+    # temporaries, so they are evaluated once and in order.
+    (left, left_kind), (right, right_kind) = left, right
+    # division by zero is an assertion in evaluate()
+    check_divisor = tag == "/" and not (right_kind == "number" and float(right.strip("()")) != 0)
+    if "literal" in [left_kind, right_kind]:
+        return f"_operate({tag!r}, {left}, {right})"
+    simple = left_kind is not None and right_kind is not None
+    operands = []
+    checks = []
+    for value, kind in [(left, left_kind), (right, right_kind)]:
+        if kind == "number":
+            operands.append(value)
+            continue
+        if kind == "local" and simple:
+            operands.append(value)
+            checks.append(f"type({value}) in _number")
+            continue
+        temporary = frame.temporary()
+        operands.append(temporary)
+        checks.append(f"type({temporary} := {value}) in _number")
+    left, right = operands
+    condition = " & ".join(f"({check})" for check in checks) if len(checks) > 1 else "".join(checks)
+    if check_divisor:
+        condition = f"{condition} and {right} != 0" if condition else f"{right} != 0"
+    operation = f"{left} {python_operators[tag]} {right}"
+    if not condition:
+        return f"({operation})"
+    return f"({operation} if {condition} else _operate({tag!r}, {left}, {right}))"
+
+
+def translate_assign(ast, frame, depth):
+    target = ast.target
+    if target.tag == "identifier":
+        name = target.value
+        value = translate_expression(ast.value, frame, depth)[0]
+        if frame.in_environment:
+            return f"_set(env, {name!r}, {value})"
+        frame.assigned.add(name)
+        return f"({python_name(name)} := _set(env, {name!r}, {value}))"
+    if target.tag != "complex":
+        return f"_invalid_target(_c[{frame.module.constant(target)}])"
+    base = translate_expression(target.base, frame, depth)[0]
+    if target.index.tag == "string":
+        # direct property (like x.bar)
+        index = repr(target.index.value)
+    else:
+        # evaluated property (like x["bar"])
+        index = translate_expression(target.index, frame, depth)[0]
+    value = translate_expression(ast.value, frame, depth)[0]
+    return f"_set_index(_check_index({base}, {index}), {value})"
+
+
+# RUNTIME HELPERS
+
+# the functions the translated source calls, as _name
+
+
+def find_all(environment, names):
+    # the value of each name, or missing if it isn't defined or is a builtin
+    values = []
+    for name in names:
+        scope = environment
+        while name not in scope and "$parent" in scope:
+            scope = scope["$parent"]
+        values.append(scope.get(name, missing))
+    return values
+
+
+def lookup(environment, name):
+    while name not in environment:
+        if "$parent" not in environment:
+            if name in builtin_functions:
+                return {"tag": "builtin", "name": name}
+            raise Exception(f"Unknown identifier: '{name}'")
+        environment = environment["$parent"]
+    return environment[name]
+
+
+def set_variable(environment, name, value):
+    environment[name] = value
+    return value
+
+
+def operate(tag, left, right):
+    return tree_evaluate(binary_operations[tag], {"$left": left, "$right": right})[0]
+
+
+def negate(value):
+    return tree_evaluate(unary_operations["negate"], {"$value": value})[0]
+
+
+def index(base, index):
+    if type(index) is int and type(base) is list and len(base) > index:
+        return base[index]
+    if type(index) is str and type(base) is dict:
+        return base[index]
+    # None indexes, other types, and errors, are left to evaluate()
+    return tree_evaluate(index_operation, {"$base": base, "$index": index})[0]
+
+
+def check_index(base, index):
+    # the checks evaluate() makes before it evaluates the value
+    assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+    if isinstance(base, list):
+        assert isinstance(index, int), "List index must be integer"
+        assert 0 <= index < len(base), "List index out of range"
+    elif not isinstance(base, dict):
+        assert False, f"Cannot assign to base of type {type(base)}"
+    return base, index
+
+
+def set_index(target, value):
+    base, index = target
+    base[index] = value
+    return value
+
+
+def object_key(key):
+    assert type(key) is str, "Object key must be a string"
+    return key
+
+
+def print_value(value):
+    if value is True:
+        value = "true"
+    elif value is False:
+        value = "false"
+    print(str(value))
+    return str(value) + "\n"
+
+
+def print_line():
+    print()
+    return "\n"
+
+
+def check_assertion(value, condition):
+    if not value:
+        raise Exception("Assertion failed:", ast_to_string(condition))
+    return "\n"
+
+
+def literal_error(ast):
+    assert False, f"unexpected type {type(ast.value)}"
+
+
+def unknown_tag(tag):
+    assert False, f"Unknown tag [{tag}] in AST"
+
+
+def evaluate_subtree(environment, ast):
+    return run_steps(evaluate_steps(ast, environment))
+
+
+def call(function, arguments, environment):
+    if function.get("tag") == "builtin":
+        return evaluate_builtin_function(function["name"], arguments)[0]
+
+    # regular function call:
+    local_environment = {name["value"]: value for name, value in zip(function["parameters"], arguments)}
+    local_environment["$parent"] = environment
+    return call_body(function["body"], local_environment)
+
+
+def call_body(body, local_environment):
+    """
+    Runs a function body in the local environment of a call, and returns the
+    value of the call.
+    """
+    global calls
+    if calls > call_budget:
+        value, exit_status = run_steps(evaluate_steps(body, local_environment))
+        return value if exit_status else None
+    function = compiled(body, "python", compile_function)
+    calls += 1
+    try:
+        return function(local_environment)
+    finally:
+        calls -= 1
+
+
+def compile_function(body, counter=None):
+    """
+    Translates and loads the def of a function body, which then runs every
+    call of it, and returns it. If counter is a [count] list, the def adds
+    each call to it.
+    """
+    module = Module()
+    module.bodies.append(module.constant(body))
+    if counter is not None:
+        module.counter = module.constant(counter)
+        module.count_calls = module.bodies[0]
+    load(compile(module.source(), "<transpiled>", "exec"), module.constants)
+    return compiled_forms(body)["python"]
+
+
+def compile_loop(ast, counter):
+    """
+    Translates and loads a while statement into a def that runs it in an
+    environment, as evaluate() would, adding each iteration to the [count]
+    list counter.
+    """
+    module = Module()
+    module.counter = module.constant(counter)
+    module.count_iterations = True
+    module.statements.append("statement_0")
+    module.lines += translate_def("statement_0", [ast], module, top_level=True)
+    return load(compile(module.source(), "<transpiled>", "exec"), module.constants)[0]
+
+
+def call_statement(function, arguments, environment):
+    # a call as a top-level statement, which also gives its exit status
+    if function.get("tag") == "builtin":
+        return evaluate_builtin_function(function["name"], arguments)
+    return call(function, arguments, environment), False
+
+
+helpers = {
+    "_number": number_types,
+    "_missing": missing,
+    "_find_all": find_all,
+    "_lookup": lookup,
+    "_set": set_variable,
+    "_operate": operate,
+    "_negate": negate,
+    "_index": index,
+    "_check_index": check_index,
+    "_set_index": set_index,
+    "_invalid_target": invalid_assignment_target,
+    "_key": object_key,
+    "_copy": copy_constant,
+    "_truthy": is_truthy,
+    "_print": print_value,
+    "_print_line": print_line,
+    "_assert": check_assertion,
+    "_literal_error": literal_error,
+    "_unknown": unknown_tag,
+    "_steps": evaluate_subtree,
+    "_call": call,
+    "_call_statement": call_statement,
+}
+
+def load(code, constants):
+    """
+    Runs the code object of a translated module, registering the defs of its
+    function bodies, and returns its statements list.
+    """
+    namespace = dict(helpers, _c=constants)
+    exec(code, namespace)
+    for body, function in namespace["functions"]:
+        compiled_forms(constants[body])["python"] = function
+    return namespace["statements"]
+
+
+def transpile_program(ast):
+    # the def of a program, or of a single statement
+    module = translate([program_statements(ast)])
+    return load(compile(module.source(), "<transpiled>", "exec"), module.constants)[0]
+
+
+def evaluate(ast, environment, depth=0):
+    """
+    Translates ast and runs it, as a drop-in replacement for evaluator.evaluate().
+    The translation of a program is kept on it, but a single statement, like
+    each one the stream runner gives, is translated each time it runs.
+    """
+    return compiled(ast, "python", transpile_program)(environment)
+
+
+# TRANSPILED SCRIPT CACHE
+
+# run_file() caches the code object of a translated script in __pycache__
+# next to it, with the constants it refers to, as cache.py does for ASTs.
+# Running the script again then skips parsing and translating it. Loaded
+# scripts are also kept in memory, by the same key.
+
+transpiler_key = None
+
+# cache key -> (code, constants, statement positions, line starts)
+loaded_scripts = {}
+
+
+def transpiler_version():
+    global transpiler_key
+    if transpiler_key is None:
+        digest = hashlib.sha256(interpreter_version())
+        for name in ["transpiler.py", "evaluator.py"]:
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), "rb") as f:
+                digest.update(f.read())
+        transpiler_key = digest.digest()
+    return transpiler_key
+
+
+def transpiled_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, "__pycache__", name + ".transpiled")
+
+
+def run_file(path, environment, use_cache=True):
+    """
+    Runs a script file with the transpiler, as evaluate_program() would,
+    reporting errors with the position of the top-level statement that
+    raised them. The translated script is cached unless use_cache is False.
+    """
+    with map_file(path) as source:
+        digest = hashlib.sha256(transpiler_version())
+        digest.update(source)
+    key = digest.hexdigest()
+    loaded = loaded_scripts.get(key) if use_cache else None
+    if loaded is None and use_cache:
+        loaded = read_transpiled(transpiled_path(path), key)
+    if loaded is None:
+        lines = LineIndex()
+        positions = []
+        ast = parse_file(path, lines, positions, use_cache=use_cache)
+        module = translate([[statement] for statement in ast.statements])
+        code = compile(module.source(), path, "exec")
+        loaded = (code, module.constants, positions, lines.starts)
+        if use_cache:
+            # cache.py encodes the nodes in the constants, and marshal the code object
+            write_cache(transpiled_path(path), key, [code, module.constants], positions, lines)
+    if use_cache:
+        loaded_scripts[key] = loaded
+    code, constants, positions, line_starts = loaded
+    lines = LineIndex()
+    lines.starts[:] = line_starts
+    statements = load(code, constants)
+    return evaluate_statements(zip(statements, positions), environment, lines, run_statement)
+
+
+def run_statement(statement, environment):
+    return statement(environment)
+
+
+def read_transpiled(path, key):
+    # the cached (code, constants, positions, line starts), or None if missing or stale
+    try:
+        with open(path, "rb") as f:
+            cached_key, data, positions, line_starts = marshal.loads(f.read())
+        code, constants = data
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if cached_key != key:
+        return None
+    return code, decode(constants), positions, line_starts
+
+
+def run_program(evaluate_with, source):
+    # the result, environment and output of running source, or the error
+    environment = {}
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        try:
+            value = evaluate_with(parse(tokenize(source)), environment)
+        except Exception as e:
+            # the first line, since pytest adds an explanation to a failed assert's message
+            value = ("error", type(e), str(e).split("\n")[0])
+    return value, environment, output.getvalue()
+
+
+def test_transpile():
+    print("testing transpile...")
+    # the translated program does what evaluate() does, including exit statuses and errors
+    import evaluator
+
+    sources = []
+    for name in ["basic-test.t", "feature-test.t", "../tmp.tc"]:
+        with open(name) as f:
+            sources.append(f.read())
+    sources += [
+        "function f(x) { if (x > 2) { return x } else { return f(x + 1) } }; y = f(0)",
+        "function f() { while (1) { return 3 } }; x = f(); if (0) { y = 1 }; while (0) { }; f",
+        "x = [1, {\"a\": 2}]; x[1].b = !x[0] || 0 && 1; y = -x[0] ^ 2 * 3 / 4 - 5; z = \"a\" * 2 <= \"b\"",
+        "x = {\"a\": [1, 2]}; x.a[1] = 3; x[\"b\"] = x.a; y = x.b[1] + length(x) - 1.5; z = x[null]",
+        "print; print 1 != 2; print true; print [false]; assert 1 == 1; x = length([1]) + head(tail([1, 2]))",
+        "return 1; x = 2",
+        "x = {\"a\": 1} + {\"b\": 2}; y = [1] + [2]; z = \"a\" + \"b\"; w = 2 ^ 0.5 > 1.4 == true",
+        "x = 1; function f() { x = 2; return x }; y = f(); length([1])",
+        "function f() { x = 1 }; y = f(); z = [f(), f][0]; f()",
+        "x = {\"a\": 1, \"a\": 2, \"b\": 3}; y = [[], {}, [1, [2]]]; z = 1 == 1.0; w = \"1\" != 1; [1][-1]",
+        "x = y = 2; z = (x = 3) + x; w = x + (x = 4); function f(a, b) { return [a, b] }; v = f(1)",
+        "function f() { return g() }; function g() { return x }; function h(x) { return f() }; y = h(5)",
+        "function f(n) { if (n) { a = 1 } else { b = 2 }; return [a, b] }; a = 3; b = 4; x = f(1); y = f(0)",
+        "i = 0; while (i < 3) { if (i == 1) { j = i } ; i = i + 1 }; x = j; length = 2; y = length",
+        "x = 10; while (x > 0) { x = x - 3; if (x < 5) { return x } }",
+        "function f(x) { x.a = 1; return x }; y = f({}); z = f({\"b\": 2}).a",
+        "x = 1 + \"a\"", "x = 1 - \"a\"", "x = 1 / 0", "x = -\"a\"", "x = \"a\" < 1", "x = {1: 2}",
+        "assert 1 == 2", "x = [1][2]", "x = [1][0.5]", "y = z", "x = 1; x.y = 2", "x = [1]; x[1] = 2",
+        "x = [1]; x[\"a\"] = 2", "x = [1]; x[true] = 2", "x = 1; x()", "break", "x = \"a\" ^ 2",
+        "x = {}; x[1] = y", "x = [1]; x[0] = 2 / 0", "x = 0; y = 1 / x", "x = true + 1", "x = -true",
+        "function f() { return y }; x = f()", "function f() { y = 1; return z }; z = 2; x = f() + z",
+    ]
+    sources += ["x = [" + ", ".join(map(str, range(40))) + "]; x[0] = 1; y = [" + ", ".join(map(str, range(40))) + "]"]
+    for source in sources:
+        assert run_program(evaluate, source) == run_program(evaluator.evaluate, source), source
+
+    # variables are Python locals, and arithmetic on them is inline
+    source = transpile(parse(tokenize("i = 0; while (i < 10) { i = i + 1 }")))
+    assert "v_i = env['i'] = (v_i + 1 if type(v_i) in _number else _operate('+', v_i, 1))" in source, source
+
+    # deep nesting runs with the explicit-stack evaluator, and so does deep recursion
+    source = "if (x == 0) { y = 0 }" + "".join(f" else if (x == {i}) {{ y = {i} }}" for i in range(1, 2000))
+    environment = {"x": 1999}
+    evaluate(parse(tokenize(source)), environment)
+    assert environment["y"] == 1999
+    source = "function f(n) { if (n == 0) { return 0 }; return 1 + f(n - 1) }; x = f(5000); y = f(10)"
+    environment = {}
+    evaluate(parse(tokenize(source)), environment)
+    assert environment["x"] == 5000 and environment["y"] == 10 and calls == 0
+    for source in [
+        "function f(n) { " + "if (1) { " * 60 + "m = n; return m" + " }" * 60 + " }; x = f(2) + f(3)",
+        "x = 0; i = 0; " + "while (i < 1) { " * 20 + "x = x + 1; i = 1" + " }" * 20,
+        "x = " + "-(" * 100 + "1" + ")" * 100 + "; y = x + 1",
+    ]:
+        assert run_program(evaluate, source) == run_program(evaluator.evaluate, source), source
+
+
+def test_run_file():
+    print("testing run_file...")
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "script.t")
+        with open(path, "w") as f:
+            f.write("function f(x) { return x * 2 };\nx = f(2);\ny = z")
+        environment = {}
+        # the cache is written, and reused when the script is run again
+        for run in range(2):
+            loaded_scripts.clear()
+            try:
+                run_file(path, environment)
+                assert False, "Should be an error."
+            except Exception as e:
+                assert str(e) == "Unknown identifier: 'z' (in statement at line 3, column 1)", e
+            assert environment["x"] == 4 and os.path.exists(transpiled_path(path))
+        # the cached code object is the one run, without parsing
+        with open(transpiled_path(path), "rb") as f:
+            cached_key, (code, constants), positions, line_starts = marshal.loads(f.read())
+        assert positions == [0, 32, 42] and code.co_filename == path
+        # an edited script isn't run from the stale cache
+        with open(path, "w") as f:
+            f.write("x = 3")
+        environment = {}
+        assert run_file(path, environment) == (3, None) and environment["x"] == 3
+
+
+def test_evaluator_tests():
+    print("testing transpile with the evaluator's tests...")
+    import evaluator
+
+    tests = [value for name, value in vars(evaluator).items() if name.startswith("test_")]
+    saved = evaluator.evaluate
+    evaluator.evaluate = evaluate
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for test in tests:
+                test()
+    finally:
+        evaluator.evaluate = saved
+
+
+if __name__ == "__main__":
+    print("testing transpiler.")
+    test_transpile()
+    test_run_file()
+    test_evaluator_tests()
+    print("done.")